@@ -4,43 +4,50 @@ from PIL import Image, ImageTk
 from PIL.Image import Resampling
 import sqlite3
 import json
-from datetime import datetime, timedelta
+from datetime import timedelta
 from tkcalendar import DateEntry
-import threading
+import queue
 import time
 import pygame  # <-- Import pygame for playing MP3
 import os
 from fpdf import FPDF
 import platform
+import secrets
 import subprocess
+import logging
+import med_db
+from med_store import MedicationStore
+from work_executor import TkExecutor
+import perf_metrics
+import med_logging
+from journal_export import write_journal_pdf
+from med_logic import parse_times, every_n_hours
+from scheduler import AlertScheduler
+from facility import FacilityCoordinator, resolve_processes
+from local_api import DashboardServer, is_loopback, resolve_port, resolve_token
+import db_backup
+import db_maintenance
+import date_codec
+from med_views import CardCache
+from alert_pool import AlertWindowPool
+import alert_dashboard
+from alert_dashboard import AlertDashboard
+from alert_timers import AlertTimers
+from dose_calendar import DoseCalendarWindow
+from recurrence import parse_rule, rule_for_dosage
+import refill_forecast
+from refill_forecast import low_stock_messages, running_low
 
 DB_PATH = 'medication_time_db.db'
 SETTINGS_PATH = 'settings.json'
-alerted_today = set()
+log = logging.getLogger("medtime.app")
 
-# ---------- Setup Database Tables ----------
-def setup_tables():
-    conn = sqlite3.connect(DB_PATH)
+# ---------- Sample Data ----------
+def seed_sample_users(db_path):
+    """Add the sample user to an empty database; returns True if it did (MedicationStore migrates the schema)"""
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            first_name TEXT,
-            last_name TEXT,
-            medication_data TEXT
-        )
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_journals (
-            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            date TEXT,
-            journal_text TEXT
-        )
-    ''')
-
     # Sample users (if empty)
     c.execute("SELECT COUNT(*) FROM users")
     if c.fetchone()[0] == 0:
@@ -58,9 +65,13 @@ def setup_tables():
         for first, last, meds in sample_users:
             c.execute('INSERT INTO users (first_name, last_name, medication_data) VALUES (?, ?, ?);',
                       (first, last, meds))
+        seeded = True
+    else:
+        seeded = False
 
     conn.commit()
     conn.close()
+    return seeded
 
 # ---------- Settings Management ----------
 def load_settings():
@@ -84,81 +95,9 @@ def play_alert_sound():
             pygame.mixer.music.load("MedicationTime.mp3")
             pygame.mixer.music.play()
         else:
-            print("MedicationTime.mp3 file not found.")
-    except Exception as e:
-        print("Error playing sound:", e)
-
-# ---------- Helper Functions for Extended Dosage Logic ----------
-def should_alert_today(med, current_date):
-    """
-    Determine if medication should alert today based on dosage frequency
-    """
-    dosage = med.get("dosage_instructions", "once per day")
-    prescribed_date_str = med.get("date_prescribed")
-    
-    if not prescribed_date_str:
-        return True  # Default to daily if no start date
-    
-    try:
-        # Parse prescribed date - handle both YYYY-MM-DD and MM-DD-YYYY formats
-        if len(prescribed_date_str) == 10 and prescribed_date_str.count('-') == 2:
-            parts = prescribed_date_str.split('-')
-            if len(parts[0]) == 4 and parts[0].isdigit():
-                # YYYY-MM-DD format
-                prescribed_date = datetime.strptime(prescribed_date_str, "%Y-%m-%d").date()
-            else:
-                # MM-DD-YYYY format
-                prescribed_date = datetime.strptime(prescribed_date_str, "%m-%d-%Y").date()
-        else:
-            # Fallback to MM-DD-YYYY format
-            prescribed_date = datetime.strptime(prescribed_date_str, "%m-%d-%Y").date()
+            log.warning("MedicationTime.mp3 file not found.")
     except Exception as e:
-        print(f"[DEBUG] Error parsing prescribed date '{prescribed_date_str}': {e}")
-        return True  # Default to daily if date parsing fails
-    
-    days_since_prescribed = (current_date - prescribed_date).days
-    
-    # Only process medications that have started (prescribed date <= current date)
-    if days_since_prescribed < 0:
-        print(f"[DEBUG] Medication not yet started: prescribed {prescribed_date}, current {current_date}")
-        return False
-    
-    if dosage in ["once per day", "twice daily", "three times daily"]:
-        return True  # Daily medications
-    elif dosage == "every other day":
-        # Alert on prescribed date and every other day after
-        should_alert = days_since_prescribed % 2 == 0
-        print(f"[DEBUG] Every other day check: {days_since_prescribed} days since prescribed, should alert: {should_alert}")
-        return should_alert
-    elif dosage == "once per week":
-        # Alert on prescribed date and every 7 days after
-        should_alert = days_since_prescribed % 7 == 0
-        print(f"[DEBUG] Once per week check: {days_since_prescribed} days since prescribed, should alert: {should_alert}")
-        return should_alert
-    elif dosage == "once per month":
-        # Alert on the same day of month as prescribed date
-        should_alert = current_date.day == prescribed_date.day
-        print(f"[DEBUG] Once per month check: prescribed day {prescribed_date.day}, current day {current_date.day}, should alert: {should_alert}")
-        return should_alert
-    
-    return True  # Default to daily for unknown dosage instructions
-
-def calculate_days_supply(stock, dosage_instructions, scheduled_times):
-    """
-    Calculate days of supply based on dosage instructions
-    """
-    doses_per_day = len(scheduled_times) if scheduled_times else 1
-    
-    if dosage_instructions == "every other day":
-        return (stock * 2) // doses_per_day if doses_per_day > 0 else 0
-    elif dosage_instructions == "once per week":
-        return (stock * 7) // doses_per_day if doses_per_day > 0 else 0
-    elif dosage_instructions == "once per month":
-        return (stock * 30) // doses_per_day if doses_per_day > 0 else 0
-    else:
-        # Daily medications
-        return stock // doses_per_day if doses_per_day > 0 else 0
-
+        log.error("Error playing sound: %s", e)
 
 class MedicationApp:
     def __init__(self, root):
@@ -170,7 +109,15 @@ class MedicationApp:
             # Add this line to track active alert windows
             self.active_alert_count = 0
             # ✅ NEW: Track active alerts per user to prevent multiple alerts per user
-            self.active_user_alerts = {}  # {user_id: alert_window}
+            self.active_user_alerts = {}  # {user_id: AlertWindow}
+            # ✅ NEW: Pre-built, hidden alert windows (built once the main window is idle)
+            self.alert_pool = AlertWindowPool(self.root)
+            self.root.after_idle(self.alert_pool.prewarm)
+            # ✅ NEW: One household-wide list when several people are due at once
+            self.alert_dashboard = AlertDashboard(self.root, self._apply_dashboard_doses,
+                                                  self._dismiss_dashboard_doses, self._snooze_dashboard_doses)
+            # ✅ NEW: Snooze and escalation timers, polled from the Tk loop
+            self.alert_timers = AlertTimers.from_settings(settings, self._resound_alert, self._notify_caregiver)
 
             # Load and resize background image
             if os.path.exists("background.jpg"):
@@ -188,13 +135,42 @@ class MedicationApp:
             main_frame.place(relx=0.5, rely=0.02, anchor='n')
             
             self.db_path = DB_PATH
+            # ✅ NEW: Cached, write-through user/medication data (reloads only when the DB changes)
+            # ✅ NEW: The store runs the versioned schema migrations (one version check when current)
+            self.store = MedicationStore(self.db_path, migration_progress=lambda step, done, total:
+                                         log.info("%s: %d/%d rows", step, done, total))
+            if seed_sample_users(self.db_path):
+                self.store.refresh(force=True)
+            # ✅ NEW: Database/CPU work runs off the Tk thread; results come back via root.after
+            self.executor = TkExecutor(self.root)
             self.users = self.fetch_users()
             self.volume_level = tk.DoubleVar(value=settings.get("volume", 0.5))
             self.filter_text = tk.StringVar()
             self.current_user = None
+            # ✅ NEW: Pre-formatted card text per medication revision
+            self.card_views = CardCache()
 
             self.create_widgets()
             self.start_alert_thread()
+            self.start_dashboard_api()
+            # ✅ NEW: Rotating online backups on a background thread
+            self.backup_job = db_backup.BackupJob(self.db_path,
+                                                  interval_hours=settings.get("backup_interval_hours",
+                                                                              db_backup.INTERVAL_HOURS))
+            self.backup_job.start()
+
+            # ✅ NEW: Hidden performance panel and UI stall monitor
+            self.root.bind_all("<Control-Shift-P>", lambda e: self.open_performance_window())
+            self._heartbeat_due = time.perf_counter() + 0.1
+            self.root.after(100, self._ui_heartbeat)
+
+            # ✅ NEW: Database upkeep runs only while nobody is using the app
+            self.maintenance = db_maintenance.IdleMaintenance(self.db_path)
+            self._last_input = time.monotonic()
+            self._last_maintenance = 0.0
+            for sequence in ("<Any-KeyPress>", "<Any-ButtonPress>", "<Motion>"):
+                self.root.bind_all(sequence, self._note_input, add="+")
+            self.root.after(60000, self._maintenance_when_idle)
 
         
     def create_widgets(self):
@@ -210,13 +186,9 @@ class MedicationApp:
         volume_slider.pack(side=tk.LEFT)
         tk.Button(volume_frame, text="Test Sound", font=("Helvetica", 12, "bold"), command=play_alert_sound).pack(side=tk.LEFT, padx=10)
 
-        button_frame = tk.Frame(self.root)
-        button_frame.pack()
-
-        for user in self.users:
-            btn = tk.Button(button_frame, text=user[1], font=("Helvetica", 20, "bold"),
-                            command=lambda u=user: self.show_user_data(u))
-            btn.pack(side=tk.LEFT, padx=20)
+        self.user_button_frame = tk.Frame(self.root)
+        self.user_button_frame.pack()
+        self.build_user_buttons()
 
         # ✅ Add the Medication Editor button above scrollable meds
         editor_frame = tk.Frame(self.root)
@@ -231,6 +203,18 @@ class MedicationApp:
         tk.Button(editor_frame, text="View Journals", font=("Helvetica", 12, "bold"),
                 command=self.view_journals).pack(side=tk.LEFT, padx=5)
 
+        tk.Button(editor_frame, text="Dose Calendar", font=("Helvetica", 12, "bold"),
+                command=self.open_dose_calendar).pack(side=tk.LEFT, padx=5)
+
+        tk.Button(editor_frame, text="Medication History", font=("Helvetica", 12, "bold"),
+                command=self.view_medication_history).pack(side=tk.LEFT, padx=5)
+
+        tk.Button(editor_frame, text="Refill Forecast", font=("Helvetica", 12, "bold"),
+                command=self.view_refill_forecast).pack(side=tk.LEFT, padx=5)
+
+        tk.Button(editor_frame, text="Backups", font=("Helvetica", 12, "bold"),
+                command=self.open_backups).pack(side=tk.LEFT, padx=5)
+
 
         search_frame = tk.Frame(self.root)
         search_frame.pack(pady=5)
@@ -269,6 +253,15 @@ class MedicationApp:
         self.canvas.bind_all("<Button-4>", self._on_mousewheel)
         self.canvas.bind_all("<Button-5>", self._on_mousewheel)
 
+    def build_user_buttons(self):
+        """One button per user in self.users (rebuilt when the user list is replaced, e.g. by a restore)"""
+        for widget in self.user_button_frame.winfo_children():
+            widget.destroy()
+        for user in self.users:
+            btn = tk.Button(self.user_button_frame, text=user[1], font=("Helvetica", 20, "bold"),
+                            command=lambda u=user: self.show_user_data(u))
+            btn.pack(side=tk.LEFT, padx=20)
+
     def _on_mousewheel(self, event):
         if event.num == 4:   # Linux scroll up
             self.canvas.yview_scroll(-1, "units")
@@ -277,18 +270,95 @@ class MedicationApp:
         else:  # Windows and Mac
             self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
 
+    def _ui_heartbeat(self):
+        """Record how late the Tk event loop runs a 100 ms timer (UI stall time)"""
+        now = time.perf_counter()
+        perf_metrics.observe("ui.stall", max(0.0, (now - self._heartbeat_due) * 1000))
+        self._heartbeat_due = now + 0.1
+        self.root.after(100, self._ui_heartbeat)
+
+    def _note_input(self, event=None):
+        self._last_input = time.monotonic()
+
+    def _is_idle(self):
+        """No open alert and no keyboard/mouse input for a while (safe to read from worker threads)"""
+        return (self.active_alert_count == 0 and not self.active_user_alerts and not self.alert_dashboard.rows
+                and time.monotonic() - self._last_input >= db_maintenance.IDLE_SECONDS)
+
+    def _maintenance_when_idle(self):
+        # at most hourly; each step decides for itself whether it has work to do
+        if self._is_idle() and time.monotonic() - self._last_maintenance >= 3600:
+            self._last_maintenance = time.monotonic()
+            self.executor.submit(self.maintenance.run, self._is_idle, key="idle-maintenance",
+                                 on_error=lambda e: log.warning("Idle maintenance failed: %s", e))
+        self.root.after(60000, self._maintenance_when_idle)
+
+    def open_performance_window(self):
+        """Show live timer/counter statistics (Ctrl+Shift+P)"""
+        if getattr(self, "perf_window", None) and self.perf_window.winfo_exists():
+            self.perf_window.lift()
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Performance")
+        window.geometry("640x480")
+        self.perf_window = window
+
+        columns = ("count", "p50", "p99", "max", "total")
+        tree = ttk.Treeview(window, columns=columns)
+        tree.heading("#0", text="Metric")
+        tree.column("#0", width=200)
+        for col in columns:
+            tree.heading(col, text=col if col == "count" else f"{col} (ms)")
+            tree.column(col, width=80, anchor="e")
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        status = tk.Label(window, anchor="w")
+        status.pack(fill="x", padx=5)
+
+        button_frame = tk.Frame(window)
+        button_frame.pack(pady=5)
+        tk.Button(button_frame, text="Save JSON", command=lambda: perf_metrics.dump_json()).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Reset", command=perf_metrics.reset).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Recent Log", command=self.open_recent_log_window).pack(side=tk.LEFT, padx=5)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            snap = perf_metrics.snapshot()
+            tree.delete(*tree.get_children())
+            for name, t in snap["timers"].items():
+                tree.insert("", tk.END, text=name, values=(t["count"], t["p50_ms"], t["p99_ms"],
+                                                           t["max_ms"], t["total_ms"]))
+            for name, value in list(snap["counters"].items()) + list(snap["gauges"].items()):
+                tree.insert("", tk.END, text=name, values=(value, "", "", "", ""))
+            status.config(text=f"Uptime {snap['uptime_s']}s  -  dumped to {perf_metrics.METRICS_PATH}")
+            window.after(1000, refresh)
+
+        refresh()
+
+    def open_recent_log_window(self):
+        """Show the in-memory ring buffer of recent log events"""
+        window = tk.Toplevel(self.root)
+        window.title("Recent Log Events")
+        window.geometry("700x400")
+
+        text = tk.Text(window, wrap=tk.NONE, font=("Courier", 9))
+        text.pack(fill=tk.BOTH, expand=True)
+        for event in med_logging.recent_events():
+            text.insert(tk.END, f"{event['ts']} {event['level']:<7} {event['logger']}: {event['msg']}\n")
+        text.see(tk.END)
+        text.config(state=tk.DISABLED)
+
     def set_volume(self, value):
         volume = float(value)
         pygame.mixer.music.set_volume(volume)
-        save_settings({"volume": volume})
+        # keep the other settings (log level, facility mode) when saving the volume
+        settings["volume"] = volume
+        save_settings(settings)
 
     def fetch_users(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("SELECT user_id, first_name, last_name, medication_data FROM users")
-        users = c.fetchall()
-        conn.close()
-        return users
+        return self.store.users()
 
     def add_journal_entry(self):
         if not self.current_user:
@@ -307,14 +377,13 @@ class MedicationApp:
         def save_entry():
             entry_text = text_box.get("1.0", tk.END).strip()
             if entry_text:
-                conn = sqlite3.connect(self.db_path)
-                c = conn.cursor()
-                c.execute("INSERT INTO user_journals (user_id, date, journal_text) VALUES (?, ?, ?)",
-                        (self.current_user[0], datetime.now().strftime("%Y-%m-%d"), entry_text))
-                conn.commit()
-                conn.close()
-                messagebox.showinfo("Saved", "Journal entry saved.")
-                entry_win.destroy()
+                def saved(_):
+                    messagebox.showinfo("Saved", "Journal entry saved.")
+                    entry_win.destroy()
+
+                self.executor.submit(self.store.add_journal_entry, self.current_user[0],
+                                     self.store.clock.today().isoformat(), entry_text,
+                                     on_done=saved, on_error=self.show_background_error)
             else:
                 messagebox.showwarning("Empty Entry", "Please enter some text before saving.")
 
@@ -332,122 +401,70 @@ class MedicationApp:
 
         tk.Label(window, text="Start Date:", font=("Helvetica", 12, "bold")).pack()
         start_date = DateEntry(window)
-        start_date.set_date(datetime.now() - timedelta(days=30))
+        start_date.set_date(self.store.clock.today() - timedelta(days=30))
         start_date.pack()
 
         tk.Label(window, text="End Date:", font=("Helvetica", 12, "bold")).pack()
         end_date = DateEntry(window)
-        end_date.set_date(datetime.now())
+        end_date.set_date(self.store.clock.today())
         end_date.pack()
 
         result_box = tk.Text(window, wrap=tk.WORD)
         result_box.pack(expand=True, fill=tk.BOTH, pady=10)
 
-        def fetch_entries():
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute("""
-                SELECT date, journal_text FROM user_journals
-                WHERE user_id = ? AND date BETWEEN ? AND ?
-                ORDER BY date
-            """, (
-                self.current_user[0],
-                start_date.get_date().strftime("%Y-%m-%d"),
-                end_date.get_date().strftime("%Y-%m-%d")
-            ))
-            entries = c.fetchall()
-            conn.close()
+        def show_entries(entries):
+            if not window.winfo_exists():
+                return
             result_box.delete("1.0", tk.END)
             if entries:
-                for entry in entries:
-                    result_box.insert(tk.END, f"{entry[0]}:\n{entry[1]}\n\n")
+                result_box.insert(tk.END, "".join(f"{entry[0]}:\n{entry[1]}\n\n" for entry in entries))
             else:
                 result_box.insert(tk.END, "No entries found in this range.\n")
 
+        def fetch_entries():
+            # A newer refresh for this window supersedes one still running
+            self.executor.submit(
+                med_db.fetch_journal_entries,
+                self.db_path,
+                self.current_user[0],
+                start_date.get_date().strftime("%Y-%m-%d"),
+                end_date.get_date().strftime("%Y-%m-%d"),
+                on_done=show_entries, on_error=self.show_background_error,
+                key=f"journal-entries-{id(window)}"
+            )
+
         def export_entries():
-            date_str = datetime.now().strftime("%m-%d-%Y")
+            date_str = self.store.clock.today().strftime("%m-%d-%Y")
             filename = f"{self.current_user[1]}-Journal-{date_str}.pdf"
             file_path = filedialog.asksaveasfilename(defaultextension=".pdf", initialfile=filename,
                                                     filetypes=[("PDF Files", "*.pdf")])
             if not file_path:
                 return
 
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
+            user = self.current_user
+            start = start_date.get_date().strftime("%Y-%m-%d")
+            end = end_date.get_date().strftime("%Y-%m-%d")
 
-            # Fetch medications
-            c.execute("SELECT medication_data FROM users WHERE user_id = ?", (self.current_user[0],))
-            meds_json = c.fetchone()[0]
-            meds = json.loads(meds_json) if meds_json else []
-
-            # Fetch journal entries
-            c.execute("""
-                SELECT date, journal_text FROM user_journals
-                WHERE user_id = ? AND date BETWEEN ? AND ?
-                ORDER BY date
-            """, (
-                self.current_user[0],
-                start_date.get_date().strftime("%Y-%m-%d"),
-                end_date.get_date().strftime("%Y-%m-%d")
-            ))
-            entries = c.fetchall()
-            conn.close()
-
-            from reportlab.lib.pagesizes import letter
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.units import inch
-
-            c = canvas.Canvas(file_path, pagesize=letter)
-            width, height = letter
-            x_margin = inch
-            y = height - inch
-
-            def write_line(text, font_size=12, bold=False):
-                nonlocal y
-                if y < inch:
-                    c.showPage()
-                    y = height - inch
-                font = "Helvetica-Bold" if bold else "Helvetica"
-                c.setFont(font, font_size)
-                c.drawString(x_margin, y, text)
-                y -= 14
-
-            # Header
-            write_line(f"{self.current_user[1]} {self.current_user[2]} - Medication Summary", 16, bold=True)
-            write_line("")
-
-            for m in meds:
-                write_line(f"Medication: {m.get('medication_name', 'N/A')}", 12, bold=True)
-                write_line(f"Prescribed by: {m.get('doctor_name', 'N/A')}")
-                write_line(f"Date Prescribed: {m.get('date_prescribed', 'N/A')}")
-                #write_line(f"Dosage Instructions: {m.get('dosage_instructions', 'N/A')}")  # ✅ Added this line
-                write_line(f"Instructions: {m.get('dosage_instructions', 'N/A')}")
-                write_line("")
-
-            write_line("Journal Entries", 16, bold=True)
-            write_line("")
+            def build_pdf():
+                # Fetch medications and journal entries
+                meds = self.store.medications(user[0])
+                entries = med_db.fetch_journal_entries(self.db_path, user[0], start, end)
+                write_journal_pdf(file_path, user, meds, entries)
 
-            if entries:
-                for entry in entries:
-                    write_line(f"{entry[0]}", 12, bold=True)
-                    for line in entry[1].splitlines():
-                        write_line(line.strip())
-                    write_line("")
-            else:
-                write_line("No journal entries found in selected date range.")
+            def exported(_):
+                messagebox.showinfo("Exported", f"Journal PDF saved as:\n{file_path}")
 
-            c.save()
-            messagebox.showinfo("Exported", f"Journal PDF saved as:\n{file_path}")
+                try:
+                    if platform.system() == "Windows":
+                        os.startfile(file_path)
+                    elif platform.system() == "Darwin":
+                        subprocess.Popen(["open", file_path])
+                    else:
+                        subprocess.Popen(["xdg-open", file_path])
+                except Exception as e:
+                    log.warning("Could not open PDF automatically: %s", e)
 
-            try:
-                if platform.system() == "Windows":
-                    os.startfile(file_path)
-                elif platform.system() == "Darwin":
-                    subprocess.run(["open", file_path])
-                else:
-                    subprocess.run(["xdg-open", file_path])
-            except Exception as e:
-                print(f"Could not open PDF automatically: {e}")
+            self.executor.submit(build_pdf, on_done=exported, on_error=self.show_background_error)
 
 
 
@@ -460,28 +477,190 @@ class MedicationApp:
 
            
     
+    def open_dose_calendar(self):
+        # ✅ NEW: Calendar for the selected user, or the whole household if none is selected
+        DoseCalendarWindow(self, self.current_user, clock=self.store.clock)
+
+    def view_medication_history(self):
+        """Archived (expired) prescriptions for the selected user, with a restore action"""
+        if not self.current_user:
+            messagebox.showwarning("No User Selected", "Please select a user first.")
+            return
+
+        user = self.current_user
+        window = tk.Toplevel(self.root)
+        window.title(f"{user[1]}'s Medication History")
+        window.geometry("700x400")
+
+        columns = ("medication", "doctor", "prescribed", "stopped", "archived")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for col, width in zip(columns, (180, 140, 100, 100, 150)):
+            tree.heading(col, text=col.title())
+            tree.column(col, width=width)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def show_history(rows):
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for archive_id, med, archived_at in rows:
+                tree.insert("", tk.END, iid=str(archive_id), values=(
+                    med.get("medication_name", ""), med.get("doctor_name", ""),
+                    med.get("date_prescribed", ""), med.get("stop_after_date", ""), archived_at))
+
+        def load_history():
+            self.executor.submit(self.store.archived_medications, user[0], on_done=show_history,
+                                 on_error=self.show_background_error, key=f"med-history-{id(window)}")
+
+        def restore_selected():
+            selected = tree.selection()
+            if not selected:
+                return
+            name = tree.item(selected[0], "values")[0]
+            if not messagebox.askyesno("Restore Medication",
+                                       f"Restore {name} to the active list?\n"
+                                       "Its stop date will be cleared; edit it to set a new one.", parent=window):
+                return
+
+            def restored(_):
+                load_history()
+                if self.current_user and self.current_user[0] == user[0]:
+                    self.show_user_data(self.current_user)
+
+            self.executor.submit(self.store.restore_medication, int(selected[0]),
+                                 on_done=restored, on_error=self.show_background_error)
+
+        button_frame = tk.Frame(window)
+        button_frame.pack(pady=5)
+        tk.Button(button_frame, text="Restore Selected", command=restore_selected).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Close", command=window.destroy).pack(side=tk.LEFT, padx=5)
+
+        load_history()
+
+    def view_refill_forecast(self):
+        """Household medications ranked by their earliest likely run-out"""
+        window = tk.Toplevel(self.root)
+        window.title("Refill Forecast")
+        window.geometry("820x420")
+
+        columns = ("person", "medication", "stock", "per_day", "days_left", "range", "run_out")
+        headings = ("Person", "Medication", "Stock", "Per Day", "Days Left", "Likely Range", "Runs Out")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        for col, heading, width in zip(columns, headings, (140, 170, 60, 70, 80, 110, 120)):
+            tree.heading(col, text=heading)
+            tree.column(col, width=width)
+        tree.tag_configure("low", background="#f8d7da")
+        tree.tag_configure("ending", foreground="gray")
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def days(value):
+            return "∞" if value == float("inf") else f"{value:.0f}"
+
+        def show_forecast(forecasts):
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for f in forecasts:
+                if f.ends_first:
+                    tags, run_out = ("ending",), "prescription ends first"
+                else:
+                    tags = ("low",) if f.days_low < refill_forecast.LEAD_DAYS else ()
+                    run_out = f.run_out.isoformat() if f.run_out else ""
+                tree.insert("", tk.END, values=(f.user_name, f.medication_name, f.stock, f"{f.rate:.2f}",
+                                                days(f.days_left), f"{days(f.days_low)}–{days(f.days_high)}",
+                                                run_out), tags=tags)
+
+        self.executor.submit(self.store.refill_forecast, on_done=show_forecast,
+                             on_error=self.show_background_error, key=f"refill-forecast-{id(window)}")
+        tk.Button(window, text="Close", command=window.destroy).pack(pady=5)
+
+    def open_backups(self):
+        """Backup generations with Back Up Now and one-click restore"""
+        window = tk.Toplevel(self.root)
+        window.title("Backups")
+        window.geometry("560x340")
+
+        columns = ("backup", "size")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        tree.heading("backup", text="Backup")
+        tree.heading("size", text="Size")
+        tree.column("backup", width=400)
+        tree.column("size", width=100)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def show_backups(paths):
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for path in paths:
+                tree.insert("", tk.END, iid=path, values=(os.path.basename(path),
+                                                          f"{os.path.getsize(path) / 1e6:.1f} MB"))
+
+        def load_backups(_=None):
+            self.executor.submit(db_backup.list_backups, self.db_path, self.backup_job.dest_dir,
+                                 on_done=show_backups, on_error=self.show_background_error)
+
+        def backup_now():
+            self.executor.submit(self.backup_job.backup_now, on_done=load_backups,
+                                 on_error=self.show_background_error, key="backup-now")
+
+        def restore_selected():
+            selected = tree.selection()
+            if not selected:
+                return
+            if not messagebox.askyesno("Restore Backup",
+                                       f"Replace all current data with {os.path.basename(selected[0])}?\n"
+                                       "The current data is backed up first.", parent=window):
+                return
+
+            def restore():
+                # restore_backup migrates the file; the store then reloads it from scratch
+                db_backup.restore_backup(selected[0], self.db_path)
+                self.store.refresh(replaced=True)
+                return self.fetch_users()
+
+            def restored(users):
+                self.users = users
+                self.build_user_buttons()
+                current = self.current_user and self.store.current().user(self.current_user[0])
+                if current is not None:
+                    self.show_user_data(current)
+                else:
+                    self.current_user = None
+                    for widget in self.scrollable_frame.winfo_children():
+                        widget.destroy()
+                load_backups()
+                messagebox.showinfo("Restore Backup", "The backup was restored.", parent=window)
+
+            self.executor.submit(restore, on_done=restored, on_error=self.show_background_error)
+
+        button_frame = tk.Frame(window)
+        button_frame.pack(pady=5)
+        tk.Button(button_frame, text="Back Up Now", command=backup_now).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Restore Selected", command=restore_selected).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Close", command=window.destroy).pack(side=tk.LEFT, padx=5)
+
+        load_backups()
+
     def open_medication_editor(self, edit_index=None):
         """Open the medication editor. If edit_index is provided, edit that medication."""
         if not self.current_user:
             messagebox.showwarning("No User Selected", "Select a user first.")
             return
 
-        # Get current medications
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        user_id = self.current_user[0]
-        c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
-        raw = c.fetchone()
-        existing_meds = json.loads(raw[0]) if raw and raw[0] else []
-        conn.close()
+        # Get current medications off the Tk thread, then build the editor
+        self.executor.submit(self.store.medications, self.current_user[0],
+                             on_done=lambda meds: self._build_medication_editor(edit_index, meds),
+                             on_error=self.show_background_error, key="medication-editor")
 
+    def _build_medication_editor(self, edit_index, existing_meds):
         # Check if we're editing an existing medication
         is_editing = edit_index is not None and 0 <= edit_index < len(existing_meds)
         existing_med = existing_meds[edit_index] if is_editing else {}
 
         editor = tk.Toplevel(self.root)
         editor.title("Edit Medication" if is_editing else "Add New Medication")
-        editor.geometry("500x600")
+        editor.geometry("500x660")
 
         tk.Label(editor, text="Medication Name:", font=("Helvetica", 18)).pack()
         name_entry = tk.Entry(editor, font=("Helvetica", 18))
@@ -497,40 +676,20 @@ class MedicationApp:
 
         tk.Label(editor, text="Date Prescribed:", font=("Helvetica", 18)).pack()
         date_entry = DateEntry(editor, font=("Helvetica", 18), date_pattern="mm-dd-yyyy")
-        if is_editing and existing_med.get("date_prescribed"):
-            try:
-                # Handle different date formats
-                date_str = existing_med.get("date_prescribed")
-                if len(date_str) == 10 and date_str.count('-') == 2:  # YYYY-MM-DD format
-                    parsed_date = datetime.strptime(date_str, "%Y-%m-%d")
-                else:  # MM-DD-YYYY format
-                    parsed_date = datetime.strptime(date_str, "%m-%d-%Y")
-                date_entry.set_date(parsed_date.date())
-            except:
-                date_entry.set_date(datetime.today())
+        prescribed = date_codec.parse_date(existing_med.get("date_prescribed")) if is_editing else None
+        if prescribed:
+            date_entry.set_date(prescribed)
         else:
-            date_entry.set_date(datetime.today())
+            date_entry.set_date(self.store.clock.today())
         date_entry.pack()
 
         tk.Label(editor, text="Stop After Date (optional):", font=("Helvetica", 18)).pack()
         stop_entry = tk.Entry(editor, justify="center", font=("Helvetica", 18))
         stop_entry.pack()
         
-        # Pre-fill stop date if editing
-        if is_editing and existing_med.get("stop_after_date"):
-            try:
-                stop_date_str = existing_med.get("stop_after_date")
-                if stop_date_str:
-                    # Convert from YYYY-MM-DD to MM-DD-YYYY for display
-                    parsed_date = datetime.strptime(stop_date_str, "%Y-%m-%d")
-                    display_date = parsed_date.strftime("%m-%d-%Y")
-                    stop_entry.insert(0, display_date)
-                else:
-                    stop_entry.insert(0, "MM-DD-YYYY")
-            except:
-                stop_entry.insert(0, "MM-DD-YYYY")
-        else:
-            stop_entry.insert(0, "MM-DD-YYYY")
+        # Pre-fill stop date if editing (shown as MM-DD-YYYY)
+        stop_date = date_codec.parse_date(existing_med.get("stop_after_date")) if is_editing else None
+        stop_entry.insert(0, date_codec.to_display(stop_date) if stop_date else "MM-DD-YYYY")
 
         def clear_placeholder(e):
             if stop_entry.get() == "MM-DD-YYYY":
@@ -557,23 +716,40 @@ class MedicationApp:
                                     font=("Helvetica", 16))
         dosage_combobox.pack()
 
-        tk.Label(editor, text="Select time(s) for doses:", font=("Helvetica", 18)).pack()
-        time_vars = {"9 AM": tk.IntVar(), "3:30 PM": tk.IntVar(), "9 PM": tk.IntVar(), "3:30 AM": tk.IntVar()}
-        
-        # Pre-select times if editing
-        if is_editing:
-            existing_times = existing_med.get("scheduled_times", [])
-            time_mapping = {"09:00": "9 AM", "15:30": "3:30 PM", "21:00": "9 PM", "03:30": "3:30 AM"}
-            for time_24, time_label in time_mapping.items():
-                if time_24 in existing_times:
-                    time_vars[time_label].set(1)
-        
+        # ✅ NEW: Recurrence rule behind the dosage choice (editable for custom schedules)
+        tk.Label(editor, text="Schedule Rule:", font=("Helvetica", 14)).pack()
+        rule_var = tk.StringVar(value=existing_med.get("recurrence") or rule_for_dosage(current_dosage))
+        tk.Entry(editor, textvariable=rule_var, justify="center", font=("Helvetica", 14), width=32).pack()
+        dosage_combobox.bind("<<ComboboxSelected>>", lambda e: rule_var.set(rule_for_dosage(dosage_var.get())))
+
+        # ✅ NEW: Any dose times (HH:MM, comma separated) with quick presets
+        tk.Label(editor, text="Dose time(s):", font=("Helvetica", 18)).pack()
+        times_var = tk.StringVar(value=", ".join(existing_med.get("scheduled_times", [])) if is_editing else "")
+        tk.Entry(editor, textvariable=times_var, justify="center", font=("Helvetica", 16), width=28).pack()
+
+        def toggle_time(t):
+            try:
+                times = parse_times(times_var.get())
+            except ValueError:
+                times = []
+            times = [x for x in times if x != t] if t in times else sorted(times + [t])
+            times_var.set(", ".join(times))
+
+        def fill_every_n_hours():
+            try:
+                times = parse_times(times_var.get())
+                times_var.set(", ".join(every_n_hours(times[0] if times else "08:00", int(hours_var.get()))))
+            except ValueError as e:
+                messagebox.showerror("Invalid Times", str(e))
+
         time_frame = tk.Frame(editor)
         time_frame.pack(pady=5)
-
-        for label in time_vars:
-            chk = tk.Checkbutton(time_frame, text=label, variable=time_vars[label], font=("Helvetica", 16))
-            chk.pack(side=tk.LEFT, padx=10)
+        for label, t in (("9 AM", "09:00"), ("3:30 PM", "15:30"), ("9 PM", "21:00"), ("3:30 AM", "03:30")):
+            tk.Button(time_frame, text=label, font=("Helvetica", 12), command=lambda t=t: toggle_time(t)).pack(side=tk.LEFT, padx=4)
+        tk.Label(time_frame, text="  every", font=("Helvetica", 12)).pack(side=tk.LEFT)
+        hours_var = tk.StringVar(value="6")
+        tk.Spinbox(time_frame, from_=1, to=24, width=3, textvariable=hours_var, font=("Helvetica", 12)).pack(side=tk.LEFT)
+        tk.Button(time_frame, text="hrs", font=("Helvetica", 12), command=fill_every_n_hours).pack(side=tk.LEFT, padx=4)
 
         tk.Label(editor, text="Quantity on-hand:", font=("Helvetica", 18)).pack()
         stock_entry = tk.Entry(editor, font=("Helvetica", 18))
@@ -582,18 +758,17 @@ class MedicationApp:
             stock_entry.insert(0, str(existing_med.get("stock", 0)))
 
         def save_medication():
-            scheduled = []
-            if time_vars["9 AM"].get(): scheduled.append("09:00")
-            if time_vars["3:30 PM"].get(): scheduled.append("15:30")
-            if time_vars["9 PM"].get(): scheduled.append("21:00")
-            if time_vars["3:30 AM"].get(): scheduled.append("03:30")
+            try:
+                scheduled = parse_times(times_var.get())
+            except ValueError as e:
+                messagebox.showerror("Invalid Times", f"{e}\nUse HH:MM, e.g. 07:15, 21:00.")
+                return
 
             raw_stop = stop_entry.get().strip()
             stop_after_date = None
             if raw_stop and raw_stop != "MM-DD-YYYY":
                 try:
-                    parsed_date = datetime.strptime(raw_stop, "%m-%d-%Y")
-                    stop_after_date = parsed_date.date().isoformat()
+                    stop_after_date = date_codec.normalize(raw_stop)
                 except ValueError:
                     messagebox.showerror("Invalid Date", "Please enter Stop After Date in MM-DD-YYYY format.")
                     return
@@ -601,58 +776,81 @@ class MedicationApp:
             # ✅ FIXED: Store prescribed date in YYYY-MM-DD format for consistency
             prescribed_date = date_entry.get_date().isoformat()
 
+            rule = rule_var.get().strip().upper() or rule_for_dosage(dosage_var.get())
+            try:
+                parse_rule(rule)
+            except ValueError as e:
+                messagebox.showerror("Invalid Schedule Rule", str(e))
+                return
+
             med = {
                 "medication_name": name_entry.get(),
                 "doctor_name": doctor_entry.get(),
                 "date_prescribed": prescribed_date,  # Store in YYYY-MM-DD format
                 "stop_after_date": stop_after_date,
                 "dosage_instructions": dosage_var.get(),
+                "recurrence": rule,
                 "stock": int(stock_entry.get() or 0),
                 "scheduled_times": scheduled
             }
 
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
             user_id = self.current_user[0]
-            c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
-            raw = c.fetchone()
-            data = json.loads(raw[0]) if raw and raw[0] else []
-            
-            if is_editing:
-                # Update existing medication
-                data[edit_index] = med
-                messagebox.showinfo("Success", "Medication updated successfully!")
-            else:
-                # Add new medication
-                data.append(med)
-                messagebox.showinfo("Success", "Medication added successfully!")
-            
-            c.execute("UPDATE users SET medication_data = ? WHERE user_id = ?", (json.dumps(data), user_id))
-            conn.commit()
-            conn.close()
-            editor.destroy()
-            
-            # ✅ REFRESH: Fetch updated data and refresh display
-            self.users = self.fetch_users()
-            if self.current_user:
-                # Find the updated user data
-                updated_user = next((u for u in self.users if u[0] == self.current_user[0]), self.current_user)
-                self.show_user_data(updated_user)
+
+            def apply(data):
+                if is_editing and edit_index < len(data):
+                    # Update existing medication, keeping its id so dose history follows it
+                    if data[edit_index].get("med_id"):
+                        med["med_id"] = data[edit_index]["med_id"]
+                    data[edit_index] = med
+                else:
+                    # Add new medication
+                    data.append(med)
+
+            def saved(_):
+                messagebox.showinfo("Success", "Medication updated successfully!" if is_editing
+                                    else "Medication added successfully!")
+                editor.destroy()
+
+                # ✅ REFRESH: Refresh display with the updated data
+                if self.current_user:
+                    self.show_user_data(self.current_user)
+
+            self.executor.submit(self.store.update_medications, user_id, apply,
+                                 on_done=saved, on_error=self.show_background_error)
 
         save_text = "Update Medication" if is_editing else "Save Medication"
         tk.Button(editor, text=save_text, font=("Helvetica", 18), command=save_medication).pack(pady=10)
 
 
     def show_user_data(self, user):
+        """Load and format the user's medication cards on a worker, then render them"""
+        self.current_user = user
+        user_id = user[0]
+        filter_val = self.filter_text.get()
+
+        def load():
+            users = self.fetch_users()
+            fresh = next((u for u in users if u[0] == user_id), None)
+            cards = self.card_views.cards(fresh[3], filter_val) if fresh else []
+            # same forecast as the low-stock popup, so the cards and the popup agree
+            low = {f.med_id: f for f in running_low(self.store.refill_forecast(user_id=user_id))} if fresh else {}
+            return users, fresh, cards, low
+
+        # Each keystroke in the search box supersedes the previous render request
+        self.executor.submit(load, on_done=self._render_user_data,
+                             on_error=self.show_background_error, key="user-data")
+
+    @perf_metrics.timed("ui.show_user_data")
+    def _render_user_data(self, result):
+        users, user, cards, low = result
+        self.users = users
+        if user is None:
+            return
         self.current_user = user
-        self.users = self.fetch_users()
-        user = next((u for u in self.users if u[0] == user[0]), user)
 
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
 
-        meds = json.loads(user[3])
-        
         # Centered container
         container = tk.Frame(self.scrollable_frame)
         container.pack(anchor="center", pady=10)
@@ -660,68 +858,13 @@ class MedicationApp:
         tk.Label(container, text=f"Prescriptions for: {user[1]} {user[2]}",
                 font=("Helvetica", 24, "bold")).pack(pady=10)
 
-        filter_val = self.filter_text.get().lower()
-
-        label_map = {
-            "medication_name": "Medication",
-            "doctor_name": "Doctor",
-            "date_prescribed": "Prescribed on",
-            "stop_after_date": "End Medication on",
-            "dosage_instructions": "Instructions",
-            "stock": "Doses Remaining",
-            "scheduled_times": "Scheduled for"
-        }
-
-        for i, m in enumerate(meds):
-            if filter_val and filter_val not in m.get("medication_name", "").lower():
-                continue
-
-            # ✅ IMPROVED: Better display formatting with date conversion
-            display_med = {}
-            for k, v in m.items():
-                if k == "date_prescribed" and v:
-                    # Convert YYYY-MM-DD to MM-DD-YYYY for display
-                    try:
-                        if len(v) == 10 and v.count('-') == 2:
-                            parts = v.split('-')
-                            if len(parts[0]) == 4:  # YYYY-MM-DD format
-                                date_obj = datetime.strptime(v, "%Y-%m-%d")
-                                display_med[k] = date_obj.strftime("%m-%d-%Y")
-                            else:  # Already MM-DD-YYYY
-                                display_med[k] = v
-                        else:
-                            display_med[k] = v
-                    except:
-                        display_med[k] = v
-                elif k == "stop_after_date" and v:
-                    # Convert YYYY-MM-DD to MM-DD-YYYY for display
-                    try:
-                        date_obj = datetime.strptime(v, "%Y-%m-%d")
-                        display_med[k] = date_obj.strftime("%m-%d-%Y")
-                    except:
-                        display_med[k] = v
-                elif k == "scheduled_times" and isinstance(v, list):
-                    # Convert 24-hour times to 12-hour format for display
-                    time_display = []
-                    for time_str in v:
-                        try:
-                            time_obj = datetime.strptime(time_str, "%H:%M")
-                            formatted_time = time_obj.strftime("%I:%M %p").lstrip('0')
-                            time_display.append(formatted_time)
-                        except:
-                            time_display.append(time_str)
-                    display_med[k] = ", ".join(time_display)
-                else:
-                    display_med[k] = v
-
-            med_text = "\n".join([
-                f"{label_map.get(k, k)}: {v}"
-                for k, v in display_med.items()
-                if k in label_map  # Only show mapped fields
-            ])
-
+        for i, view in cards:
             frame = tk.Frame(container, borderwidth=1, relief="solid", padx=10, pady=5)
-            tk.Label(frame, text=med_text, justify="left", font=("Courier", 10)).pack(anchor="w")
+            tk.Label(frame, text=view.text, justify="left", font=("Courier", 10)).pack(anchor="w")
+            forecast = low.get(view.med_id)
+            if forecast:
+                tk.Label(frame, text=f"Low stock: about {forecast.days_left:.0f} days left", fg="#b00020",
+                         font=("Helvetica", 10, "bold")).pack(anchor="w")
 
             button_frame = tk.Frame(frame)
             button_frame.pack(pady=5)
@@ -742,38 +885,12 @@ class MedicationApp:
         self.check_stock_levels()    
 
     def check_stock_levels(self):
-        alerts = []
-
-        for user in self.users:
-            user_id = user[0]
-            user_name = f"{user[1]} {user[2]}"
-            try:
-                medications = json.loads(user[3])
-            except Exception as e:
-                continue
-
-            for med in medications:
-                stock = med.get("stock", 0)
-                scheduled_times = med.get("scheduled_times", [])
-                dosage_instructions = med.get("dosage_instructions", "once per day")
-
-                # ✅ MODIFIED: Use new calculation function
-                days_left = calculate_days_supply(stock, dosage_instructions, scheduled_times)
-
-                stop_date_str = med.get("stop_after_date")
-                stop_date = None
-                if stop_date_str:
-                    try:
-                        stop_date = datetime.strptime(stop_date_str, "%Y-%m-%d").date()
-                    except:
-                        pass
-
-                today = datetime.today().date()
-
-                # Only alert if days left < 5 AND medication isn't ending within 5 days
-                if days_left < 5 and (not stop_date or (stop_date - today).days > 5):
-                    alerts.append(f"{user_name} is running low on {med.get('medication_name')} ({days_left} days left)")
+        # ✅ NEW: Warn from consumption-based forecasts rather than the nominal schedule
+        self.executor.submit(lambda: low_stock_messages(self.store.refill_forecast()),
+                             on_done=self._show_low_stock_alert, key="stock-levels")
 
+    @perf_metrics.timed("ui.check_stock_levels")
+    def _show_low_stock_alert(self, alerts):
         if alerts:
             alert_win = tk.Toplevel(self.root)
             alert_win.title("Low Medication Stock")
@@ -796,474 +913,340 @@ class MedicationApp:
     def delete_medication(self, index):
         # Add confirmation dialog
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this medication?"):
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
             user_id = self.current_user[0]
-            c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
-            data = json.loads(c.fetchone()[0])
-            if 0 <= index < len(data):
-                deleted_med = data[index]
-                del data[index]
-                c.execute("UPDATE users SET medication_data = ? WHERE user_id = ?", (json.dumps(data), user_id))
-                messagebox.showinfo("Deleted", f"Medication '{deleted_med.get('medication_name', 'Unknown')}' has been deleted.")
-            conn.commit()
-            conn.close()
-            self.users = self.fetch_users()
-            self.show_user_data(self.current_user)
+
+            def remove(data):
+                if 0 <= index < len(data):
+                    return data.pop(index)
+
+            def deleted(deleted_med):
+                if deleted_med:
+                    messagebox.showinfo("Deleted", f"Medication '{deleted_med.get('medication_name', 'Unknown')}' has been deleted.")
+                self.show_user_data(self.current_user)
+
+            self.executor.submit(self.store.update_medications, user_id, remove,
+                                 on_done=deleted, on_error=self.show_background_error)
 
     def modify_stock(self, index):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        """Record a refill, a recount or wasted pills; every change goes into the stock ledger"""
         user_id = self.current_user[0]
-        c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
-        data = json.loads(c.fetchone()[0])
-        if 0 <= index < len(data):
-            new_stock = simpledialog.askinteger("Modify Stock", "Enter new stock quantity:", initialvalue=data[index].get("stock", 0))
-            if new_stock is not None:
-                data[index]["stock"] = new_stock
-                c.execute("UPDATE users SET medication_data = ? WHERE user_id = ?", (json.dumps(data), user_id))
-                conn.commit()
-        conn.close()
-        self.users = self.fetch_users()
-        self.show_user_data(self.current_user)
+        data = self.current_user[3]  # Cached copy from the last render; no DB access on the Tk thread
+        if not 0 <= index < len(data):
+            return
+        med = data[index]
+        med_id = med.get("med_id")
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Modify Stock: {med.get('medication_name', '')}")
+        window.geometry("460x420")
+
+        tk.Label(window, text=f"Current stock: {med.get('stock', 0)}", font=("Helvetica", 14, "bold")).pack(pady=5)
+        kind_var = tk.StringVar(value="refill")
+        for kind, label in (("refill", "Refill (add pills)"), ("adjust", "Recount (set exact quantity)"),
+                            ("wasted", "Wasted (remove pills)")):
+            tk.Radiobutton(window, text=label, variable=kind_var, value=kind, font=("Helvetica", 12)).pack(anchor="w", padx=40)
+        quantity_entry = tk.Entry(window, justify="center", font=("Helvetica", 14))
+        quantity_entry.pack(pady=5)
+
+        history_box = tk.Text(window, height=10, font=("Courier", 9))
+        history_box.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def show_history(result):
+            rows, used_30 = result
+            if not window.winfo_exists():
+                return
+            history_box.delete("1.0", tk.END)
+            history_box.insert(tk.END, f"Used in the last 30 days: {used_30}\n\n")
+            for created_at, kind, quantity, balance, note in rows:
+                history_box.insert(tk.END, f"{created_at}  {kind:<7} {quantity:>+5}  -> {balance}\n")
+
+        def load_history():
+            today = self.store.clock.today()
+            start = (today - timedelta(days=30)).isoformat()
+            end = (today + timedelta(days=1)).isoformat()
+            return self.store.stock_history(med_id, 20), self.store.stock_consumed(med_id, start, end)
+
+        def save():
+            try:
+                quantity = int(quantity_entry.get())
+                if quantity < 0:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Invalid Quantity", "Please enter a whole number of pills.", parent=window)
+                return
+            kind = kind_var.get()
+
+            def set_stock(meds):
+                target = next((m for m in meds if m.get("med_id") == med_id), None)
+                if target is None:
+                    return
+                current = target.get("stock", 0)
+                if kind == "refill":
+                    target["stock"] = current + quantity
+                elif kind == "wasted":
+                    target["stock"] = max(0, current - quantity)
+                else:
+                    target["stock"] = quantity
+
+            def saved(_):
+                window.destroy()
+                self.show_user_data(self.current_user)
+
+            self.executor.submit(self.store.update_medications, user_id, set_stock, stock_kind=kind,
+                                 on_done=saved, on_error=self.show_background_error)
+
+        tk.Button(window, text="Save", font=("Helvetica", 12, "bold"), command=save).pack(pady=5)
+        if med_id:
+            self.executor.submit(load_history, on_done=show_history, on_error=self.show_background_error)
+
+    def show_background_error(self, error):
+        log.error("Background task failed: %s", error, exc_info=error)
+        messagebox.showerror("Error", f"The operation failed:\n{error}")
 
     def start_alert_thread(self):
-        def check_alerts():
-            print("[DEBUG] Alert thread started")
-            while True:
-                try:
-                    now = datetime.now()
-                    today_key = now.strftime("%Y-%m-%d")
-                    current_date = now.date()
-                    
-                    # Reset alerted_today at midnight
-                    if not hasattr(self, '_last_reset_date') or self._last_reset_date != current_date:
-                        alerted_today.clear()
-                        self._last_reset_date = current_date
-                        print(f"[DEBUG] Reset daily alerts for {current_date}")
-
-                    # Fetch fresh user data
-                    try:
-                        self.users = self.fetch_users()
-                    except Exception as e:
-                        print(f"[DEBUG] Error fetching users: {e}")
-                        time.sleep(60)
-                        continue
-
-                    # ✅ NEW: Group medications by user and time
-                    user_time_meds = {}  # {(user_id, time): [(med, med_index), ...]}
-                    
-                    for user in self.users:
-                        user_id, fname, lname, med_data_json = user
-                        try:
-                            meds = json.loads(med_data_json) if med_data_json else []
-                        except Exception as e:
-                            print(f"[DEBUG] Error parsing medication data for user {fname}: {e}")
-                            continue
-                            
-                        for idx, med in enumerate(meds):
-                            # Check if medication should still be active
-                            stop_date_str = med.get("stop_after_date")
-                            if stop_date_str:
-                                try:
-                                    stop_date = datetime.strptime(stop_date_str, "%Y-%m-%d").date()
-                                    if current_date > stop_date:
-                                        continue  # Skip expired medications
-                                except Exception as e:
-                                    print(f"[DEBUG] Error parsing stop date: {e}")
-                            
-                            # ✅ IMPROVED: Check if medication should alert today based on dosage frequency
-                            if not should_alert_today(med, current_date):
-                                print(f"[DEBUG] Skipping {med.get('medication_name', 'Unknown')} - not scheduled for today")
-                                continue
-                            
-                            times = med.get("scheduled_times", [])
-                            for t in times:
-                                try:
-                                    med_time = datetime.strptime(t, "%H:%M").replace(
-                                        year=now.year, month=now.month, day=now.day
-                                    )
-                                    delta = abs((now - med_time).total_seconds())
-                                    
-                                    # Check if within 1 minute window
-                                    if delta <= 60:
-                                        key = (user_id, t)
-                                        if key not in user_time_meds:
-                                            user_time_meds[key] = []
-                                        
-                                        # Check if this specific medication hasn't been alerted today
-                                        alert_key = f"{today_key}-{user_id}-{idx}-{t}"
-                                        if alert_key not in alerted_today:
-                                            user_time_meds[key].append((med, idx, alert_key, fname, lname))
-                                        
-                                except Exception as e:
-                                    print(f"[DEBUG] Error processing scheduled time '{t}': {e}")
-                    
-                    # ✅ NEW: Trigger combined alerts for each user/time combination
-                    for (user_id, time_str), med_list in user_time_meds.items():
-                        if med_list:  # Only create alert if there are medications to show
-                            print(f"[DEBUG] Combined alert triggered: User {user_id} at {time_str} with {len(med_list)} medications")
-                            self.root.after(0, self.trigger_combined_alert, user_id, time_str, med_list)
-                    
-                except Exception as e:
-                    print(f"[DEBUG] Unexpected error in alert thread: {e}")
-                
-                # Sleep for 30 seconds instead of 60 for more responsive alerts
-                time.sleep(30)
-
-        # Start the background thread as a daemon so it stops when main program exits
-        alert_thread = threading.Thread(target=check_alerts, daemon=True)
-        alert_thread.start()
-        print("[DEBUG] Alert monitoring thread started")
-
-    def trigger_combined_alert(self, user_id, time_str, med_list):
-        """Display combined medication alert popup for multiple medications at the same time"""
-        try:
-            # ✅ SAFETY CHECK: Don't create alert if user already has one
+        # ✅ NEW: The scheduler thread owns its own state and only talks to the UI through queues
+        processes = resolve_processes(settings)
+        if processes:
+            # Facility mode: residents are sharded across worker processes
+            self.scheduler = FacilityCoordinator(self.db_path, processes, store=self.store)
+        else:
+            self.scheduler = AlertScheduler(self.store)
+        self.scheduler.start()
+        self.root.after(50, self._drain_scheduler_commands)
+        log.debug("Alert monitoring thread started")
+
+    def start_dashboard_api(self):
+        # ✅ NEW: Optional local JSON/SSE API for dashboards on other devices
+        self.api = None
+        port = resolve_port(settings)
+        if port:
+            host = settings.get("api_host", "127.0.0.1")
+            token = resolve_token(settings)
+            if token is None and not is_loopback(host):
+                # reachable from the network: never without a shared secret
+                token = settings["api_token"] = secrets.token_urlsafe(24)
+                save_settings(settings)
+                log.warning("Generated an api_token in %s; dashboards on other devices must send it", SETTINGS_PATH)
+            self.api = DashboardServer(self.store, port, host=host, token=token,
+                                       allowed_origins=settings.get("api_allowed_origins", ()))
+            self.api.start()
+
+    def _acknowledge_alert(self, user_id, time_str, med_states, doses=()):
+        """Tell the scheduler these alerts were handled and let dashboards know"""
+        self.scheduler.acknowledge(state['alert_key'] for state in med_states.values())
+        if self.api:
+            self.api.publish("ack", {"user_id": user_id, "time": time_str, "doses": list(doses),
+                                     "med_ids": [state['med'].get('med_id') for state in med_states.values()]})
+
+    def _drain_scheduler_commands(self):
+        """Run commands queued by the scheduler thread on the Tk thread"""
+        alerts = []
+        while True:
+            try:
+                command, *args = self.scheduler.outbox.get_nowait()
+            except queue.Empty:
+                break
+            if command == "show_alert":
+                alerts.append(args)
+                if self.api:
+                    user_id, time_str, med_list = args[:3]
+                    self.api.publish("due", {"user_id": user_id, "time": time_str,
+                                             "med_ids": [med.get('med_id') for med, *_ in med_list]})
+        if alerts:
+            self._show_alerts(alerts)
+        self.alert_timers.poll()
+        self.root.after(50, self._drain_scheduler_commands)
+
+    def _show_alerts(self, alerts):
+        """One popup per person, or the household dashboard once several people are due together"""
+        people = {args[0] for args in alerts} | set(self.active_user_alerts)
+        if not self.alert_dashboard.showing and len(people) < alert_dashboard.MIN_USERS:
+            for args in alerts:
+                self.trigger_combined_alert(*args)
+            return
+        added = 0
+        for user_id, time_str, med_list, detected_at, dose_day in alerts:
             if user_id in self.active_user_alerts:
-                existing_alert = self.active_user_alerts[user_id]
-                try:
-                    if existing_alert and existing_alert.winfo_exists():
-                        print(f"[DEBUG] Prevented duplicate alert for user {user_id} - alert already exists")
-                        return
-                    else:
-                        # Clean up stale reference
-                        del self.active_user_alerts[user_id]
-                except:
-                    # Window doesn't exist, clean up
-                    del self.active_user_alerts[user_id]
-            
+                continue  # their own popup is already open
+            if self.alert_dashboard.add(user_id, time_str, med_list, dose_day):
+                added += 1
+                self.alert_timers.watch(user_id, time_str)
+            if detected_at is not None:
+                perf_metrics.observe("alert.latency", (time.perf_counter() - detected_at) * 1000)
+        if added:
             play_alert_sound()
+            log.debug("Alert dashboard: %d new dose(s), %d listed", added, len(self.alert_dashboard.rows))
+
+    def _record_answered_doses(self, doses, user_ids):
+        """Write {user_id: [(med_id, due_at, status)]} in one transaction on a worker thread"""
+        def applied(taken_count):
+            log.info("Applied: %d taken, %d answered", taken_count, sum(len(d) for d in doses.values()))
+            # Refresh user data display if current user was among them
+            if self.current_user and self.current_user[0] in user_ids:
+                self.show_user_data(self.current_user)
+
+        def failed(e):
+            log.error("Error recording doses: %s", e, exc_info=e)
+
+        if doses:
+            self.executor.submit(self.store.apply_doses, doses, on_done=applied, on_error=failed)
+
+    @staticmethod
+    def _group_dashboard_rows(rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row.user_id, row.time_str), {})[row.med_index] = {
+                'alert_key': row.alert_key, 'med': row.med, 'status': row.status, 'dose_day': row.dose_day}
+        return groups
+
+    def _apply_dashboard_doses(self, rows):
+        """Dashboard Apply: acknowledge every answered dose and record them all in one transaction"""
+        doses = {}
+        for (user_id, time_str), med_states in self._group_dashboard_rows(rows).items():
+            # each row keeps the day the scheduler raised it, so a dose answered after midnight stays on its day
+            statuses = [(state['med'].get('med_id'), f"{state['dose_day']} {time_str}", state['status'])
+                        for state in med_states.values() if state['med'].get('med_id')]
+            self._acknowledge_alert(user_id, time_str, med_states, statuses)
+            doses.setdefault(user_id, []).extend(statuses)
+            if not self.alert_dashboard.pending(user_id, time_str):
+                self.alert_timers.settle(user_id, time_str)
+        self._record_answered_doses(doses, set(doses))
+
+    def _dismiss_dashboard_doses(self, rows):
+        """Dashboard closed: mark the remaining alerts handled so they don't re-trigger"""
+        for (user_id, time_str), med_states in self._group_dashboard_rows(rows).items():
+            self._acknowledge_alert(user_id, time_str, med_states)
+            self.alert_timers.settle(user_id, time_str)
+
+    def _snooze_dashboard_doses(self, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row.user_id, row.time_str, row.dose_day), []).append(row.entry)
+        for (user_id, time_str, dose_day), med_list in groups.items():
+            self._snooze_alert(user_id, time_str, med_list, dose_day)
+
+    # ---------- Snooze and escalation ----------
+    def _snooze_alert(self, user_id, time_str, med_list, dose_day):
+        """Put an alert away and bring it back after the snooze delay"""
+        # the scheduler would re-send it within the dose minute; from here on the snooze timer owns it
+        self.scheduler.acknowledge(entry[2] for entry in med_list)
+        self.alert_timers.snooze(user_id, time_str, self._snoozed_alert_due, user_id, time_str, med_list, dose_day,
+                                 settle=not self.alert_dashboard.pending(user_id, time_str))
+        if self.api:
+            self.api.publish("snooze", {"user_id": user_id, "time": time_str,
+                                        "minutes": self.alert_timers.snooze_minutes,
+                                        "med_ids": [entry[0].get('med_id') for entry in med_list]})
+
+    def _snoozed_alert_due(self, user_id, time_str, med_list, dose_day):
+        existing_alert = self.active_user_alerts.get(user_id)
+        if existing_alert is not None and existing_alert.showing:
+            # their popup is showing another dose time; try again in a minute
+            self.alert_timers.after(1, self._snoozed_alert_due, user_id, time_str, med_list, dose_day)
+            return
+        self._show_alerts([(user_id, time_str, med_list, None, dose_day)])
 
-            alert = tk.Toplevel(self.root)
-            alert.title("Medication Alert")
-            
-            # ✅ REGISTER: This alert for the user IMMEDIATELY
-            self.active_user_alerts[user_id] = alert
-            
-            # Dynamic sizing based on number of medications
-            base_height = 150
-            button_height = 100
-            
-            # Determine if we need scrolling
-            needs_scrolling = len(med_list) >= 1
-            
-            if needs_scrolling:
-                med_display_height = 350  # Fixed height for scrollable area
-                total_height = base_height + med_display_height + button_height
-            else:
-                med_height = len(med_list) * 80  # Approximate height per medication
-                total_height = base_height + med_height + button_height
-            
-            alert.geometry(f"500x{total_height}")
-            alert.attributes("-topmost", True)
-            alert.lift()
+    def _alert_pending(self, user_id, time_str):
+        alert = self.active_user_alerts.get(user_id)
+        return (alert is not None and alert.showing) or self.alert_dashboard.pending(user_id, time_str)
 
-            # FIXED: Better offset calculation for multiple user alerts
-            # Use the current count of active alerts to offset horizontally by 300 pixels
-            offset_x = self.active_alert_count * 520
-            offset_y = 50  # Small vertical offset to avoid title bar overlap
-            x = self.root.winfo_x() + offset_x
-            y = self.root.winfo_y() + offset_y
-            alert.geometry(f"500x{total_height}+{x}+{y}")
-            
-            # Increment active alert count
-            self.active_alert_count += 1
+    def _resound_alert(self, user_id, time_str):
+        """Escalation step 1: the alert is still unanswered, sound it again"""
+        if not self._alert_pending(user_id, time_str):
+            return
+        log.info("Alert for user %s at %s still unanswered; sounding again", user_id, time_str,
+                 extra={"user_id": user_id, "dose_time": time_str})
+        play_alert_sound()
+        alert = self.active_user_alerts.get(user_id)
+        (alert.window if alert is not None and alert.showing else self.alert_dashboard.window).lift()
+
+    def _notify_caregiver(self, user_id, time_str):
+        """Escalation step 2: tell the caregiver (log and dashboard event stream)"""
+        if not self._alert_pending(user_id, time_str):
+            return
+        user = self.store.current().user(user_id)
+        name = f"{user.first_name} {user.last_name}" if user else f"user {user_id}"
+        log.warning("%s has not answered the %s dose alert after %d minutes; notifying caregiver",
+                    name, date_codec.format_time_12h(time_str), self.alert_timers.caregiver_minutes,
+                    extra={"user_id": user_id, "dose_time": time_str})
+        if self.api:
+            self.api.publish("escalation", {"user_id": user_id, "name": name, "time": time_str,
+                                            "minutes": self.alert_timers.caregiver_minutes,
+                                            "caregiver": settings.get("caregiver_name")})
+
+    @perf_metrics.timed("alert.popup_show")
+    def trigger_combined_alert(self, user_id, time_str, med_list, detected_at=None, dose_day=None):
+        """Show the combined alert popup for a user's medications due at the same time on dose_day"""
+        try:
+            # ✅ SAFETY CHECK: Don't show an alert if the user already has one open
+            existing_alert = self.active_user_alerts.get(user_id)
+            if existing_alert is not None and existing_alert.showing:
+                log.debug("Prevented duplicate alert for user %s - alert already exists", user_id)
+                return
+
+            # ✅ NEW: Reuse a pre-built window from the warm pool instead of building one
+            alert = self.alert_pool.acquire()
+            self.active_user_alerts[user_id] = alert
 
-            # Header
             user_name = f"{med_list[0][3]} {med_list[0][4]}"  # fname, lname from first medication
-            # Convert 24-hour time to 12-hour format for display
-            try:
-                time_obj = datetime.strptime(time_str, "%H:%M")
-                display_time = time_obj.strftime("%I:%M %p").lstrip('0')
-            except:
-                display_time = time_str
-            
+            display_time = date_codec.format_time_12h(time_str)
             header_text = f"Time for {user_name} to take medications at {display_time}:"
             if len(med_list) > 1:
                 header_text += f" ({len(med_list)} medications)"
-            
-            tk.Label(alert, text=header_text, 
-                    font=("Helvetica", 16, "bold"), wraplength=450).pack(pady=10)
-
-            # Create medication container - scrollable if 5+ medications
-            if needs_scrolling:
-                # Create frame for canvas and scrollbar
-                scroll_container = tk.Frame(alert)
-                scroll_container.pack(fill="both", expand=True, padx=10, pady=5)
-                
-                # Create canvas and scrollbar
-                canvas = tk.Canvas(scroll_container, height=med_display_height, highlightthickness=0)
-                scrollbar = tk.Scrollbar(scroll_container, orient="vertical", command=canvas.yview)
-                scrollable_frame = tk.Frame(canvas)
-                
-                # Configure scrolling
-                def configure_scrollregion(event):
-                    canvas.configure(scrollregion=canvas.bbox("all"))
-                
-                def on_mousewheel_alert(event):
-                    # Handle cross-platform mouse wheel scrolling
-                    if event.num == 4:   # Linux scroll up
-                        canvas.yview_scroll(-1, "units")
-                    elif event.num == 5: # Linux scroll down
-                        canvas.yview_scroll(1, "units")
-                    else:  # Windows and Mac
-                        canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-                
-                scrollable_frame.bind("<Configure>", configure_scrollregion)
-                
-                # Bind mouse wheel events to canvas and scrollable_frame for better coverage
-                canvas.bind("<MouseWheel>", on_mousewheel_alert)
-                canvas.bind("<Button-4>", on_mousewheel_alert)
-                canvas.bind("<Button-5>", on_mousewheel_alert)
-                scrollable_frame.bind("<MouseWheel>", on_mousewheel_alert)
-                scrollable_frame.bind("<Button-4>", on_mousewheel_alert)
-                scrollable_frame.bind("<Button-5>", on_mousewheel_alert)
-                
-                # Also bind to the alert window itself for comprehensive scroll support
-                alert.bind("<MouseWheel>", on_mousewheel_alert)
-                alert.bind("<Button-4>", on_mousewheel_alert)
-                alert.bind("<Button-5>", on_mousewheel_alert)
-                
-                # Create window in canvas
-                canvas_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-                
-                # Configure canvas scrolling
-                canvas.configure(yscrollcommand=scrollbar.set)
-                
-                # Pack canvas and scrollbar
-                canvas.pack(side="left", fill="both", expand=True)
-                scrollbar.pack(side="right", fill="y")
-                
-                # Configure canvas window width to match canvas
-                def configure_canvas_window(event):
-                    canvas.itemconfig(canvas_window, width=canvas.winfo_width())
-                canvas.bind("<Configure>", configure_canvas_window)
-                
-                med_container = scrollable_frame
-                
-                print(f"[DEBUG] Created scrollable container for {len(med_list)} medications")
-            else:
-                # Regular container for fewer medications
-                med_container = tk.Frame(alert)
-                med_container.pack(fill="both", expand=True, padx=10, pady=5)
 
-            # Track medication states
-            med_states = {}  # {med_index: {'taken': BooleanVar, 'skipped': BooleanVar}}
-            
-            # Create medication entries
-            for i, (med, med_index, alert_key, fname, lname) in enumerate(med_list):
-                med_frame = tk.Frame(med_container, relief="ridge", bd=2, padx=10, pady=8)
-                med_frame.pack(fill="x", padx=5, pady=3)
-
-                # Medication info
-                med_name = med.get('medication_name', 'Unknown Medication')
-                dosage = med.get('dosage_instructions', '')
-                stock = med.get('stock', 0)
-                
-                # Medication name and stock info
-                name_frame = tk.Frame(med_frame)
-                name_frame.pack(fill="x")
-                
-                tk.Label(name_frame, text=f"{i+1}. {med_name}", 
-                        font=("Helvetica", 14, "bold")).pack(side="left")
-                tk.Label(name_frame, text=f"Stock: {stock}", 
-                        font=("Helvetica", 10), fg="blue").pack(side="right")
-                
-                if dosage:
-                    tk.Label(med_frame, text=dosage, font=("Helvetica", 10), 
-                            fg="gray", wraplength=400).pack(anchor="w")
-
-                # Individual medication buttons
-                button_frame = tk.Frame(med_frame)
-                button_frame.pack(fill="x", pady=5)
-                
-                # State tracking
-                taken_var = tk.BooleanVar()
-                skipped_var = tk.BooleanVar()
-                med_states[med_index] = {
-                    'taken': taken_var, 
-                    'skipped': skipped_var, 
-                    'alert_key': alert_key,
-                    'med': med
-                }
-
-                def create_taken_callback(idx, t_var, s_var):
-                    def callback():
-                        t_var.set(True)
-                        s_var.set(False)
-                        update_button_colors()
-                    return callback
-
-                def create_skip_callback(idx, t_var, s_var):
-                    def callback():
-                        t_var.set(False)
-                        s_var.set(True)
-                        update_button_colors()
-                    return callback
-
-                taken_btn = tk.Button(button_frame, text="✓ Taken", 
-                                    command=create_taken_callback(med_index, taken_var, skipped_var),
-                                    font=("Helvetica", 11), width=10)
-                taken_btn.pack(side=tk.LEFT, padx=5)
-
-                skip_btn = tk.Button(button_frame, text="✗ Skip", 
-                                   command=create_skip_callback(med_index, taken_var, skipped_var),
-                                   font=("Helvetica", 11), width=10)
-                skip_btn.pack(side=tk.LEFT, padx=5)
-
-                # Store button references for color updates
-                med_states[med_index]['taken_btn'] = taken_btn
-                med_states[med_index]['skip_btn'] = skip_btn
-
-            def update_button_colors():
-                """Update button colors based on selection state"""
-                for med_index, state in med_states.items():
-                    if state['taken'].get():
-                        state['taken_btn'].config(bg="#90EE90", relief="sunken")  # Light green
-                        state['skip_btn'].config(bg="SystemButtonFace", relief="raised")
-                    elif state['skipped'].get():
-                        state['taken_btn'].config(bg="SystemButtonFace", relief="raised")
-                        state['skip_btn'].config(bg="#FFB6C1", relief="sunken")  # Light pink
-                    else:
-                        state['taken_btn'].config(bg="SystemButtonFace", relief="raised")
-                        state['skip_btn'].config(bg="SystemButtonFace", relief="raised")
-
-            # Main action buttons frame
-            main_button_frame = tk.Frame(alert, bg="lightgray", relief="raised", bd=1)
-            main_button_frame.pack(fill="x", pady=10, padx=10)
-
-            # Summary label
-            summary_label = tk.Label(main_button_frame, 
-                                   text=f"Managing {len(med_list)} medication(s) for {user_name}",
-                                   font=("Helvetica", 12), bg="lightgray")
-            summary_label.pack(pady=5)
-
-            # Button container
-            button_container = tk.Frame(main_button_frame, bg="lightgray")
-            button_container.pack(pady=5)
-
-            def take_all_meds():
-                """Mark all medications as taken"""
-                for med_index, state in med_states.items():
-                    state['taken'].set(True)
-                    state['skipped'].set(False)
-                update_button_colors()
-                apply_and_close()
+            # Offset each open alert horizontally so they don't stack
+            offset_x = self.active_alert_count * 520
+            x = self.root.winfo_x() + offset_x
+            y = self.root.winfo_y() + 50
+            self.active_alert_count += 1
+
+            # the scheduler's dose date, so a dose answered or snoozed after midnight stays on its day
+            dose_day = dose_day or self.store.clock.today().isoformat()
+
+            def close_alert():
+                self.alert_timers.settle(user_id, time_str)
+                # ✅ FIXED: Remove this alert from user tracking
+                if self.active_user_alerts.get(user_id) is alert:
+                    del self.active_user_alerts[user_id]
+                # IMPORTANT: Decrement active alert count when closing
+                self.active_alert_count = max(0, self.active_alert_count - 1)
+                alert.release()
 
             def apply_and_close():
                 """Apply all medication states and close the alert"""
-                try:
-                    conn = sqlite3.connect(self.db_path)
-                    c = conn.cursor()
-                    c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
-                    result = c.fetchone()
-                    
-                    taken_count = 0
-                    skipped_count = 0
-                    
-                    if result and result[0]:
-                        meds = json.loads(result[0])
-                        
-                        # Update stock for taken medications
-                        for med_index, state in med_states.items():
-                            if state['taken'].get() and 0 <= med_index < len(meds):
-                                current_stock = meds[med_index].get('stock', 0)
-                                meds[med_index]['stock'] = max(0, current_stock - 1)
-                                taken_count += 1
-                                print(f"[DEBUG] Updated stock for {meds[med_index].get('medication_name')}: {current_stock} -> {meds[med_index]['stock']}")
-                            elif state['skipped'].get():
-                                skipped_count += 1
-                            
-                            # Mark as alerted regardless of taken/skipped
-                            alerted_today.add(state['alert_key'])
-                        
-                        # Save updated medication data
-                        c.execute("UPDATE users SET medication_data = ? WHERE user_id = ?", 
-                                (json.dumps(meds), user_id))
-                        conn.commit()
-                    
-                    conn.close()
-                    
-                    # Show summary message
-                    if taken_count > 0 or skipped_count > 0:
-                        summary_msg = f"Applied: {taken_count} taken, {skipped_count} skipped"
-                        print(f"[DEBUG] {summary_msg}")
-                    
-                    # ✅ FIXED: Remove this alert from user tracking
-                    if user_id in self.active_user_alerts:
-                        del self.active_user_alerts[user_id]
-                    
-                    # IMPORTANT: Decrement active alert count when closing
-                    self.active_alert_count = max(0, self.active_alert_count - 1)
-                    alert.destroy()
-                    
-                    # Refresh user data display if current user matches
-                    if self.current_user and self.current_user[0] == user_id:
-                        self.users = self.fetch_users()
-                        self.show_user_data(self.current_user)
-                    
-                except Exception as e:
-                    print(f"Error updating medication stocks: {e}")
-                    # ✅ FIXED: Remove this alert from user tracking even on error
-                    if user_id in self.active_user_alerts:
-                        del self.active_user_alerts[user_id]
-                    # IMPORTANT: Decrement active alert count even on error
-                    self.active_alert_count = max(0, self.active_alert_count - 1)
-                    alert.destroy()
+                med_states = alert.states
+                # Record taken/skipped against the materialized dose instances
+                due_at = f"{dose_day} {time_str}"
+                statuses = [(state['med'].get('med_id'), due_at, 'taken' if state['taken'].get() else 'skipped')
+                            for state in med_states.values()
+                            if state['med'].get('med_id') and (state['taken'].get() or state['skipped'].get())]
+                # Mark as alerted regardless of taken/skipped
+                self._acknowledge_alert(user_id, time_str, med_states, statuses)
+                # Stock and dose statuses are written together on a worker
+                self._record_answered_doses({user_id: statuses} if statuses else {}, {user_id})
+                close_alert()
 
             def cancel_alert():
                 """Close alert without making changes, but mark as alerted to prevent re-triggering"""
-                # Mark individual medications as alerted
-                for med_index, state in med_states.items():
-                    alerted_today.add(state['alert_key'])
-                
-                # ✅ FIXED: Remove this alert from user tracking
-                if user_id in self.active_user_alerts:
-                    del self.active_user_alerts[user_id]
-                
-                # IMPORTANT: Decrement active alert count when canceling
-                self.active_alert_count = max(0, self.active_alert_count - 1)
-                alert.destroy()
-
-            # Add window close protocol to handle X button clicks
-            def on_closing():
-                """Handle window close button (X)"""
-                # Mark individual medications as alerted
-                for med_index, state in med_states.items():
-                    alerted_today.add(state['alert_key'])
-                
-                # ✅ FIXED: Remove this alert from user tracking
-                if user_id in self.active_user_alerts:
-                    del self.active_user_alerts[user_id]
-                
-                # Decrement active alert count
-                self.active_alert_count = max(0, self.active_alert_count - 1)
-                alert.destroy()
-            
-            alert.protocol("WM_DELETE_WINDOW", on_closing)
+                self._acknowledge_alert(user_id, time_str, alert.states)
+                close_alert()
 
-            # Main buttons
-            tk.Button(button_container, text="✓ All Meds Taken", command=take_all_meds,
-                     font=("Helvetica", 12, "bold"), bg="#90EE90", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
-            
-            tk.Button(button_container, text="Apply Selections", command=apply_and_close,
-                     font=("Helvetica", 12, "bold"), bg="#87CEEB", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
-            
-            tk.Button(button_container, text="Cancel", command=cancel_alert,
-                     font=("Helvetica", 12), bg="#F0F0F0", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
+            def snooze_alert():
+                self._snooze_alert(user_id, time_str, med_list, dose_day)
+                close_alert()
+
+            alert.show(header_text, f"Managing {len(med_list)} medication(s) for {user_name}", med_list, x, y,
+                       on_apply=apply_and_close, on_cancel=cancel_alert, on_snooze=snooze_alert,
+                       snooze_text=f"Snooze {self.alert_timers.snooze_minutes} min")
+            play_alert_sound()
+            self.alert_timers.watch(user_id, time_str)
+
+            log.debug("Showed combined alert for %d medications, offset: %dpx", len(med_list), offset_x)
+            if detected_at is not None:
+                # Scheduler event -> popup shown, including time queued behind other Tk work
+                perf_metrics.observe("alert.latency", (time.perf_counter() - detected_at) * 1000)
 
-            # Initialize button colors
-            update_button_colors()
-            
-            # If scrollable, scroll to top
-            if needs_scrolling:
-                canvas.yview_moveto(0)
-            
-            print(f"[DEBUG] Created combined alert for {len(med_list)} medications, scrollable: {needs_scrolling}, offset: {offset_x}px")
-            
         except Exception as e:
-            print(f"Error creating combined medication alert: {e}")
+            log.exception("Error creating combined medication alert: %s", e)
             # Ensure we don't leave the counter in an inconsistent state
             self.active_alert_count = max(0, self.active_alert_count - 1)
 #--------------------------------------------------------------------
@@ -1278,8 +1261,8 @@ class MedicationApp:
 def main():
     """Main function to start the application"""
     try:
-        # Initialize database tables
-        setup_tables()
+        med_logging.setup_logging(settings)
+        perf_metrics.start_periodic_dump()
         
         # Create the main window
         root = tk.Tk()
@@ -1291,7 +1274,7 @@ def main():
         root.mainloop()
         
     except Exception as e:
-        print(f"Error starting application: {e}")
+        log.exception("Error starting application: %s", e)
         messagebox.showerror("Application Error", f"Failed to start application:\n{str(e)}")
 
 
@@ -1,16 +1,20 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, filedialog
 import sqlite3
 import json
 import os
 import importlib.util
 import subprocess
 import sys
+import bulk_import
+import db_backup
 
 DB_PATH = 'medication_time_db.db'
 
 def create_database_and_launch_app(user_inputs):
     if os.path.exists(DB_PATH):
+        # ✅ NEW: Keep a restorable copy before starting over
+        db_backup.backup_database(DB_PATH, label="pre-reset", generations=None)
         os.remove(DB_PATH)
 
     conn = sqlite3.connect(DB_PATH)
@@ -63,8 +67,10 @@ def confirm_and_delete_db():
         confirm = messagebox.askyesno("Confirm Deletion", "Are you sure you want to delete the existing database?")
         if confirm:
             try:
+                backup = db_backup.backup_database(DB_PATH, label="pre-reset", generations=None)
                 os.remove(DB_PATH)
-                messagebox.showinfo("Deleted", "Database file deleted successfully.")
+                messagebox.showinfo("Deleted", "Database file deleted successfully.\n"
+                                               f"A backup was saved to {backup.path}")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to delete the database: {e}")
         else:
@@ -72,10 +78,33 @@ def confirm_and_delete_db():
     else:
         messagebox.showinfo("Not Found", "No database file found to delete.")
 
+def import_household_file():
+    """Bulk import users/medications/journals into the existing database (non-destructive)"""
+    path = filedialog.askopenfilename(title="Select household file",
+                                      filetypes=[("Household files", "*.json *.csv"), ("All files", "*.*")])
+    if not path:
+        return
+    try:
+        # ✅ NEW: A .csv is a single users, medications or journals file; anything else a JSON household
+        records = bulk_import.load_file(path)
+        preview = bulk_import.import_household(DB_PATH, *records, dry_run=True)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        messagebox.showerror("Import Failed", str(e))
+        return
+
+    if not messagebox.askyesno("Confirm Import", bulk_import.format_summary(preview) + "\n\nContinue?"):
+        return
+    try:
+        summary = bulk_import.import_household(DB_PATH, *records)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        messagebox.showerror("Import Failed", str(e))
+        return
+    messagebox.showinfo("Imported", bulk_import.format_summary(summary))
+
 # ---------- GUI Setup ----------
 root = tk.Tk()
 root.title("Initialize Medication Database")
-root.geometry("400x250")
+root.geometry("400x290")
 
 frame = tk.Frame(root)
 frame.pack(pady=10)
@@ -96,6 +125,10 @@ for i in range(4):
 tk.Button(root, text="Create Database and Launch App", font=("Helvetica", 12, "bold"),
           command=lambda: create_database_and_launch_app([(f.get(), l.get()) for f, l in entries])).pack(pady=10)
 
+# ✅ NEW: Bulk import into the existing database without deleting it
+tk.Button(root, text="Import Household File...", font=("Helvetica", 10),
+          command=import_household_file).pack(pady=5)
+
 # 🔴 Add Delete DB button here
 tk.Button(root, text="Delete Existing Database", font=("Helvetica", 10),
           command=confirm_and_delete_db, fg="red").pack(pady=5)
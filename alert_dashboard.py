@@ -0,0 +1,211 @@
+"""
+One household-wide window for doses that fall due together.
+
+With several people due at the same minute, one popup per person (each
+offset 520 px to the right) ran off the screen after two or three. The
+AlertDashboard lists every pending dose in a single ttk.Treeview instead:
+one parent row per person and dose time, one child row per medication.
+Selecting a person's row selects all their doses, so a whole household can
+be marked with a couple of clicks, and Apply hands every answered dose to
+the app in one call (MedicationStore.apply_doses writes them in a single
+transaction).
+
+The window is built once and withdrawn when empty; all methods must be
+called on the Tk thread.
+"""
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+import perf_metrics
+from date_codec import format_time_12h
+
+log = logging.getLogger("medtime.alerts")
+
+MIN_USERS = 2                 # this many people with open alerts switch to the dashboard
+STATUS_TEXT = {None: "", "taken": "✓ Taken", "skipped": "✗ Skip"}
+
+
+class DoseRow:
+    __slots__ = ("user_id", "user_name", "time_str", "dose_day", "entry", "status")
+
+    def __init__(self, user_id, user_name, time_str, entry, dose_day):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.time_str = time_str
+        self.dose_day = dose_day  # "YYYY-MM-DD" the dose is due on, from the scheduler event
+        self.entry = entry        # (med, med_index, alert_key, fname, lname) as the scheduler sent it
+        self.status = None
+
+    @property
+    def med(self):
+        return self.entry[0]
+
+    @property
+    def med_index(self):
+        return self.entry[1]
+
+    @property
+    def alert_key(self):
+        return self.entry[2]
+
+
+class AlertDashboard:
+    """
+    on_apply(rows) gets the answered DoseRows when Apply is pressed,
+    on_snooze(rows) the selected ones when Snooze is pressed and
+    on_dismiss(rows) the unanswered ones when the window is closed.
+    """
+    def __init__(self, root, on_apply, on_dismiss, on_snooze=None):
+        self.root = root
+        self.on_apply = on_apply
+        self.on_dismiss = on_dismiss
+        self.on_snooze = on_snooze
+        self.window = None
+        self.rows = {}            # tree item id -> DoseRow
+        self._groups = {}         # (user_id, time_str) -> parent item id
+
+    def pending(self, user_id, time_str):
+        return (user_id, time_str) in self._groups
+
+    @property
+    def showing(self):
+        return self.window is not None and self.window.state() != "withdrawn"
+
+    def _build(self):
+        self.window = tk.Toplevel(self.root)
+        self.window.withdraw()
+        self.window.title("Medication Alerts")
+        self.window.geometry("760x520")
+        self.window.attributes("-topmost", True)
+        self.window.protocol("WM_DELETE_WINDOW", self.dismiss)
+
+        self.header = tk.Label(self.window, font=("Helvetica", 16, "bold"))
+        self.header.pack(pady=10)
+
+        frame = tk.Frame(self.window)
+        frame.pack(fill="both", expand=True, padx=10)
+        columns = ("medication", "dosage", "stock", "status")
+        self.tree = ttk.Treeview(frame, columns=columns, selectmode="extended")
+        self.tree.heading("#0", text="Person / Time")
+        self.tree.column("#0", width=200)
+        for col, heading, width in zip(columns, ("Medication", "Dosage", "Stock", "Status"), (170, 230, 60, 80)):
+            self.tree.heading(col, text=heading)
+            self.tree.column(col, width=width)
+        self.tree.tag_configure("taken", background="#90EE90")
+        self.tree.tag_configure("skipped", background="#FFB6C1")
+        self.tree.tag_configure("group", font=("Helvetica", 11, "bold"))
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.bind("<Double-1>", self._toggle)
+
+        buttons = tk.Frame(self.window, bg="lightgray", relief="raised", bd=1)
+        buttons.pack(fill="x", pady=10, padx=10)
+        for text, command, bg in (("✓ Selected Taken", lambda: self.mark("taken"), "#90EE90"),
+                                  ("✗ Selected Skipped", lambda: self.mark("skipped"), "#FFB6C1"),
+                                  ("Snooze Selected", self.snooze, "#FFE4B5"),
+                                  ("Select All", self.select_all, "#F0F0F0"),
+                                  ("Apply", self.apply, "#87CEEB"),
+                                  ("Close", self.dismiss, "#F0F0F0")):
+            tk.Button(buttons, text=text, command=command, bg=bg,
+                      font=("Helvetica", 11, "bold")).pack(side=tk.LEFT, padx=5, pady=5)
+
+    # ---------- Filling ----------
+    @perf_metrics.timed("alert.dashboard_add")
+    def add(self, user_id, time_str, med_list, dose_day):
+        """Add one scheduler alert (the med_list of trigger_combined_alert) due on dose_day; returns rows added"""
+        if self.window is None:
+            self._build()
+        known = {row.alert_key for row in self.rows.values()}
+        fresh = [entry for entry in med_list if entry[2] not in known]
+        if not fresh:
+            return 0
+        user_name = f"{med_list[0][3]} {med_list[0][4]}"
+        group = self._groups.get((user_id, time_str))
+        if group is None:
+            group = self.tree.insert("", tk.END, text=f"{user_name} — {format_time_12h(time_str)}",
+                                     open=True, tags=("group",))
+            self._groups[(user_id, time_str)] = group
+        for entry in fresh:
+            med = entry[0]
+            item = self.tree.insert(group, tk.END, values=(med.get("medication_name", "Unknown Medication"),
+                                                           med.get("dosage_instructions", ""),
+                                                           med.get("stock", 0), ""))
+            self.rows[item] = DoseRow(user_id, user_name, time_str, entry, dose_day)
+        self._refresh_header()
+        if not self.showing:
+            self.window.deiconify()
+        self.window.lift()
+        return len(fresh)
+
+    def _refresh_header(self):
+        people = len({row.user_id for row in self.rows.values()})
+        self.header.config(text=f"{len(self.rows)} dose(s) due for {people} people")
+
+    # ---------- Actions ----------
+    def _selected_rows(self):
+        """Selected dose items; a selected person/time row stands for all of its doses"""
+        items = []
+        for item in self.tree.selection():
+            items.extend(self.tree.get_children(item) if item not in self.rows else (item,))
+        return list(dict.fromkeys(items))
+
+    def _set_status(self, item, status):
+        row = self.rows[item]
+        row.status = status
+        self.tree.set(item, "status", STATUS_TEXT[status])
+        self.tree.item(item, tags=(status,) if status else ())
+
+    def mark(self, status):
+        for item in self._selected_rows():
+            self._set_status(item, status)
+
+    def select_all(self):
+        self.tree.selection_set(self.tree.get_children(""))
+
+    def _toggle(self, event):
+        item = self.tree.identify_row(event.y)
+        if item in self.rows:
+            self._set_status(item, "skipped" if self.rows[item].status == "taken" else "taken")
+
+    def _remove(self, items):
+        for item in items:
+            del self.rows[item]
+            self.tree.delete(item)
+        for key, group in list(self._groups.items()):
+            if not self.tree.get_children(group):
+                self.tree.delete(group)
+                del self._groups[key]
+        if self.rows:
+            self._refresh_header()
+        else:
+            self.window.withdraw()
+
+    def apply(self):
+        """Hand the answered doses to on_apply and drop them; unanswered ones stay listed"""
+        answered = [item for item, row in self.rows.items() if row.status]
+        if not answered:
+            return
+        rows = [self.rows[item] for item in answered]
+        self._remove(answered)
+        self.on_apply(rows)
+
+    def snooze(self):
+        """Hand the selected doses to on_snooze and drop them until they come back"""
+        items = self._selected_rows()
+        if not items or self.on_snooze is None:
+            return
+        rows = [self.rows[item] for item in items]
+        self._remove(items)
+        self.on_snooze(rows)
+
+    def dismiss(self):
+        """Close the window; doses nobody answered are handed to on_dismiss"""
+        if self.window is None:
+            return
+        rows = list(self.rows.values())
+        self._remove(list(self.rows))
+        if rows:
+            self.on_dismiss(rows)
@@ -0,0 +1,208 @@
+"""
+Warm pool of dose alert windows.
+
+Building an alert from scratch (Toplevel, canvas, scrollbar, a frame per
+medication, buttons and their bindings) and destroying it afterwards made
+popups lag, especially when several people are due at the same minute.
+AlertWindowPool keeps a few fully built, withdrawn AlertWindows instead.
+Showing an alert only reconfigures label text, hides or reveals medication
+rows and deiconifies the window; closing it withdraws it back into the pool.
+Medication rows are created once and reused, and a window grows extra rows
+only when an alert has more medications than it has seen before.
+
+All methods must be called on the Tk thread.
+"""
+import logging
+import time
+import tkinter as tk
+
+import perf_metrics
+
+log = logging.getLogger("medtime.alerts")
+
+POOL_SIZE = 3                 # warm windows; more are built on demand and kept
+PREBUILT_ROWS = 4
+WIDTH, HEIGHT = 500, 600
+TAKEN_BG, SKIPPED_BG = "#90EE90", "#FFB6C1"
+
+
+class _MedRow:
+    """One medication's frame inside an AlertWindow"""
+    def __init__(self, parent):
+        self.frame = tk.Frame(parent, relief="ridge", bd=2, padx=10, pady=8)
+        name_frame = tk.Frame(self.frame)
+        name_frame.pack(fill="x")
+        self.name = tk.Label(name_frame, font=("Helvetica", 14, "bold"))
+        self.name.pack(side="left")
+        self.stock = tk.Label(name_frame, font=("Helvetica", 10), fg="blue")
+        self.stock.pack(side="right")
+        self.dosage = tk.Label(self.frame, font=("Helvetica", 10), fg="gray", wraplength=400)
+        self.dosage.pack(anchor="w")
+
+        button_frame = tk.Frame(self.frame)
+        button_frame.pack(fill="x", pady=5)
+        self.taken = tk.BooleanVar()
+        self.skipped = tk.BooleanVar()
+        self.taken_btn = tk.Button(button_frame, text="✓ Taken", font=("Helvetica", 11), width=10,
+                                   command=lambda: self.choose(True))
+        self.taken_btn.pack(side=tk.LEFT, padx=5)
+        self.skip_btn = tk.Button(button_frame, text="✗ Skip", font=("Helvetica", 11), width=10,
+                                  command=lambda: self.choose(False))
+        self.skip_btn.pack(side=tk.LEFT, padx=5)
+        self.default_bg = self.taken_btn.cget("bg")
+
+    def fill(self, number, med):
+        self.name.config(text=f"{number}. {med.get('medication_name', 'Unknown Medication')}")
+        self.stock.config(text=f"Stock: {med.get('stock', 0)}")
+        self.dosage.config(text=med.get('dosage_instructions', ''))
+        self.taken.set(False)
+        self.skipped.set(False)
+        self.paint()
+
+    def choose(self, taken):
+        self.taken.set(taken)
+        self.skipped.set(not taken)
+        self.paint()
+
+    def paint(self):
+        taken, skipped = self.taken.get(), self.skipped.get()
+        self.taken_btn.config(bg=TAKEN_BG if taken else self.default_bg, relief="sunken" if taken else "raised")
+        self.skip_btn.config(bg=SKIPPED_BG if skipped else self.default_bg, relief="sunken" if skipped else "raised")
+
+
+class AlertWindow:
+    """A reusable, initially withdrawn alert popup"""
+    def __init__(self, root, pool):
+        self.pool = pool
+        self.showing = False
+        self.states = {}
+        self._handlers = {}
+
+        self.window = tk.Toplevel(root)
+        self.window.withdraw()
+        self.window.title("Medication Alert")
+        self.window.attributes("-topmost", True)
+        self.window.protocol("WM_DELETE_WINDOW", lambda: self._fire("close"))
+
+        self.header = tk.Label(self.window, font=("Helvetica", 16, "bold"), wraplength=450)
+        self.header.pack(pady=10)
+
+        scroll_container = tk.Frame(self.window)
+        scroll_container.pack(fill="both", expand=True, padx=10, pady=5)
+        self.canvas = tk.Canvas(scroll_container, height=350, highlightthickness=0)
+        scrollbar = tk.Scrollbar(scroll_container, orient="vertical", command=self.canvas.yview)
+        self.rows_frame = tk.Frame(self.canvas)
+        self.rows_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        canvas_window = self.canvas.create_window((0, 0), window=self.rows_frame, anchor="nw")
+        self.canvas.bind("<Configure>", lambda e: self.canvas.itemconfig(canvas_window, width=e.width))
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        # one set of wheel bindings on the toplevel covers every child widget
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.window.bind(sequence, self._on_mousewheel)
+
+        main_button_frame = tk.Frame(self.window, bg="lightgray", relief="raised", bd=1)
+        main_button_frame.pack(fill="x", pady=10, padx=10)
+        self.summary = tk.Label(main_button_frame, font=("Helvetica", 12), bg="lightgray")
+        self.summary.pack(pady=5)
+        button_container = tk.Frame(main_button_frame, bg="lightgray")
+        button_container.pack(pady=5)
+        tk.Button(button_container, text="✓ All Meds Taken", command=self._take_all,
+                  font=("Helvetica", 12, "bold"), bg=TAKEN_BG, padx=15, pady=5).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_container, text="Apply Selections", command=lambda: self._fire("apply"),
+                  font=("Helvetica", 12, "bold"), bg="#87CEEB", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
+        self.snooze_btn = tk.Button(button_container, text="Snooze", command=lambda: self._fire("snooze"),
+                                    font=("Helvetica", 12), bg="#FFE4B5", padx=15, pady=5)
+        self.snooze_btn.pack(side=tk.LEFT, padx=5)
+        tk.Button(button_container, text="Cancel", command=lambda: self._fire("cancel"),
+                  font=("Helvetica", 12), bg="#F0F0F0", padx=15, pady=5).pack(side=tk.LEFT, padx=5)
+
+        self.rows = [_MedRow(self.rows_frame) for _ in range(PREBUILT_ROWS)]
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:     # Linux scroll up
+            self.canvas.yview_scroll(-1, "units")
+        elif event.num == 5:   # Linux scroll down
+            self.canvas.yview_scroll(1, "units")
+        else:                  # Windows and Mac
+            self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+
+    def _take_all(self):
+        for state in self.states.values():
+            state['row'].choose(True)
+        self._fire("apply")
+
+    def _fire(self, action):
+        handler = self._handlers.get(action) or self._handlers.get("close")
+        if self.showing and handler:
+            handler()
+
+    def show(self, header, summary, med_list, x, y, on_apply, on_cancel, on_close=None, on_snooze=None,
+             snooze_text="Snooze"):
+        """
+        Fill the window for med_list [(med, med_index, alert_key, fname, lname)] and show it.
+
+        self.states maps med_index -> {'taken', 'skipped', 'alert_key', 'med', 'row'};
+        the handlers read it and then call release().
+        """
+        while len(self.rows) < len(med_list):
+            self.rows.append(_MedRow(self.rows_frame))
+
+        self.header.config(text=header)
+        self.summary.config(text=summary)
+        self.states = {}
+        for i, row in enumerate(self.rows):
+            if i < len(med_list):
+                med, med_index, alert_key, _, _ = med_list[i]
+                row.fill(i + 1, med)
+                row.frame.pack(fill="x", padx=5, pady=3)
+                self.states[med_index] = {'taken': row.taken, 'skipped': row.skipped,
+                                          'alert_key': alert_key, 'med': med, 'row': row}
+            else:
+                row.frame.pack_forget()
+        self._handlers = {"apply": on_apply, "cancel": on_cancel, "close": on_close or on_cancel,
+                          "snooze": on_snooze}
+        self.snooze_btn.config(text=snooze_text, state="normal" if on_snooze else "disabled")
+
+        self.window.geometry(f"{WIDTH}x{HEIGHT}+{x}+{y}")
+        self.canvas.yview_moveto(0)
+        self.showing = True
+        self.window.deiconify()
+        self.window.lift()
+
+    def release(self):
+        """Hide the window and hand it back to the pool"""
+        if not self.showing:
+            return
+        self.showing = False
+        self._handlers = {}
+        self.states = {}
+        self.window.withdraw()
+        self.pool.release(self)
+
+
+class AlertWindowPool:
+    def __init__(self, root, size=POOL_SIZE):
+        self.root = root
+        self.size = size
+        self._free = []
+
+    def prewarm(self):
+        """Build the warm windows (call once the main window is up, e.g. via after_idle)"""
+        start = time.perf_counter()
+        while len(self._free) < self.size:
+            self._free.append(AlertWindow(self.root, self))
+        perf_metrics.observe("alert.pool_prewarm", (time.perf_counter() - start) * 1000)
+
+    def acquire(self):
+        if self._free:
+            perf_metrics.count("alert.pool_hit")
+            return self._free.pop()
+        perf_metrics.count("alert.pool_miss")
+        log.debug("Alert window pool empty; building another window")
+        return AlertWindow(self.root, self)
+
+    def release(self, window):
+        # windows built on demand beyond the pool size are kept too: bursts tend to repeat daily
+        self._free.append(window)
@@ -0,0 +1,100 @@
+"""
+Snooze and escalation timers for open dose alerts.
+
+Every alert shown gets two escalation timers: after escalate_minutes
+still unanswered it sounds again, and after caregiver_minutes the
+caregiver is notified. Answering, dismissing or snoozing the alert cancels
+them. Snooze re-shows the alert snooze_minutes later.
+
+Timers live in a TimingWheel, so thousands of them cost O(1) each to set
+and cancel. The scheduler thread never looks at them: the app calls poll()
+from its 50 ms Tk loop, which does nothing until a timer is due. Like the
+wheel, AlertTimers must only be used from one thread (the Tk thread).
+"""
+import logging
+import time
+
+import perf_metrics
+from timing_wheel import TimingWheel
+
+log = logging.getLogger("medtime.alerts")
+
+SNOOZE_MINUTES = 10
+ESCALATE_MINUTES = 10
+CAREGIVER_MINUTES = 30
+
+
+class AlertTimers:
+    """
+    on_resound(user_id, time_str) and on_caregiver(user_id, time_str) run
+    when an alert goes unanswered; clock() returns seconds (monotonic).
+    """
+    def __init__(self, on_resound, on_caregiver, snooze_minutes=SNOOZE_MINUTES,
+                 escalate_minutes=ESCALATE_MINUTES, caregiver_minutes=CAREGIVER_MINUTES, clock=time.monotonic):
+        self.on_resound = on_resound
+        self.on_caregiver = on_caregiver
+        self.snooze_minutes = snooze_minutes
+        self.escalate_minutes = escalate_minutes
+        self.caregiver_minutes = caregiver_minutes
+        self.clock = clock
+        self.wheel = TimingWheel(clock())
+        self._escalations = {}     # (user_id, time_str) -> [Timer]
+
+    @classmethod
+    def from_settings(cls, settings, on_resound, on_caregiver, **kwargs):
+        return cls(on_resound, on_caregiver,
+                   snooze_minutes=settings.get("snooze_minutes", SNOOZE_MINUTES),
+                   escalate_minutes=settings.get("escalate_after_minutes", ESCALATE_MINUTES),
+                   caregiver_minutes=settings.get("caregiver_after_minutes", CAREGIVER_MINUTES), **kwargs)
+
+    def poll(self):
+        """Fire whatever is due; returns the number of timers fired"""
+        return self.wheel.advance(self.clock())
+
+    def watch(self, user_id, time_str):
+        """Start the escalation timers for an alert that was just shown (no-op if already running)"""
+        key = (user_id, time_str)
+        if key in self._escalations:
+            return
+        now = self.clock()
+        timers = []
+        if self.escalate_minutes:
+            timers.append(self.wheel.schedule(now + self.escalate_minutes * 60, self._resound, key))
+        if self.caregiver_minutes:
+            timers.append(self.wheel.schedule(now + self.caregiver_minutes * 60, self._caregiver, key))
+        self._escalations[key] = timers
+
+    def settle(self, user_id, time_str):
+        """The alert was answered or dismissed: cancel its escalation"""
+        for timer in self._escalations.pop((user_id, time_str), ()):
+            self.wheel.cancel(timer)
+
+    def after(self, minutes, callback, *args):
+        """Call callback(*args) in `minutes`; returns the Timer"""
+        return self.wheel.schedule(self.clock() + minutes * 60, callback, *args)
+
+    def snooze(self, user_id, time_str, callback, *args, minutes=None, settle=True):
+        """
+        Call callback(*args) after the snooze delay. With settle=True the
+        alert's escalation is cancelled too; pass False when only part of
+        the alert was snoozed and the rest is still waiting for an answer.
+        """
+        if settle:
+            self.settle(user_id, time_str)
+        minutes = self.snooze_minutes if minutes is None else minutes
+        perf_metrics.count("alert.snoozed")
+        log.info("Alert for user %s at %s snoozed for %s minutes", user_id, time_str, minutes,
+                 extra={"user_id": user_id, "dose_time": time_str})
+        return self.after(minutes, callback, *args)
+
+    def _resound(self, key):
+        perf_metrics.count("alert.escalated")
+        self.on_resound(*key)
+
+    def _caregiver(self, key):
+        self._escalations.pop(key, None)
+        perf_metrics.count("alert.caregiver_notified")
+        self.on_caregiver(*key)
+
+    def __len__(self):
+        return len(self.wheel)
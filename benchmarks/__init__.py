@@ -0,0 +1,8 @@
+"""
+Benchmarks for Medication Time.
+
+    python -m benchmarks.run --users 4 --meds 10 --years 3
+    python -m benchmarks.run --users 200 --meds 15 --years 5 --compare benchmarks/results/<old>.json
+
+See benchmarks/household.py for the synthetic household generator.
+"""
@@ -0,0 +1,82 @@
+"""
+Facility-mode scaling benchmark.
+
+Generates a care home with many residents and measures schedule-evaluation
+throughput with 1..N shard processes. Every tick reloads the shard's
+residents and rebuilds its dose index (the worst case, as if the data changed
+between every tick), then finds the doses due at a busy minute.
+
+Run from the repository root:
+
+    python -m benchmarks.facility --residents 400 --processes 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from benchmarks.household import generate_household
+
+
+def shard_ticks(db_path, shard, shards, now, ticks):
+    """Run `ticks` cold schedule evaluations for one shard; returns (residents, seconds)"""
+    from med_logic import build_time_index, find_due_doses
+    from med_store import MedicationStore
+
+    store = MedicationStore(db_path, shard=(shard, shards), read_only=True)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        store.refresh(force=True)
+        users = store.current().users
+        find_due_doses(users, now, set(), build_time_index(users))
+    return len(users), time.perf_counter() - start
+
+
+def _warm_up(_):
+    return os.getpid()
+
+
+def run(db_path, processes, now, ticks):
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+        # warm the pool so process start-up is not timed
+        list(pool.map(_warm_up, range(processes)))
+        start = time.perf_counter()
+        futures = [pool.submit(shard_ticks, db_path, shard, processes, now, ticks) for shard in range(processes)]
+        results = [f.result() for f in futures]
+        wall = time.perf_counter() - start
+    residents = sum(r for r, _ in results)
+    slowest = max(s for _, s in results)
+    return residents * ticks / wall, wall, slowest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark facility-mode sharding.")
+    parser.add_argument("--residents", type=int, default=400)
+    parser.add_argument("--meds", type=int, default=8, help="medications per resident")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--processes", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    today = date.today()
+    now = datetime.combine(today, datetime.strptime("09:00", "%H:%M").time())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "facility.db")
+        print(f"Generating facility: {args.residents} residents x {args.meds} meds")
+        generate_household(db_path, users=args.residents, meds=args.meds, years=0, seed=args.seed, today=today)
+
+        print(f"Evaluating {args.ticks} cold ticks per shard ({os.cpu_count()} CPUs available):")
+        baseline = None
+        for processes in args.processes:
+            rate, wall, slowest = run(db_path, processes, now, args.ticks)
+            baseline = baseline or rate
+            print(f"  {processes:>2} process(es)  {rate:>10.0f} resident-ticks/s   wall {wall:6.2f} s   "
+                  f"slowest shard {slowest:6.2f} s   (x{rate / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    main()
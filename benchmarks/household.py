@@ -0,0 +1,99 @@
+"""
+Synthetic household generator.
+
+Builds a database with N users, M medications each and K years of daily
+journal entries. Dosage frequencies, dose times, stop dates and the
+date_prescribed format (YYYY-MM-DD vs MM-DD-YYYY) are mixed the same way real
+databases end up after years of edits with different app versions.
+"""
+import json
+import random
+import sqlite3
+from datetime import date, timedelta
+
+
+DOSAGE_OPTIONS = [
+    "once per day",
+    "twice daily",
+    "three times daily",
+    "every other day",
+    "once per week",
+    "once per month"
+]
+DOSE_TIMES = ["09:00", "15:30", "21:00", "03:30"]
+
+JOURNAL_LINES = [
+    "Felt fine today.",
+    "A little dizzy after the morning dose.",
+    "Slept badly, headache in the afternoon.",
+    "Good energy, went for a walk.",
+    "Nausea after lunch, better by evening.",
+]
+
+
+def make_medication(rng, index, today):
+    """Return one medication dict with a random schedule and date format"""
+    prescribed = today - timedelta(days=rng.randint(0, 3 * 365))
+    if rng.random() < 0.5:
+        date_prescribed = prescribed.isoformat()
+    else:
+        date_prescribed = prescribed.strftime("%m-%d-%Y")
+
+    roll = rng.random()
+    if roll < 0.15:
+        stop_after_date = (today - timedelta(days=rng.randint(1, 365))).isoformat()  # expired
+    elif roll < 0.5:
+        stop_after_date = (today + timedelta(days=rng.randint(1, 365))).isoformat()
+    else:
+        stop_after_date = None
+
+    return {
+        "medication_name": f"Med{index:03d}",
+        "doctor_name": f"Dr. {rng.choice('ABCDEFGH')}",
+        "date_prescribed": date_prescribed,
+        "stop_after_date": stop_after_date,
+        "dosage_instructions": rng.choice(DOSAGE_OPTIONS),
+        "stock": rng.randint(0, 120),
+        "scheduled_times": sorted(rng.sample(DOSE_TIMES, rng.randint(1, len(DOSE_TIMES))))
+    }
+
+
+def create_legacy_tables(conn):
+    """The two tables of a database from before schema versioning, so opening it runs every migration"""
+    conn.execute("CREATE TABLE IF NOT EXISTS users "
+                 "(user_id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, medication_data TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS user_journals "
+                 "(entry_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, date TEXT, journal_text TEXT)")
+
+
+def generate_household(db_path, users=4, meds=10, years=1, seed=1, today=None):
+    """Populate db_path with a synthetic household; returns a dict of counts"""
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    user_rows = []
+    for uid in range(1, users + 1):
+        med_list = [make_medication(rng, i, today) for i in range(meds)]
+        user_rows.append((uid, f"User{uid}", "Bench", json.dumps(med_list)))
+
+    journal_rows = []
+    for uid in range(1, users + 1):
+        day = today - timedelta(days=int(years * 365))
+        while day <= today:
+            if rng.random() < 0.7:
+                journal_rows.append((uid, day.isoformat(), rng.choice(JOURNAL_LINES)))
+            day += timedelta(days=1)
+
+    conn = sqlite3.connect(db_path)
+    create_legacy_tables(conn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, first_name, last_name, medication_data) VALUES (?, ?, ?, ?)",
+            user_rows)
+        conn.executemany(
+            "INSERT INTO user_journals (user_id, date, journal_text) VALUES (?, ?, ?)",
+            journal_rows)
+    conn.close()
+
+    return {"users": users, "meds_per_user": meds, "years": years,
+            "medications": users * meds, "journal_entries": len(journal_rows)}
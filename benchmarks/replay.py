@@ -0,0 +1,180 @@
+"""
+Year-in-seconds replay of the alert scheduler.
+
+Runs the real AlertScheduler and MedicationStore on a SimulatedClock. The
+scheduler ticks every --interval simulated seconds exactly as the app does,
+including the midnight reset and daily maintenance (archiving, dose-horizon
+roll), and every alert it raises is acknowledged as if someone answered it.
+With --take the doses are also recorded as taken (stock, ledger and dose
+rows), which exercises the write path and feeds the refill forecaster.
+
+The alerts fired are checked against an independent expansion of every
+medication's schedule (dose_instances.expand_medication, which walks
+Recurrence.between rather than the per-day occurs_on test the scheduler
+uses): each expected dose must alert exactly once and nothing else may.
+Alerts are compared as (user_id, med_id, "YYYY-MM-DD HH:MM") because
+archiving shifts medication indices during the year. Exits non-zero on any
+difference, and doubles as a throughput benchmark for the scheduling engine:
+
+    python -m benchmarks.replay --days 365 --users 4 --meds 10
+
+Both sides of that check go through the same rule compiler, so --fixtures
+also replays a few edge-case schedules (FIXTURES) against alert times
+written out by hand:
+
+    python -m benchmarks.replay --fixtures
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import dose_instances
+from benchmarks.household import create_legacy_tables, generate_household
+from clock import SimulatedClock
+from med_store import MedicationStore
+from scheduler import AlertScheduler
+
+
+# name, first simulated day, days, medication, every alert expected in that window
+FIXTURES = [
+    ("monthly on the 31st", date(2025, 1, 30), 92,
+     {"medication_name": "Monthly31", "date_prescribed": "2025-01-31", "recurrence": "FREQ=MONTHLY;BYMONTHDAY=31",
+      "scheduled_times": ["08:00"], "stock": 30},
+     ["2025-01-31 08:00", "2025-02-28 08:00", "2025-03-31 08:00", "2025-04-30 08:00"]),
+    ("every other day", date(2025, 2, 26), 8,
+     {"medication_name": "AltDay", "date_prescribed": "2025-02-25", "recurrence": "FREQ=DAILY;INTERVAL=2",
+      "scheduled_times": ["21:30"], "stock": 30},
+     ["2025-02-27 21:30", "2025-03-01 21:30", "2025-03-03 21:30", "2025-03-05 21:30"]),
+    ("UNTIL is inclusive", date(2025, 1, 1), 5,
+     {"medication_name": "Until", "date_prescribed": "2024-12-31", "recurrence": "FREQ=DAILY;UNTIL=2025-01-03",
+      "scheduled_times": ["00:00", "23:59"], "stock": 30},
+     ["2025-01-01 00:00", "2025-01-01 23:59", "2025-01-02 00:00", "2025-01-02 23:59",
+      "2025-01-03 00:00", "2025-01-03 23:59"]),
+]
+
+
+def expected_alerts(users, start, end):
+    """Counter of (user_id, med_id, due_at) for every dose from start to end (exclusive)"""
+    expected = Counter()
+    for user in users:
+        for med in user.medications:
+            for due_at in dose_instances.expand_medication(med, start, end):
+                expected[(user.user_id, med.get("med_id"), due_at)] += 1
+    return expected
+
+
+def replay(db_path, start, days, interval=30, take=False):
+    """Run the scheduler over `days` simulated days; returns (fired Counter, expected Counter, stats)"""
+    clock = SimulatedClock(datetime.combine(start, datetime.min.time()))
+    store = MedicationStore(db_path, clock=clock)
+    scheduler = AlertScheduler(store, interval=interval, clock=clock)
+    end = start + timedelta(days=days)
+    expected = expected_alerts(store.users(), start, end)
+
+    fired = Counter()
+    ticks = alerts = 0
+    began = time.perf_counter()
+    while clock.today() < end:
+        now = clock.now()
+        if scheduler.tick(now):
+            doses, keys = {}, []
+            while not scheduler.outbox.empty():
+                _, user_id, time_str, med_list, _, dose_day = scheduler.outbox.get()
+                alerts += 1
+                due_at = f"{dose_day} {time_str}"
+                for med, _, alert_key, _, _ in med_list:
+                    fired[(user_id, med.get("med_id"), due_at)] += 1
+                    keys.append(alert_key)
+                    doses.setdefault(user_id, []).append((med.get("med_id"), due_at, "taken"))
+            scheduler.acknowledge(keys)
+            if take:
+                store.apply_doses(doses)
+        ticks += 1
+        clock.sleep(interval)
+    wall = time.perf_counter() - began
+
+    stats = {"ticks": ticks, "alerts": alerts, "wall_s": wall, "days": days,
+             "forecasts": len(store.refill_forecast()) if take else None}
+    store.close()
+    return fired, expected, stats
+
+
+def check_fixtures(interval=60):
+    """Replay every FIXTURES schedule on its own; returns [(name, missing, extra)] for the ones that differ"""
+    failures = []
+    for name, start, days, med, expected in FIXTURES:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "fixture.db")
+            conn = sqlite3.connect(db_path)
+            create_legacy_tables(conn)
+            with conn:
+                conn.execute("INSERT INTO users (user_id, first_name, last_name, medication_data) "
+                             "VALUES (1, 'Fixture', 'User', ?)", (json.dumps([med]),))
+            conn.close()
+            fired, _, _ = replay(db_path, start, days, interval)
+        fired_at = Counter(due_at for _, _, due_at in fired.elements())
+        missing, extra = Counter(expected) - fired_at, fired_at - Counter(expected)
+        if missing or extra:
+            failures.append((name, sorted(missing.elements()), sorted(extra.elements())))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a simulated year of dose alerts and check every one.")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--meds", type=int, default=10, help="medications per user")
+    parser.add_argument("--start", default="2025-01-01", help="first simulated day (YYYY-MM-DD)")
+    parser.add_argument("--interval", type=int, default=30, help="scheduler tick in simulated seconds")
+    parser.add_argument("--take", action="store_true", help="record every alerted dose as taken")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fixtures", action="store_true", help="check the hand-written FIXTURES schedules instead")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.fixtures:
+        failures = check_fixtures()
+        for name, missing, extra in failures:
+            print(f"MISMATCH in {name}: missing {missing or 'none'}, extra {extra or 'none'}")
+        if failures:
+            return 1
+        print(f"OK: all {len(FIXTURES)} fixture schedules alerted exactly as written")
+        return 0
+
+    start = date.fromisoformat(args.start)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "replay.db")
+        generate_household(db_path, users=args.users, meds=args.meds, years=0, seed=args.seed, today=start)
+        print(f"Replaying {args.days} days for {args.users} users x {args.meds} meds "
+              f"(tick every {args.interval} s{', taking doses' if args.take else ''})")
+        fired, expected, stats = replay(db_path, start, args.days, args.interval, args.take)
+
+    simulated_s = stats["days"] * 86400
+    print(f"  {stats['ticks']:>10} ticks      {stats['ticks'] / stats['wall_s']:>12.0f} ticks/s")
+    print(f"  {stats['alerts']:>10} alerts     {sum(fired.values()):>12} doses alerted")
+    print(f"  {stats['wall_s']:>10.2f} s wall   {simulated_s / stats['wall_s']:>12.0f}x real time")
+    if stats["forecasts"] is not None:
+        print(f"  {stats['forecasts']:>10} refill forecasts on {start + timedelta(days=args.days)}")
+
+    missing = expected - fired
+    extra = fired - expected
+    if missing or extra:
+        print(f"MISMATCH: {sum(missing.values())} expected doses not alerted, "
+              f"{sum(extra.values())} unexpected or repeated alerts")
+        for label, diff in (("missing", missing), ("extra", extra)):
+            for key in sorted(diff)[:10]:
+                print(f"  {label}: user {key[0]} med {key[1]} at {key[2]}")
+        return 1
+    print(f"OK: exactly the {sum(expected.values())} expected dose alerts fired")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
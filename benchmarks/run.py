@@ -0,0 +1,372 @@
+"""
+Timed benchmark scenarios for Medication Time.
+
+Generates a synthetic household (or copies --db, which is never modified), times each scenario and writes
+the results as JSON so runs can be compared across commits:
+
+    python -m benchmarks.run --users 50 --meds 12 --years 3
+    python -m benchmarks.run --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import med_db
+from journal_export import write_journal_pdf
+from med_store import MedicationStore
+from med_logic import (should_alert_today, find_due_doses, build_time_index, find_low_stock,
+                       filter_meds, format_med_card)
+from benchmarks.household import generate_household
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a setup function that returns the zero-argument callable to time (or None to skip)"""
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+
+# ---------- Scenarios ----------
+@scenario("fetch_users")
+def _fetch_users(ctx):
+    return lambda: med_db.fetch_users(ctx["db_path"])
+
+
+@scenario("check_alerts_tick")
+def _check_alerts_tick(ctx):
+    # One scheduler tick at a busy dose time: fetch every user and scan all meds
+    def tick():
+        users = med_db.fetch_users(ctx["db_path"])
+        return find_due_doses(users, ctx["now"], set())
+    return tick
+
+
+@scenario("check_alerts_tick_cached")
+def _check_alerts_tick_cached(ctx):
+    # The same tick reading through MedicationStore (no SQL unless the DB changed)
+    store = MedicationStore(ctx["db_path"], check_interval=0)
+
+    def tick():
+        return find_due_doses(store.users(), ctx["now"], set())
+    return tick
+
+
+@scenario("check_alerts_tick_indexed")
+def _check_alerts_tick_indexed(ctx):
+    # What AlertScheduler does between data changes: reuse the minute-of-day index
+    store = MedicationStore(ctx["db_path"], check_interval=0)
+    users = store.users()
+    index = build_time_index(users)
+    return lambda: find_due_doses(users, ctx["now"], set(), index)
+
+
+@scenario("should_alert_today")
+def _should_alert_today(ctx):
+    meds = [m for u in ctx["users"] for m in json.loads(u[3] or "[]")]
+    today = ctx["now"].date()
+
+    def check_all():
+        for m in meds:
+            should_alert_today(m, today)
+    return check_all
+
+
+@scenario("check_stock_levels")
+def _check_stock_levels(ctx):
+    return lambda: find_low_stock(ctx["users"], ctx["now"].date())
+
+
+@scenario("refill_forecast")
+def _refill_forecast(ctx):
+    # Consumption-based forecast for the whole household (warm consumption cache)
+    store = MedicationStore(ctx["db_path"], check_interval=0)
+    today = ctx["now"].date()
+    store.refill_forecast(today)
+    return lambda: store.refill_forecast(today)
+
+
+@scenario("show_user_data_filter")
+def _show_user_data_filter(ctx):
+    # Everything show_user_data does short of creating Tk widgets
+    user_id = ctx["busiest_user"]
+
+    def render():
+        users = med_db.fetch_users(ctx["db_path"])
+        user = next(u for u in users if u[0] == user_id)
+        meds = json.loads(user[3])
+        return [format_med_card(m) for _, m in filter_meds(meds, "1")]
+    return render
+
+
+@scenario("show_user_data_cached")
+def _show_user_data_cached(ctx):
+    # show_user_data's load step as the app runs it now: store snapshot + cached card view models
+    from med_views import CardCache
+    store = MedicationStore(ctx["db_path"], check_interval=0)
+    cache = CardCache()
+    user_id = ctx["busiest_user"]
+    cache.cards(store.user(user_id).medications, "")
+
+    def render():
+        return cache.cards(store.current().user(user_id).medications, "1")
+    return render
+
+
+def _alert_fixture(ctx):
+    """(Tk root, one alert's med_list) for the popup scenarios, or None without a display"""
+    import tkinter as tk
+    try:
+        root = ctx.get("tk_root") or tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    ctx["tk_root"] = root
+    user = next(u for u in ctx["users"] if u[0] == ctx["busiest_user"])
+    meds = json.loads(user[3] or "[]")[:4]
+    med_list = [(m, i, (user[0], i, "09:00"), user[1], user[2]) for i, m in enumerate(meds)]
+    return root, med_list
+
+
+@scenario("alert_popup_cold")
+def _alert_popup_cold(ctx):
+    # What the alert used to cost: build a whole window, show it, destroy it
+    from alert_pool import AlertWindowPool
+    fixture = _alert_fixture(ctx)
+    if fixture is None:
+        return None
+    root, med_list = fixture
+    pool = AlertWindowPool(root, size=0)
+
+    def popup():
+        alert = pool.acquire()
+        alert.show("Time to take medications", "", med_list, 0, 0, on_apply=None, on_cancel=None)
+        root.update_idletasks()
+        alert.window.destroy()
+    return popup
+
+
+@scenario("alert_popup_pooled")
+def _alert_popup_pooled(ctx):
+    # The alert as the app shows it now: reconfigure a pre-built window, show it, withdraw it
+    from alert_pool import AlertWindowPool
+    fixture = _alert_fixture(ctx)
+    if fixture is None:
+        return None
+    root, med_list = fixture
+    pool = AlertWindowPool(root)
+    pool.prewarm()
+
+    def popup():
+        alert = pool.acquire()
+        alert.show("Time to take medications", "", med_list, 0, 0, on_apply=None, on_cancel=None)
+        root.update_idletasks()
+        alert.release()
+    return popup
+
+
+@scenario("alert_timers_churn")
+def _alert_timers_churn(ctx):
+    # A busy dose minute for a large facility: 1000 alerts shown and answered, then 50 ms polls
+    from alert_timers import AlertTimers
+    clock = [0.0]
+    timers = AlertTimers(lambda *a: None, lambda *a: None, clock=lambda: clock[0])
+
+    def churn():
+        for user_id in range(1000):
+            timers.watch(user_id, "09:00")
+        for user_id in range(1000):
+            timers.settle(user_id, "09:00")
+        for _ in range(20):
+            clock[0] += 0.05
+            timers.poll()
+    return churn
+
+
+@scenario("journal_range_query")
+def _journal_range_query(ctx):
+    end = ctx["now"].date()
+    start = end - timedelta(days=30)
+    return lambda: med_db.fetch_journal_entries(
+        ctx["db_path"], ctx["busiest_user"], start.isoformat(), end.isoformat())
+
+
+@scenario("dose_week_query")
+def _dose_week_query(ctx):
+    # A calendar week for the busiest user from the materialized dose_instances table
+    store = MedicationStore(ctx["db_path"], check_interval=0)
+    start = ctx["now"].date()
+    end = start + timedelta(days=7)
+    return lambda: store.doses_between(start.isoformat(), end.isoformat(), ctx["busiest_user"])
+
+
+@scenario("export_entries")
+def _export_entries(ctx):
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        return None
+    user = next(u for u in ctx["users"] if u[0] == ctx["busiest_user"])
+    end = ctx["now"].date()
+    start = end - timedelta(days=365)
+    out_path = os.path.join(ctx["tmp_dir"], "export.pdf")
+
+    def export():
+        meds = med_db.fetch_medications(ctx["db_path"], user[0])
+        entries = med_db.fetch_journal_entries(ctx["db_path"], user[0], start.isoformat(), end.isoformat())
+        write_journal_pdf(out_path, user, meds, entries)
+    return export
+
+
+# ---------- Timing ----------
+def measure(fn, repeat=15, min_sample_s=0.002):
+    """Time fn; each of `repeat` samples runs it enough times to last min_sample_s"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_sample_s or number >= 1000:
+            break
+        number *= 4
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+
+    samples.sort()
+    return {
+        "runs": repeat * number,
+        "min_ms": round(samples[0], 4),
+        "median_ms": round(statistics.median(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+    }
+
+
+def copy_database(src, dest):
+    """Consistent copy of src (opened read-only) to dest via the SQLite backup API"""
+    source = sqlite3.connect(f"file:{os.path.abspath(src)}?mode=ro", uri=True)
+    target = sqlite3.connect(dest)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(db_path, now, names=None, repeat=15, tmp_dir=None):
+    users = med_db.fetch_users(db_path)
+    busiest = max(users, key=lambda u: len(json.loads(u[3] or "[]")))[0] if users else None
+    ctx = {"db_path": db_path, "now": now, "users": users, "busiest_user": busiest,
+           "tmp_dir": tmp_dir or tempfile.gettempdir()}
+
+    results = {}
+    for name, setup in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        fn = setup(ctx)
+        if fn is None:
+            results[name] = {"skipped": True}
+            print(f"  {name:<26} skipped")
+            continue
+        stats = measure(fn, repeat=repeat)
+        results[name] = stats
+        print(f"  {name:<26} median {stats['median_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms")
+    return results
+
+
+def compare(current, previous_path):
+    with open(previous_path, 'r') as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous.get('commit')} ({previous_path}):")
+    for name, stats in current["results"].items():
+        old = previous.get("results", {}).get(name, {})
+        if "median_ms" not in stats or "median_ms" not in old:
+            continue
+        ratio = stats["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        print(f"  {name:<26} {old['median_ms']:>10.3f} -> {stats['median_ms']:>10.3f} ms  (x{ratio:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Medication Time benchmarks.")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--meds", type=int, default=10, help="medications per user")
+    parser.add_argument("--years", type=float, default=1, help="years of journal entries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="benchmark an existing database instead of a synthetic one")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--only", nargs="*", help="scenario names to run")
+    parser.add_argument("--out", help="results JSON path (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    # A fixed, busy dose time keeps tick results comparable between runs
+    now = datetime.combine(datetime.now().date(), datetime.strptime("09:00", "%H:%M").time())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.db:
+            # Scenarios open writable stores (migrations, med_id backfill, dose rows, ledger rows);
+            # run them against a copy so the real database is never touched
+            db_path = os.path.join(tmp_dir, "bench.db")
+            copy_database(args.db, db_path)
+            household = {"db": os.path.abspath(args.db)}
+        else:
+            db_path = os.path.join(tmp_dir, "bench.db")
+            print(f"Generating household: {args.users} users x {args.meds} meds, {args.years} years of journals")
+            household = generate_household(db_path, args.users, args.meds, args.years, args.seed, now.date())
+
+        print("Running scenarios:")
+        results = run_benchmarks(db_path, now, args.only, args.repeat, tmp_dir)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "household": household,
+        "results": results,
+    }
+
+    out_path = args.out
+    if not out_path:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_path = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit'] or 'nogit'}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {out_path}")
+
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
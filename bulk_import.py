@@ -0,0 +1,362 @@
+"""
+Bulk household provisioning for Medication Time.
+
+Loads users, medications and journal entries from CSV or JSON files into an
+existing (or new) database without deleting anything. Everything is validated
+first and then written with executemany() inside a single transaction. A dry
+run opens the database read-only (or not at all if it does not exist yet) and
+validates in memory, so it never creates or changes a file.
+
+Usage:
+    python bulk_import.py household.json
+    python bulk_import.py --users users.csv --medications meds.csv --journals journals.csv
+    python bulk_import.py household.json --dry-run
+    python bulk_import.py household.json --no-upsert
+
+JSON household files look like:
+    {"users": [{"first_name": "Ann", "last_name": "Yates",
+                "medications": [{...}], "journals": [{"date": "...", "journal_text": "..."}]}]}
+
+Flat medication/journal records (CSV rows or JSON lists) reference their user
+by "user_id" or by "first_name" + "last_name". In CSV files scheduled_times
+are separated with ";" (e.g. "09:00;21:00"). An optional "recurrence" column
+holds a schedule rule such as "FREQ=WEEKLY;BYDAY=MO,TH" (see recurrence.py);
+without one the rule is derived from dosage_instructions.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import date_codec
+import schema_migrations
+from dose_instances import new_med_id
+from med_logic import parse_times
+from recurrence import parse_rule, rule_for_dosage
+
+DB_PATH = 'medication_time_db.db'
+
+
+# ---------- Database ----------
+def _connect(db_path, dry_run):
+    """Read-only connection for a dry run (an empty in-memory one if the file doesn't exist yet);
+    otherwise a normal one with the schema brought up to date"""
+    if dry_run:
+        if not os.path.exists(db_path):
+            return sqlite3.connect(":memory:")
+        return sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    conn = sqlite3.connect(db_path)
+    schema_migrations.migrate(conn)
+    return conn
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+# ---------- Reading input files ----------
+def read_records(path):
+    """Read a list of dict records from a .csv or .json file"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return [dict(row) for row in csv.DictReader(f)]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data
+
+
+def load_file(path):
+    """
+    (users, medications, journals) from one household file: a JSON household,
+    or a CSV of users, medications or journals, told apart by its columns.
+    """
+    if not path.lower().endswith(".csv"):
+        return load_household(json_path=path)
+    records = read_records(path)
+    columns = set(records[0]) if records else set()
+    if "medication_name" in columns:
+        return [], records, []
+    if "journal_text" in columns:
+        return [], [], records
+    return records, [], []
+
+
+def load_household(json_path=None, users_path=None, meds_path=None, journals_path=None):
+    """Collect flat user, medication and journal records from the given files"""
+    users, meds, journals = [], [], []
+
+    if json_path:
+        data = read_records(json_path)
+        if isinstance(data, list):
+            data = {"users": data}
+        for u in data.get("users", []):
+            u = dict(u)
+            nested_meds = u.pop("medications", []) or []
+            nested_journals = u.pop("journals", []) or []
+            users.append(u)
+            ref = {k: u[k] for k in ("user_id", "first_name", "last_name") if k in u}
+            meds.extend({**ref, **m} for m in nested_meds)
+            journals.extend({**ref, **j} for j in nested_journals)
+        meds.extend(data.get("medications", []))
+        journals.extend(data.get("journals", []))
+
+    if users_path:
+        users.extend(read_records(users_path))
+    if meds_path:
+        meds.extend(read_records(meds_path))
+    if journals_path:
+        journals.extend(read_records(journals_path))
+
+    return users, meds, journals
+
+
+# ---------- Validation helpers ----------
+def normalize_date(value):
+    """Return an ISO YYYY-MM-DD string for YYYY-MM-DD or MM-DD-YYYY input, None if blank"""
+    return date_codec.normalize(value)
+
+
+def normalize_times(value):
+    """Return a sorted list of HH:MM strings from a list or a ';'/','-separated string"""
+    return parse_times(value)
+
+
+def normalize_med(record):
+    """Build a medication dict in the shape the app stores in medication_data"""
+    stock = record.get("stock", 0)
+    stock = int(stock) if str(stock).strip() != "" else 0
+    if stock < 0:
+        raise ValueError("stock cannot be negative")
+    name = str(record.get("medication_name") or "").strip()
+    if not name:
+        raise ValueError("medication_name is required")
+    dosage = str(record.get("dosage_instructions") or "once per day").strip()
+    rule = str(record.get("recurrence") or "").strip().upper() or rule_for_dosage(dosage)
+    parse_rule(rule)
+    return {
+        "medication_name": name,
+        "doctor_name": str(record.get("doctor_name") or "").strip(),
+        "date_prescribed": normalize_date(record.get("date_prescribed")),
+        "stop_after_date": normalize_date(record.get("stop_after_date")),
+        "dosage_instructions": dosage,
+        "recurrence": rule,
+        "stock": stock,
+        "scheduled_times": normalize_times(record.get("scheduled_times")),
+    }
+
+
+def _user_ref(record):
+    user_id = record.get("user_id")
+    if user_id not in (None, ""):
+        return int(user_id)
+    first = str(record.get("first_name") or "").strip()
+    last = str(record.get("last_name") or "").strip()
+    if not first or not last:
+        raise ValueError("needs user_id or first_name and last_name")
+    return (first.lower(), last.lower())
+
+
+# ---------- Import ----------
+def import_household(db_path, users, meds, journals, upsert=True, dry_run=False):
+    """
+    Validate and import records into db_path in one transaction.
+
+    With upsert=True existing users (matched by user_id or name) are updated and
+    medications with the same name (per user) are replaced; otherwise existing
+    records are left untouched and counted as skipped. Journal entries that
+    already exist with the same date and text are never duplicated.
+
+    Returns a summary dict; raises ValueError listing every problem found if
+    validation fails (nothing is written in that case).
+    """
+    start = time.perf_counter()
+    errors = []
+    summary = {"users_added": 0, "users_updated": 0, "meds_added": 0, "meds_updated": 0,
+               "journals_added": 0, "skipped": 0, "dry_run": dry_run}
+
+    conn = _connect(db_path, dry_run)
+    try:
+        existing = []
+        if _has_table(conn, "users"):     # a dry run against a database that doesn't exist yet has none
+            existing = conn.execute(
+                "SELECT user_id, first_name, last_name, medication_data FROM users").fetchall()
+
+        by_id = {}
+        by_name = {}
+        for user_id, first, last, med_json in existing:
+            try:
+                med_list = json.loads(med_json) if med_json else []
+            except ValueError:
+                med_list = []
+            by_id[user_id] = {"first_name": first, "last_name": last, "meds": med_list,
+                              "new": False, "dirty": False}
+            by_name[((first or "").lower(), (last or "").lower())] = user_id
+        next_id = max(by_id, default=0) + 1
+
+        def resolve(ref):
+            if isinstance(ref, int):
+                return ref if ref in by_id else None
+            return by_name.get(ref)
+
+        # Users
+        for n, record in enumerate(users, 1):
+            try:
+                first = str(record.get("first_name") or "").strip()
+                last = str(record.get("last_name") or "").strip()
+                if not first or not last:
+                    raise ValueError("first_name and last_name are required")
+                uid = record.get("user_id")
+                uid = int(uid) if uid not in (None, "") else by_name.get((first.lower(), last.lower()))
+            except ValueError as e:
+                errors.append(f"users[{n}]: {e}")
+                continue
+
+            if uid is not None and uid in by_id:
+                user = by_id[uid]
+                if not upsert:
+                    summary["skipped"] += 1
+                elif (user["first_name"], user["last_name"]) != (first, last):
+                    by_name.pop(((user["first_name"] or "").lower(), (user["last_name"] or "").lower()), None)
+                    user.update(first_name=first, last_name=last, dirty=True)
+                    by_name[(first.lower(), last.lower())] = uid
+                    if not user["new"]:
+                        summary["users_updated"] += 1
+                continue
+
+            if uid is None:
+                uid = next_id
+            next_id = max(next_id, uid + 1)
+            by_id[uid] = {"first_name": first, "last_name": last, "meds": [], "new": True, "dirty": True}
+            by_name[(first.lower(), last.lower())] = uid
+            summary["users_added"] += 1
+
+        # Medications (merged into each user's JSON list by name)
+        for n, record in enumerate(meds, 1):
+            try:
+                uid = resolve(_user_ref(record))
+                if uid is None:
+                    raise ValueError("refers to an unknown user")
+                med = normalize_med(record)
+            except ValueError as e:
+                errors.append(f"medications[{n}]: {e}")
+                continue
+
+            user = by_id[uid]
+            if "index" not in user:
+                user["index"] = {str(m.get("medication_name", "")).lower(): i
+                                 for i, m in enumerate(user["meds"])}
+            key = med["medication_name"].lower()
+            idx = user["index"].get(key)
+            if idx is None:
+                user["index"][key] = len(user["meds"])
+                med["med_id"] = new_med_id()
+                user["meds"].append(med)
+                summary["meds_added"] += 1
+            elif upsert:
+                user["meds"][idx] = {**user["meds"][idx], **med}
+                summary["meds_updated"] += 1
+            else:
+                summary["skipped"] += 1
+                continue
+            user["dirty"] = True
+
+        # Journals
+        journal_rows = []
+        for n, record in enumerate(journals, 1):
+            try:
+                uid = resolve(_user_ref(record))
+                if uid is None:
+                    raise ValueError("refers to an unknown user")
+                date = normalize_date(record.get("date"))
+                if not date:
+                    raise ValueError("date is required")
+                text = str(record.get("journal_text") or "").strip()
+                if not text:
+                    raise ValueError("journal_text is required")
+            except ValueError as e:
+                errors.append(f"journals[{n}]: {e}")
+                continue
+            journal_rows.append((uid, date, text))
+
+        if errors:
+            raise ValueError(f"{len(errors)} invalid record(s):\n" + "\n".join(errors))
+
+        if journal_rows and _has_table(conn, "user_journals"):
+            user_ids = sorted({r[0] for r in journal_rows})
+            marks = ",".join("?" * len(user_ids))
+            seen = set(conn.execute(
+                f"SELECT user_id, date, journal_text FROM user_journals WHERE user_id IN ({marks})",
+                user_ids).fetchall())
+            fresh = []
+            for row in journal_rows:
+                if row in seen:
+                    summary["skipped"] += 1
+                else:
+                    seen.add(row)
+                    fresh.append(row)
+            journal_rows = fresh
+        summary["journals_added"] = len(journal_rows)
+
+        if not dry_run:
+            inserts = [(uid, u["first_name"], u["last_name"], json.dumps(u["meds"]))
+                       for uid, u in by_id.items() if u["new"]]
+            updates = [(u["first_name"], u["last_name"], json.dumps(u["meds"]), uid)
+                       for uid, u in by_id.items() if u["dirty"] and not u["new"]]
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, first_name, last_name, medication_data) VALUES (?, ?, ?, ?)",
+                    inserts)
+                conn.executemany(
+                    "UPDATE users SET first_name = ?, last_name = ?, medication_data = ? WHERE user_id = ?",
+                    updates)
+                conn.executemany(
+                    "INSERT INTO user_journals (user_id, date, journal_text) VALUES (?, ?, ?)",
+                    journal_rows)
+    finally:
+        conn.close()
+
+    summary["seconds"] = round(time.perf_counter() - start, 4)
+    return summary
+
+
+def format_summary(summary):
+    prefix = "[DRY RUN] Would import" if summary["dry_run"] else "Imported"
+    return (f"{prefix}: {summary['users_added']} new users, {summary['users_updated']} updated users, "
+            f"{summary['meds_added']} new medications, {summary['meds_updated']} updated medications, "
+            f"{summary['journals_added']} journal entries ({summary['skipped']} skipped) "
+            f"in {summary['seconds']}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import users, medications and journals.")
+    parser.add_argument("household", nargs="?",
+                        help="JSON household file, or a CSV of users, medications or journals")
+    parser.add_argument("--users", help="CSV/JSON file of users")
+    parser.add_argument("--medications", help="CSV/JSON file of medications")
+    parser.add_argument("--journals", help="CSV/JSON file of journal entries")
+    parser.add_argument("--db", default=DB_PATH, help=f"database path (default: {DB_PATH})")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, write nothing")
+    parser.add_argument("--no-upsert", action="store_true", help="skip records that already exist")
+    args = parser.parse_args(argv)
+
+    if not any([args.household, args.users, args.medications, args.journals]):
+        parser.error("nothing to import")
+
+    try:
+        users, meds, journals = load_file(args.household) if args.household else ([], [], [])
+        extra = load_household(None, args.users, args.medications, args.journals)
+        records = (users + extra[0], meds + extra[1], journals + extra[2])
+        summary = import_household(args.db, *records, upsert=not args.no_upsert, dry_run=args.dry_run)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+
+    print(format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
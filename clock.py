@@ -0,0 +1,52 @@
+"""
+Injectable clocks.
+
+Everything that decides *when* something happens (the alert scheduler, the
+store's date-dependent jobs and the refill forecaster) asks a clock instead
+of calling datetime.now(), date.today() or time.sleep() directly. The app
+uses SYSTEM. Tests and benchmarks/replay.py pass a SimulatedClock, whose
+sleep() just moves simulated time forward, so a year of schedules runs in
+seconds and gives the same result every run.
+"""
+import time
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    """Wall-clock time"""
+    def now(self):
+        return datetime.now()
+
+    def today(self):
+        return datetime.now().date()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """Deterministic time that only moves when sleep() or advance() is called"""
+    def __init__(self, start):
+        self._start = start
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def today(self):
+        return self._now.date()
+
+    def monotonic(self):
+        return (self._now - self._start).total_seconds()
+
+    def advance(self, seconds):
+        self._now += seconds if isinstance(seconds, timedelta) else timedelta(seconds=seconds)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+
+SYSTEM = SystemClock()
@@ -0,0 +1,94 @@
+"""
+One place to parse, store and display dates.
+
+Dates are stored as YYYY-MM-DD. Older records and hand-typed input may be
+MM-DD-YYYY or MM/DD/YYYY, so everything that reads a date goes through
+parse_date(), and everything that writes one goes through normalize() (the
+store does this for whole medication lists in normalize_medications()).
+
+The parsers and formatters are memoized with bounded LRU caches: a
+household only has a few hundred distinct dates and dose times, so after the
+first render or tick no strptime/strftime runs at all.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+
+STORAGE_FORMAT = "%Y-%m-%d"
+DISPLAY_FORMAT = "%m-%d-%Y"
+INPUT_FORMATS = ("%Y-%m-%d", "%m-%d-%Y", "%m/%d/%Y")
+MED_DATE_FIELDS = ("date_prescribed", "stop_after_date")
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """datetime.date for a stored or typed date in any accepted format, or None if blank/unrecognised"""
+    if isinstance(value, date):
+        return value
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in INPUT_FORMATS[1:]:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def normalize(value):
+    """Storage form (YYYY-MM-DD) of a date, None if blank; raises ValueError if unrecognised"""
+    if value is None or str(value).strip() == "":
+        return None
+    parsed = parse_date(value if isinstance(value, date) else str(value))
+    if parsed is None:
+        raise ValueError(f"unrecognised date '{value}'")
+    return parsed.isoformat()
+
+
+@lru_cache(maxsize=4096)
+def to_display(value):
+    """MM-DD-YYYY for any accepted date, or the value unchanged if it isn't one"""
+    parsed = parse_date(value)
+    return parsed.strftime(DISPLAY_FORMAT) if parsed else value
+
+
+@lru_cache(maxsize=2048)
+def format_time_12h(value):
+    """'21:05' -> '9:05 PM' (the value unchanged if it isn't HH:MM)"""
+    try:
+        return datetime.strptime(value, "%H:%M").strftime("%I:%M %p").lstrip("0")
+    except (TypeError, ValueError):
+        return value
+
+
+def normalize_med_dates(med):
+    """Rewrite one medication's dates to storage form in place; returns True if any changed"""
+    changed = False
+    for field in MED_DATE_FIELDS:
+        value = med.get(field)
+        if not isinstance(value, str):
+            continue
+        parsed = parse_date(value)
+        if parsed is not None and parsed.isoformat() != value:
+            med[field] = parsed.isoformat()
+            changed = True
+    return changed
+
+
+def normalize_medications(meds):
+    """Bulk form of normalize_med_dates(); returns True if any medication changed"""
+    changed = False
+    for med in meds:
+        if isinstance(med, dict) and normalize_med_dates(med):
+            changed = True
+    return changed
+
+
+def cache_info():
+    """Hit/miss counts of the memo caches (for the performance panel and benchmarks)"""
+    return {name: fn.cache_info() for name, fn in
+            (("parse_date", parse_date), ("to_display", to_display), ("format_time_12h", format_time_12h))}
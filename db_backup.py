@@ -0,0 +1,237 @@
+"""
+Online backups of the medication database.
+
+backup_database() copies the live database with SQLite's backup API a few
+hundred pages at a time and sleeps briefly between steps, so the UI,
+scheduler and API connections keep reading and writing while it runs (a
+write in the middle simply restarts the copy of the changed pages). The
+copy is written to a ".partial" file, checked with PRAGMA quick_check and
+only then renamed into place, so a generation on disk is always complete.
+The newest GENERATIONS backups are kept.
+
+BackupJob runs backups on a daemon thread at a fixed interval, and
+restore_backup() copies a verified generation back over the live database
+(saving the current one first) through the same API.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import perf_metrics
+import schema_migrations
+
+log = logging.getLogger("medtime.backup")
+
+GENERATIONS = 7
+PAGES_PER_STEP = 256          # ~1 MB with the default 4 KB page size
+STEP_SLEEP_S = 0.005          # yield to other connections between steps
+INTERVAL_HOURS = 24
+MAX_RESTARTS = 3              # then finish in one step (see _copy)
+
+
+class BackupResult(NamedTuple):
+    path: str
+    pages: int
+    seconds: float
+    check: str                # "ok" or the first quick_check problem
+
+
+def backup_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "backups")
+
+
+def _stem(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy(src, dst, pages, step_sleep, max_restarts=MAX_RESTARTS):
+    """
+    Page-stepped backup from one open connection to another; returns the page count.
+
+    A write through another connection between steps makes SQLite start the
+    copy over. If that happens more than max_restarts times (a busy writer),
+    the copy finishes in a single step instead, which holds the read lock for
+    the length of one full copy rather than never completing.
+    """
+    state = {"remaining": None, "restarts": 0, "pages": 0}
+
+    def progress(status, remaining, page_count):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            perf_metrics.count("backup.restarts")
+            if state["restarts"] > max_restarts:
+                raise _Restarted()
+        state["remaining"], state["pages"] = remaining, page_count
+        time.sleep(step_sleep)
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+    except _Restarted:
+        log.info("Backup restarted %d times by concurrent writes; copying in one step", state["restarts"])
+        src.backup(dst, pages=-1)
+        state["pages"] = src.execute("PRAGMA page_count").fetchone()[0]
+    return state["pages"]
+
+
+def quick_check(path):
+    """PRAGMA quick_check on a database file: "ok" or the first problem reported"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA quick_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
+
+
+def list_backups(db_path, dest_dir=None):
+    """Backup files for db_path, newest first"""
+    dest_dir = dest_dir or backup_dir(db_path)
+    if not os.path.isdir(dest_dir):
+        return []
+    prefix = _stem(db_path) + "."
+    names = [n for n in os.listdir(dest_dir) if n.startswith(prefix) and n.endswith(".db")]
+    return [os.path.join(dest_dir, n) for n in sorted(names, reverse=True)]
+
+
+def _rotate(db_path, dest_dir, generations):
+    for old in list_backups(db_path, dest_dir)[generations:]:
+        try:
+            os.remove(old)
+            log.info("Removed old backup %s", old)
+        except OSError as e:
+            log.warning("Could not remove old backup %s: %s", old, e)
+
+
+def _generation_path(db_path, dest_dir, label=None):
+    """
+    A new backup file name. The microsecond stamp keeps names in time order;
+    a stamp already used (two backups in one tick of a coarse clock) is moved
+    on instead of overwriting a generation.
+    """
+    when = datetime.now()
+    taken = os.listdir(dest_dir)
+    while True:
+        stamped = f"{_stem(db_path)}.{when:%Y%m%d-%H%M%S-%f}"
+        if not any(n.startswith(stamped) for n in taken):
+            return os.path.join(dest_dir, f"{stamped}{'-' + label if label else ''}.db")
+        when += timedelta(microseconds=1)
+
+
+def backup_database(db_path, dest_dir=None, label=None, generations=GENERATIONS,
+                    pages=PAGES_PER_STEP, step_sleep=STEP_SLEEP_S):
+    """
+    Write one verified backup generation of db_path and keep the newest
+    `generations` (None = no rotation); returns a BackupResult.
+    """
+    dest_dir = dest_dir or backup_dir(db_path)
+    os.makedirs(dest_dir, exist_ok=True)
+    path = _generation_path(db_path, dest_dir, label)
+    partial = path + ".partial"
+
+    start = time.perf_counter()
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(partial)
+    try:
+        page_count = _copy(src, dst, pages, step_sleep)
+    finally:
+        dst.close()
+        src.close()
+    check = quick_check(partial)
+    if check != "ok":
+        os.remove(partial)
+        perf_metrics.count("backup.failed_check")
+        raise sqlite3.DatabaseError(f"backup failed quick_check: {check}")
+    os.replace(partial, path)
+    elapsed = time.perf_counter() - start
+
+    perf_metrics.observe("backup.total", elapsed * 1000)
+    log.info("Backed up %s to %s (%d pages in %.1f s)", db_path, path, page_count, elapsed)
+    if generations:
+        _rotate(db_path, dest_dir, generations)
+    return BackupResult(path, page_count, elapsed, check)
+
+
+def restore_backup(backup_path, db_path, pages=PAGES_PER_STEP):
+    """
+    Copy a backup generation over the live database.
+
+    The backup is verified first and the current database is saved as a
+    "pre-restore" generation, so a restore can itself be undone. A backup
+    made by an older version is then migrated to the current schema. Open
+    connections see the restored data on their next read (MedicationStore
+    picks it up through PRAGMA data_version; call its refresh() with
+    replaced=True to also drop what it cached from the old file).
+    """
+    check = quick_check(backup_path)
+    if check != "ok":
+        raise sqlite3.DatabaseError(f"{os.path.basename(backup_path)} failed quick_check: {check}")
+    if os.path.exists(db_path):
+        # not rotated, so it can never push out the generation being restored
+        backup_database(db_path, os.path.dirname(backup_path), label="pre-restore", generations=None)
+
+    with perf_metrics.timer("backup.restore"):
+        src = sqlite3.connect(f"file:{backup_path}?mode=ro", uri=True)
+        dst = sqlite3.connect(db_path)
+        try:
+            # no sleeps: the restore should hold the write lock as briefly as possible
+            _copy(src, dst, pages, 0)
+        finally:
+            dst.close()
+            src.close()
+    conn = sqlite3.connect(db_path)
+    try:
+        applied = schema_migrations.migrate(conn)
+    finally:
+        conn.close()
+    log.info("Restored %s from %s%s", db_path, backup_path,
+             f" (applied schema migrations {applied})" if applied else "")
+
+
+class BackupJob:
+    """Back the database up every `interval_hours` on a daemon thread"""
+    def __init__(self, db_path, interval_hours=INTERVAL_HOURS, generations=GENERATIONS, dest_dir=None):
+        self.db_path = db_path
+        self.interval = interval_hours * 3600
+        self.generations = generations
+        self.dest_dir = dest_dir or backup_dir(db_path)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()     # one backup at a time (scheduled or "Back Up Now")
+        self._thread = None
+
+    def _seconds_until_due(self):
+        backups = list_backups(self.db_path, self.dest_dir)
+        if not backups:
+            return 0
+        age = time.time() - os.path.getmtime(backups[0])
+        return max(self.interval - age, 0)
+
+    def backup_now(self, label=None):
+        with self._lock:
+            return backup_database(self.db_path, self.dest_dir, label, self.generations)
+
+    def run(self):
+        while not self._stop.wait(self._seconds_until_due()):
+            try:
+                self.backup_now()
+            except Exception as e:
+                log.exception("Scheduled backup failed: %s", e)
+                # retry in an hour rather than spinning
+                if self._stop.wait(3600):
+                    break
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True, name="medtime-backup")
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,191 @@
+"""
+Idle-time database maintenance.
+
+Years of journal entries, stock transactions and dose rows leave free pages
+and stale planner statistics behind. IdleMaintenance runs the upkeep in
+short, budgeted steps while the app is idle (no open alert, no recent
+input). should_continue() is checked between chunks, so the work stops as
+soon as the user comes back, and a step that runs out of budget carries on
+where it left off in the next idle window.
+
+    optimize            PRAGMA optimize (cheap; every run)
+    enable_incremental  one-time VACUUM that switches auto_vacuum to INCREMENTAL, only when
+                        the file is small enough to finish within the step's budget
+    incremental_vacuum  PRAGMA incremental_vacuum in chunks while free pages remain
+    wal_checkpoint      PRAGMA wal_checkpoint(PASSIVE), when the database is in WAL mode
+    analyze             ANALYZE one table at a time with a bounded analysis_limit (weekly)
+
+A VACUUM cannot be split into chunks, so it is only started when the file
+is small enough to finish within its budget, and a progress handler aborts
+it (SQLite rolls it back) if the user returns or the budget runs out anyway.
+
+Step state lives in the maintenance_state table, which schema_migrations
+creates. What each run reclaimed is published as maintenance.* gauges,
+which show up in the Performance window.
+"""
+import logging
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import perf_metrics
+
+log = logging.getLogger("medtime.maintenance")
+
+IDLE_SECONDS = 120            # no input for this long (and no open alert) counts as idle
+VACUUM_CHUNK_PAGES = 256
+ANALYSIS_LIMIT = 1000         # rows sampled per index by ANALYZE
+ANALYZE_EVERY = timedelta(days=7)
+VACUUM_BYTES_PER_S = 5 * 1024 * 1024    # conservative VACUUM rate used to decide whether it fits the budget
+PROGRESS_OPS = 10000                     # SQLite VM steps between should_continue()/deadline checks in VACUUM
+
+BUDGETS_S = {
+    "optimize": 0.5,
+    "enable_incremental": 10.0,
+    "incremental_vacuum": 1.0,
+    "wal_checkpoint": 1.0,
+    "analyze": 2.0,
+}
+
+
+def ensure_table(conn):
+    """Create the step-state table; called from schema_migrations"""
+    conn.execute("CREATE TABLE IF NOT EXISTS maintenance_state (step TEXT PRIMARY KEY, last_run TEXT, progress TEXT)")
+
+
+class IdleMaintenance:
+    def __init__(self, db_path, budgets=None):
+        self.db_path = db_path
+        self.budgets = dict(BUDGETS_S, **(budgets or {}))
+
+    # ---------- State ----------
+    @staticmethod
+    def _state(conn, step):
+        row = conn.execute("SELECT last_run, progress FROM maintenance_state WHERE step = ?", (step,)).fetchone()
+        return (datetime.fromisoformat(row[0]) if row and row[0] else None), (row[1] if row else None)
+
+    @staticmethod
+    def _save_state(conn, step, progress=None, finished=True):
+        last_run = datetime.now().isoformat(timespec="seconds") if finished else None
+        conn.execute("INSERT INTO maintenance_state (step, last_run, progress) VALUES (?, ?, ?) "
+                     "ON CONFLICT(step) DO UPDATE SET last_run = COALESCE(excluded.last_run, last_run), "
+                     "progress = excluded.progress", (step, last_run, progress))
+        conn.commit()
+
+    @staticmethod
+    def _pragma(conn, name):
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    # ---------- Steps ----------
+    def _optimize(self, conn, should_continue, deadline):
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize")
+        return {}
+
+    def _enable_incremental(self, conn, should_continue, deadline):
+        if self._pragma(conn, "auto_vacuum") == 2 or not should_continue():
+            return None
+        size = self._pragma(conn, "page_count") * self._pragma(conn, "page_size")
+        if size / VACUUM_BYTES_PER_S > deadline - time.monotonic():
+            log.debug("Database is %.0f MB; too large to switch to incremental vacuum within the budget", size / 1e6)
+            return None
+        before = size
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # a non-zero return aborts the VACUUM, which SQLite then rolls back
+        conn.set_progress_handler(lambda: not should_continue() or time.monotonic() >= deadline, PROGRESS_OPS)
+        try:
+            conn.execute("VACUUM")     # required once for the auto_vacuum change to take effect
+        except sqlite3.OperationalError as e:
+            if "interrupt" not in str(e):
+                raise
+            log.info("One-time VACUUM interrupted; it will be retried in a later idle window")
+            return None
+        finally:
+            conn.set_progress_handler(None, 0)
+        after = self._pragma(conn, "page_count") * self._pragma(conn, "page_size")
+        log.info("Enabled incremental vacuum (%.1f MB -> %.1f MB)", before / 1e6, after / 1e6)
+        return {"bytes_reclaimed": before - after}
+
+    def _incremental_vacuum(self, conn, should_continue, deadline):
+        if self._pragma(conn, "auto_vacuum") != 2 or not self._pragma(conn, "freelist_count"):
+            return None
+        page_size = self._pragma(conn, "page_size")
+        freed = 0
+        while should_continue() and time.monotonic() < deadline:
+            free = self._pragma(conn, "freelist_count")
+            if not free:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({min(free, VACUUM_CHUNK_PAGES)})").fetchall()
+            freed += free - self._pragma(conn, "freelist_count")
+        return {"bytes_reclaimed": freed * page_size, "done": not self._pragma(conn, "freelist_count")}
+
+    def _wal_checkpoint(self, conn, should_continue, deadline):
+        if self._pragma(conn, "journal_mode") != "wal":
+            return None
+        busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        return {"wal_frames": log_frames, "wal_checkpointed": checkpointed, "done": not busy}
+
+    def _analyze(self, conn, should_continue, deadline, progress):
+        last_run, _ = self._state(conn, "analyze")
+        if progress is None and last_run and datetime.now() - last_run < ANALYZE_EVERY:
+            return None
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        done = set(progress.split(",")) if progress else set()
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        for table in tables:
+            if table in done:
+                continue
+            if not should_continue() or time.monotonic() >= deadline:
+                return {"tables_analyzed": len(done), "done": False, "progress": ",".join(sorted(done))}
+            conn.execute(f'ANALYZE "{table}"')
+            done.add(table)
+        return {"tables_analyzed": len(done), "done": True}
+
+    # ---------- Runner ----------
+    def run(self, should_continue=lambda: True):
+        """Run whatever maintenance is due while should_continue() stays true; returns a report dict"""
+        report = {"bytes_reclaimed": 0, "steps": []}
+        conn = sqlite3.connect(self.db_path, timeout=1.0, isolation_level=None)
+        try:
+            file_before = self._pragma(conn, "page_count") * self._pragma(conn, "page_size")
+            for step in ("optimize", "enable_incremental", "incremental_vacuum", "wal_checkpoint", "analyze"):
+                if not should_continue():
+                    report["interrupted"] = True
+                    break
+                deadline = time.monotonic() + self.budgets[step]
+                start = time.perf_counter()
+                try:
+                    if step == "analyze":
+                        result = self._analyze(conn, should_continue, deadline, self._state(conn, step)[1])
+                    else:
+                        result = getattr(self, f"_{step}")(conn, should_continue, deadline)
+                except sqlite3.OperationalError as e:
+                    # most likely "database is locked": someone else is writing, try next idle window
+                    log.info("Maintenance step %s skipped: %s", step, e)
+                    continue
+                if result is None:
+                    continue
+                elapsed = time.perf_counter() - start
+                perf_metrics.observe(f"maintenance.{step}", elapsed * 1000)
+                done = result.pop("done", True)
+                self._save_state(conn, step, result.pop("progress", None), finished=done)
+                report["bytes_reclaimed"] += result.get("bytes_reclaimed", 0)
+                report["steps"].append(step)
+                report.update({k: v for k, v in result.items() if k != "bytes_reclaimed"})
+
+            file_after = self._pragma(conn, "page_count") * self._pragma(conn, "page_size")
+            report.update(file_bytes=file_after, free_pages=self._pragma(conn, "freelist_count"))
+        finally:
+            conn.close()
+
+        perf_metrics.count("maintenance.runs")
+        perf_metrics.gauge("maintenance.last_run", datetime.now().isoformat(timespec="seconds"))
+        perf_metrics.gauge("maintenance.last_reclaimed_bytes", report["bytes_reclaimed"])
+        perf_metrics.gauge("maintenance.file_bytes", report["file_bytes"])
+        perf_metrics.gauge("maintenance.free_pages", report["free_pages"])
+        perf_metrics.count("maintenance.reclaimed_bytes", report["bytes_reclaimed"])
+        if report["steps"]:
+            log.info("Maintenance ran %s; reclaimed %d bytes (file now %d bytes, was %d)",
+                     ", ".join(report["steps"]), report["bytes_reclaimed"], report["file_bytes"], file_before)
+        return report
@@ -0,0 +1,245 @@
+"""
+Day / week / month dose calendar drawn on a single Canvas.
+
+Only the visible date range is loaded: past and near-future doses come from
+the indexed dose_instances table, and days beyond the materialized horizon
+are projected from the medication schedules in memory. Loading runs on the
+app's TkExecutor (paging supersedes older requests), and each page is
+redrawn with plain canvas items instead of one widget per cell.
+"""
+import calendar
+import logging
+import tkinter as tk
+from collections import defaultdict
+from datetime import date, timedelta
+
+import dose_instances
+import perf_metrics
+from clock import SYSTEM
+
+log = logging.getLogger("medtime.calendar")
+
+STATUS_COLORS = {
+    "scheduled": "#4682B4",
+    "taken": "#2E8B57",
+    "skipped": "#DB7093",
+    "missed": "#DC143C",
+}
+MODES = ("day", "week", "month")
+
+
+def visible_range(mode, anchor):
+    """(start, end) dates for the page containing anchor; end is exclusive"""
+    if mode == "day":
+        return anchor, anchor + timedelta(days=1)
+    if mode == "week":
+        start = anchor - timedelta(days=anchor.weekday())
+        return start, start + timedelta(days=7)
+    # Month pages show whole weeks, Monday first
+    first = anchor.replace(day=1)
+    start = first - timedelta(days=first.weekday())
+    return start, start + timedelta(days=42)
+
+
+def page(mode, anchor, step):
+    """Anchor date one page forward (step=1) or back (step=-1)"""
+    if mode == "day":
+        return anchor + timedelta(days=step)
+    if mode == "week":
+        return anchor + timedelta(days=7 * step)
+    month = anchor.month - 1 + step
+    year = anchor.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+
+@perf_metrics.timed("calendar.load")
+def load_doses(store, start, end, user_id=None, today=None):
+    """
+    {date: [(time, user_name, med_name, status)]} for start <= day < end.
+
+    Runs on a worker thread.
+    """
+    today = today or store.clock.today()
+    snapshot = store.snapshot()
+    names = {}
+    for user in snapshot.users:
+        for med in user.medications:
+            names[(user.user_id, med.get("med_id"))] = med.get("medication_name", "Unknown")
+    first_names = {u.user_id: u.first_name for u in snapshot.users}
+
+    days = defaultdict(list)
+    for uid, med_id, due_at, status in store.doses_between(start.isoformat(), end.isoformat(), user_id):
+        day, _, t = due_at.partition(" ")
+        days[day].append((t, first_names.get(uid, "?"), names.get((uid, med_id), "(removed)"), status))
+
+    # Beyond the materialized horizon, project from the schedules themselves
+    horizon_end = today + timedelta(days=dose_instances.HORIZON_DAYS)
+    if end > horizon_end:
+        proj_start = max(start, horizon_end)
+        for user in snapshot.users:
+            if user_id is not None and user.user_id != user_id:
+                continue
+            for med in user.medications:
+                for due_at in dose_instances.expand_medication(med, proj_start, end):
+                    day, _, t = due_at.partition(" ")
+                    days[day].append((t, user.first_name, med.get("medication_name", "Unknown"), "scheduled"))
+
+    return {day: sorted(doses) for day, doses in days.items()}
+
+
+class DoseCalendarWindow:
+    """`clock` decides which day is "today" (the store's clock, see clock.py)"""
+    def __init__(self, app, user=None, clock=SYSTEM):
+        self.app = app
+        self.user = user
+        self.clock = clock
+        self.mode = "month"
+        self.anchor = clock.today()
+        self.doses = {}
+
+        self.window = tk.Toplevel(app.root)
+        self.window.geometry("900x650")
+
+        toolbar = tk.Frame(self.window)
+        toolbar.pack(fill="x", pady=5)
+        tk.Button(toolbar, text="◀", width=3, command=lambda: self.go(-1)).pack(side=tk.LEFT, padx=5)
+        tk.Button(toolbar, text="Today", command=self.go_today).pack(side=tk.LEFT)
+        tk.Button(toolbar, text="▶", width=3, command=lambda: self.go(1)).pack(side=tk.LEFT, padx=5)
+        self.title_label = tk.Label(toolbar, font=("Helvetica", 14, "bold"))
+        self.title_label.pack(side=tk.LEFT, padx=15)
+        for mode in reversed(MODES):
+            tk.Button(toolbar, text=mode.title(), command=lambda m=mode: self.set_mode(m)).pack(side=tk.RIGHT, padx=2)
+
+        legend = tk.Frame(self.window)
+        legend.pack(fill="x")
+        for status, color in STATUS_COLORS.items():
+            tk.Label(legend, text=f"■ {status.title()}", fg=color, font=("Helvetica", 10, "bold")).pack(side=tk.LEFT, padx=8)
+
+        self.canvas = tk.Canvas(self.window, bg="white", highlightthickness=0)
+        self.canvas.pack(fill="both", expand=True, padx=5, pady=5)
+        self.canvas.bind("<Configure>", lambda e: self.draw())
+        self.canvas.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(int(-e.delta / 120), "units"))
+
+        scope = f"{user[1]}'s" if user else "Household"
+        self.window.title(f"{scope} Dose Calendar")
+        self.window.bind("<Left>", lambda e: self.go(-1))
+        self.window.bind("<Right>", lambda e: self.go(1))
+        self.load()
+
+    # ---------- Navigation ----------
+    def set_mode(self, mode):
+        self.mode = mode
+        self.load()
+
+    def go(self, step):
+        self.anchor = page(self.mode, self.anchor, step)
+        self.load()
+
+    def go_today(self):
+        self.anchor = self.clock.today()
+        self.load()
+
+    def open_day(self, day):
+        self.mode = "day"
+        self.anchor = day
+        self.load()
+
+    # ---------- Data ----------
+    def load(self):
+        start, end = visible_range(self.mode, self.anchor)
+        user_id = self.user[0] if self.user else None
+        self.app.executor.submit(load_doses, self.app.store, start, end, user_id,
+                                 on_done=self.loaded, on_error=self.app.show_background_error,
+                                 key=f"calendar-{id(self)}")
+
+    def loaded(self, doses):
+        if not self.window.winfo_exists():
+            return
+        self.doses = doses
+        self.draw()
+
+    # ---------- Drawing ----------
+    @perf_metrics.timed("calendar.draw")
+    def draw(self):
+        self.canvas.delete("all")
+        self.canvas.yview_moveto(0)
+        width = max(self.canvas.winfo_width(), 200)
+        height = max(self.canvas.winfo_height(), 200)
+        start, end = visible_range(self.mode, self.anchor)
+        if self.mode == "month":
+            self.title_label.config(text=self.anchor.strftime("%B %Y"))
+            self._draw_month(start, width, height)
+        elif self.mode == "week":
+            self.title_label.config(text=f"Week of {start.strftime('%b %d, %Y')}")
+            self._draw_week(start, width, height)
+        else:
+            self.title_label.config(text=self.anchor.strftime("%A, %B %d, %Y"))
+            self._draw_day(self.anchor, width)
+
+    def _bind_day(self, tag, day):
+        self.canvas.tag_bind(tag, "<Button-1>", lambda e, d=day: self.open_day(d))
+
+    def _label(self, t, name, med, status):
+        who = f"{name}: " if self.user is None else ""
+        return f"{t} {who}{med}"
+
+    def _draw_month(self, start, width, height):
+        header = 20
+        cell_w, cell_h = width / 7, (height - header) / 6
+        for col, name in enumerate(calendar.day_abbr):
+            self.canvas.create_text(col * cell_w + cell_w / 2, header / 2, text=name, font=("Helvetica", 10, "bold"))
+        today = self.clock.today()
+        for i in range(42):
+            day = start + timedelta(days=i)
+            x, y = (i % 7) * cell_w, header + (i // 7) * cell_h
+            tag = f"d{i}"
+            fill = "#FFFACD" if day == today else ("white" if day.month == self.anchor.month else "#F2F2F2")
+            self.canvas.create_rectangle(x, y, x + cell_w, y + cell_h, fill=fill, outline="#CCCCCC", tags=tag)
+            self.canvas.create_text(x + 4, y + 3, text=str(day.day), anchor="nw", font=("Helvetica", 10, "bold"), tags=tag)
+
+            counts = defaultdict(int)
+            for dose in self.doses.get(day.isoformat(), ()):
+                counts[dose[3]] += 1
+            line_y = y + 20
+            for status, color in STATUS_COLORS.items():
+                if counts[status] and line_y + 12 < y + cell_h:
+                    self.canvas.create_text(x + 6, line_y, text=f"● {counts[status]} {status}", anchor="nw",
+                                            fill=color, font=("Helvetica", 9), tags=tag)
+                    line_y += 13
+            self._bind_day(tag, day)
+
+    def _draw_week(self, start, width, height):
+        header = 24
+        col_w = width / 7
+        max_lines = int((height - header) // 14)
+        today = self.clock.today()
+        for col in range(7):
+            day = start + timedelta(days=col)
+            x = col * col_w
+            tag = f"d{col}"
+            self.canvas.create_rectangle(x, 0, x + col_w, height, outline="#CCCCCC",
+                                         fill="#FFFACD" if day == today else "white", tags=tag)
+            self.canvas.create_text(x + col_w / 2, header / 2, text=day.strftime("%a %d"),
+                                    font=("Helvetica", 10, "bold"), tags=tag)
+            doses = self.doses.get(day.isoformat(), ())
+            for row, dose in enumerate(doses[:max_lines]):
+                text = self._label(*dose)
+                if row == max_lines - 1 and len(doses) > max_lines:
+                    text = f"+{len(doses) - row} more"
+                self.canvas.create_text(x + 4, header + row * 14, text=text, anchor="nw", width=col_w - 8,
+                                        fill=STATUS_COLORS.get(dose[3], "black"), font=("Helvetica", 9), tags=tag)
+            self._bind_day(tag, day)
+
+    def _draw_day(self, day, width):
+        doses = self.doses.get(day.isoformat(), ())
+        if not doses:
+            self.canvas.create_text(width / 2, 40, text="No doses scheduled", font=("Helvetica", 12))
+        for row, (t, name, med, status) in enumerate(doses):
+            y = 10 + row * 24
+            color = STATUS_COLORS.get(status, "black")
+            self.canvas.create_rectangle(10, y, 22, y + 12, fill=color, outline=color)
+            who = f"{name} — " if self.user is None else ""
+            self.canvas.create_text(30, y - 2, text=f"{t}   {who}{med}   ({status})", anchor="nw",
+                                    font=("Helvetica", 12))
+        self.canvas.configure(scrollregion=(0, 0, width, 20 + len(doses) * 24))
@@ -0,0 +1,189 @@
+"""
+Materialized dose instances for a rolling horizon.
+
+Instead of re-deriving "what is due" from the raw medication JSON everywhere,
+every scheduled dose for the next HORIZON_DAYS is expanded into the
+dose_instances table:
+
+    user_id | med_id | due_at (YYYY-MM-DD HH:MM, local) | status | updated_at
+
+status is one of scheduled, taken, skipped or missed. Rows are regenerated
+per medication when it is added, edited or deleted (MedicationStore calls
+sync_medications() in the same transaction as the write), and a daily pass
+extends the horizon and marks unacknowledged past doses as missed. Calendar
+views, reminders and adherence reports read it with indexed range queries.
+
+dose_schedules keeps a fingerprint of the schedule each medication's rows
+were last generated from, so at startup (when there is no previous snapshot
+to diff against) only medications changed while the app was closed are
+regenerated.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from date_codec import parse_date
+from med_logic import active_times
+from recurrence import med_recurrence
+
+log = logging.getLogger("medtime.doses")
+
+HORIZON_DAYS = 30
+SCHEDULE_FIELDS = ("date_prescribed", "stop_after_date", "dosage_instructions", "recurrence", "scheduled_times")
+STATUSES = ("scheduled", "taken", "skipped", "missed")
+
+
+def new_med_id():
+    return uuid.uuid4().hex[:12]
+
+
+def ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dose_instances (
+            user_id INTEGER NOT NULL,
+            med_id TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'scheduled',
+            updated_at TEXT,
+            PRIMARY KEY (user_id, med_id, due_at)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dose_instances_due ON dose_instances (due_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_dose_instances_user_due ON dose_instances (user_id, due_at)")
+
+
+def ensure_schedule_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dose_schedules (
+            user_id INTEGER NOT NULL,
+            med_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            PRIMARY KEY (user_id, med_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def schedule_fingerprint(med):
+    """Short hash of the fields that decide a medication's dose rows"""
+    text = json.dumps([med.get(k) for k in SCHEDULE_FIELDS], default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _stop_date(med):
+    return parse_date(med.get("stop_after_date"))
+
+
+def expand_medication(med, start_date, end_date):
+    """Yield 'YYYY-MM-DD HH:MM' due times for med between start_date and end_date (exclusive)"""
+    stop = _stop_date(med)
+    if stop and stop < end_date:
+        end_date = stop + timedelta(days=1)
+    times = sorted(med.get("scheduled_times") or ())
+    if not times or start_date >= end_date:
+        return
+    rule = med_recurrence(med)
+    if rule is None:
+        days = (start_date + timedelta(days=n) for n in range((end_date - start_date).days))
+    else:
+        days = rule.between(start_date, end_date)
+    for day in days:
+        day_str = day.isoformat()
+        for t in (active_times(med, day) if rule is not None and rule.taper else times):
+            yield f"{day_str} {t}"
+
+
+def schedule_changed(old, new):
+    return any(old.get(k) != new.get(k) for k in SCHEDULE_FIELDS)
+
+
+def regenerate_medication(conn, user_id, med, today, horizon=HORIZON_DAYS):
+    """Replace the future still-scheduled rows of one medication"""
+    med_id = med["med_id"]
+    start = today.isoformat()
+    conn.execute("DELETE FROM dose_instances WHERE user_id = ? AND med_id = ? AND due_at >= ? AND status = 'scheduled'",
+                 (user_id, med_id, start))
+    rows = [(user_id, med_id, due_at)
+            for due_at in expand_medication(med, today, today + timedelta(days=horizon))]
+    # OR IGNORE keeps taken/skipped rows that already exist at the same time
+    conn.executemany("INSERT OR IGNORE INTO dose_instances (user_id, med_id, due_at) VALUES (?, ?, ?)", rows)
+    conn.execute("INSERT OR REPLACE INTO dose_schedules (user_id, med_id, fingerprint) VALUES (?, ?, ?)",
+                 (user_id, med_id, schedule_fingerprint(med)))
+    return len(rows)
+
+
+def remove_medication(conn, user_id, med_id, today):
+    """Drop the future scheduled doses of a deleted medication (history is kept)"""
+    conn.execute("DELETE FROM dose_instances WHERE user_id = ? AND med_id = ? AND due_at >= ? AND status = 'scheduled'",
+                 (user_id, med_id, today.isoformat()))
+    conn.execute("DELETE FROM dose_schedules WHERE user_id = ? AND med_id = ?", (user_id, med_id))
+
+
+def sync_medications(conn, user_id, old_meds, new_meds, today, horizon=HORIZON_DAYS):
+    """
+    Regenerate rows only for medications whose schedule was added, changed or
+    removed. Pass old_meds=None when there is no earlier copy to compare with
+    (a fresh store); the stored fingerprints are the baseline then.
+    """
+    if old_meds is None:
+        stored = dict(conn.execute("SELECT med_id, fingerprint FROM dose_schedules WHERE user_id = ?", (user_id,)))
+        old_by_id = dict.fromkeys(stored)
+
+        def changed(med):
+            return stored.get(med["med_id"]) != schedule_fingerprint(med)
+    else:
+        old_by_id = {m.get("med_id"): m for m in old_meds}
+
+        def changed(med):
+            old = old_by_id.get(med["med_id"])
+            return old is None or schedule_changed(old, med)
+
+    new_ids = set()
+    for med in new_meds:
+        new_ids.add(med["med_id"])
+        if changed(med):
+            regenerate_medication(conn, user_id, med, today, horizon)
+    for med_id in old_by_id:
+        if med_id and med_id not in new_ids:
+            remove_medication(conn, user_id, med_id, today)
+
+
+def materialize_horizon(conn, users, today, horizon=HORIZON_DAYS):
+    """Daily job: make sure every active medication is expanded through today + horizon"""
+    end = today + timedelta(days=horizon)
+    rows = []
+    for user in users:
+        for med in user[3]:
+            if not med.get("med_id"):
+                continue
+            rows.extend((user[0], med["med_id"], due_at) for due_at in expand_medication(med, today, end))
+    conn.executemany("INSERT OR IGNORE INTO dose_instances (user_id, med_id, due_at) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def mark_missed(conn, before, when=None):
+    """Mark scheduled doses due before `before` (a datetime) as missed, stamped `when` (default now)"""
+    cur = conn.execute("UPDATE dose_instances SET status = 'missed', updated_at = ? "
+                       "WHERE status = 'scheduled' AND due_at < ?",
+                       ((when or datetime.now()).isoformat(timespec="seconds"), before.strftime("%Y-%m-%d %H:%M")))
+    return cur.rowcount
+
+
+def set_statuses(conn, user_id, updates, when=None):
+    """updates: iterable of (med_id, due_at, status), stamped `when` (default now)"""
+    stamp = (when or datetime.now()).isoformat(timespec="seconds")
+    conn.executemany(
+        "INSERT INTO dose_instances (user_id, med_id, due_at, status, updated_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (user_id, med_id, due_at) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+        [(user_id, med_id, due_at, status, stamp) for med_id, due_at, status in updates])
+
+
+def doses_between(conn, start, end, user_id=None):
+    """(user_id, med_id, due_at, status) rows with start <= due_at < end ('YYYY-MM-DD[ HH:MM]' strings)"""
+    if user_id is None:
+        return conn.execute("SELECT user_id, med_id, due_at, status FROM dose_instances "
+                            "WHERE due_at >= ? AND due_at < ? ORDER BY due_at", (start, end)).fetchall()
+    return conn.execute("SELECT user_id, med_id, due_at, status FROM dose_instances "
+                        "WHERE user_id = ? AND due_at >= ? AND due_at < ? ORDER BY due_at",
+                        (user_id, start, end)).fetchall()
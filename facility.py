@@ -0,0 +1,193 @@
+"""
+Facility mode: dose scheduling sharded across worker processes.
+
+For a care home with hundreds of residents, one scheduler thread scanning
+everyone becomes the bottleneck. In facility mode residents are split by
+user_id % N across N worker processes. Each process keeps its own read-only
+MedicationStore replica, its own minute-of-day index and its own
+"already alerted" set, and ticks on its own clock, so a slow shard never
+holds up the others.
+
+FacilityCoordinator runs in the app process. It merges every shard's
+due-dose events into one outbox, routes acknowledgements back to the shard
+that owns the resident, restarts shards that die and runs the store's daily
+maintenance (archiving, dose-horizon roll). Its outbox/acknowledge()
+interface is the same as AlertScheduler's, so the UI does not care which
+one it is talking to.
+
+Enable it with "facility_processes": N in settings.json or the
+MEDTIME_FACILITY_PROCESSES environment variable (0 or unset = off).
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import perf_metrics
+from clock import SYSTEM
+from med_logic import build_time_index, find_due_doses
+from med_store import MedicationStore
+from snapshots import thaw_medication
+
+log = logging.getLogger("medtime.facility")
+
+
+def resolve_processes(settings):
+    """Number of shard processes requested by MEDTIME_FACILITY_PROCESSES or settings (0 = off)"""
+    value = os.environ.get("MEDTIME_FACILITY_PROCESSES") or settings.get("facility_processes") or 0
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        log.warning("Ignoring invalid facility_processes %r", value)
+        return 0
+    return max(value, 0)
+
+
+def shard_of(user_id, shards):
+    return user_id % shards
+
+
+def _key_user(alert_key):
+    # alert keys look like "YYYY-MM-DD-<user_id>-<med_id>-<HH:MM>"
+    return int(alert_key.split("-", 4)[3])
+
+
+def run_shard(db_path, shard, shards, interval, events, acks, stop, clock=SYSTEM):
+    """Worker process: evaluate this shard's schedules every `interval` seconds until stopped"""
+    store = MedicationStore(db_path, shard=(shard, shards), read_only=True, clock=clock)
+    alerted = set()
+    index = (None, {})
+    last_date = None
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            now = clock.now()
+            if now.date() != last_date:
+                alerted.clear()
+                last_date = now.date()
+            while True:
+                try:
+                    alerted.update(acks.get_nowait())
+                except queue.Empty:
+                    break
+
+            snapshot = store.snapshot()
+            if index[0] != snapshot.version:
+                index = (snapshot.version, build_time_index(snapshot.users))
+            for (user_id, time_str), med_list in find_due_doses(snapshot.users, now, alerted, index[1]).items():
+                if med_list:
+                    # frozen medications don't pickle; send plain dicts
+                    meds = [(thaw_medication(med), idx, key, fname, lname) for med, idx, key, fname, lname in med_list]
+                    events.put(("show_alert", shard, user_id, time_str, meds, time.time(), now.date().isoformat()))
+            events.put(("tick", shard, len(snapshot.users), (time.perf_counter() - start) * 1000))
+        except Exception as e:
+            events.put(("error", shard, repr(e)))
+        stop.wait(interval)
+
+
+class FacilityCoordinator:
+    def __init__(self, db_path, processes, interval=30, store=None, clock=None):
+        self.db_path = db_path
+        self.processes = processes
+        self.interval = interval
+        self.store = store              # app store used for daily maintenance
+        # shards get a pickled copy at start: advancing a SimulatedClock later only moves the coordinator
+        self.clock = clock or (store.clock if store is not None else SYSTEM)
+        self.outbox = queue.SimpleQueue()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._events = self._ctx.Queue()
+        self._stop = self._ctx.Event()
+        self._acks = [self._ctx.Queue() for _ in range(processes)]
+        self._workers = [None] * processes
+        self._last_tick = {}
+        self._last_maintenance_date = None
+        self._thread = None
+
+    def acknowledge(self, alert_keys):
+        """Called from the UI: route handled alert keys to the shards that own them"""
+        by_shard = {}
+        for key in alert_keys:
+            by_shard.setdefault(shard_of(_key_user(key), self.processes), []).append(key)
+        for shard, keys in by_shard.items():
+            self._acks[shard].put(tuple(keys))
+
+    def _start_worker(self, shard):
+        worker = self._ctx.Process(
+            target=run_shard, name=f"medtime-shard-{shard}", daemon=True,
+            args=(self.db_path, shard, self.processes, self.interval, self._events, self._acks[shard], self._stop,
+                  self.clock))
+        worker.start()
+        self._workers[shard] = worker
+        self._last_tick[shard] = time.monotonic()
+        log.info("Started shard %d/%d (pid %s)", shard, self.processes, worker.pid)
+
+    def _check_workers(self):
+        for shard, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                log.warning("Shard %d exited with code %s; restarting", shard, worker.exitcode)
+                perf_metrics.count("facility.shard_restart")
+                self._start_worker(shard)
+            elif time.monotonic() - self._last_tick[shard] > 3 * self.interval:
+                log.warning("Shard %d has not ticked for %.0f s", shard, time.monotonic() - self._last_tick[shard])
+
+    def _daily_maintenance(self):
+        today = self.clock.today()
+        if self.store is not None and today != self._last_maintenance_date:
+            self._last_maintenance_date = today
+            try:
+                self.store.daily_maintenance(today)
+            except Exception as e:
+                log.exception("Daily maintenance failed: %s", e)
+
+    def _handle(self, event):
+        kind, shard = event[0], event[1]
+        if kind == "show_alert":
+            _, _, user_id, time_str, med_list, detected_wall, dose_day = event
+            # convert the shard's wall-clock stamp to this process's perf_counter for alert.latency
+            detected_at = time.perf_counter() - max(time.time() - detected_wall, 0)
+            log.info("Combined alert triggered: user %s at %s with %d medications (shard %d)",
+                     user_id, time_str, len(med_list), shard,
+                     extra={"user_id": user_id, "dose_time": time_str, "med_count": len(med_list)})
+            perf_metrics.count("scheduler.alerts_fired")
+            self.outbox.put(("show_alert", user_id, time_str, med_list, detected_at, dose_day))
+        elif kind == "tick":
+            _, _, users, ms = event
+            self._last_tick[shard] = time.monotonic()
+            perf_metrics.observe("facility.shard_tick", ms)
+            perf_metrics.gauge(f"facility.shard{shard}.users", users)
+        elif kind == "error":
+            log.error("Error in shard %d: %s", shard, event[2])
+
+    def run(self):
+        """Merge shard events into the outbox; runs on a daemon thread in the app process"""
+        log.info("Facility coordinator started with %d shards", self.processes)
+        next_check = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            self._daily_maintenance()
+            try:
+                self._handle(self._events.get(timeout=1.0))
+            except queue.Empty:
+                pass
+            except Exception as e:
+                log.exception("Unexpected error in facility coordinator: %s", e)
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.interval
+
+    def start(self):
+        for shard in range(self.processes):
+            self._start_worker(shard)
+        self._thread = threading.Thread(target=self.run, daemon=True, name="medtime-facility")
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for worker in self._workers:
+            if worker is not None:
+                worker.join(timeout)
+                if worker.is_alive():
+                    worker.terminate()
@@ -0,0 +1,52 @@
+"""
+PDF export of a user's medication summary and journal entries.
+"""
+import perf_metrics
+
+
+@perf_metrics.timed("export.pdf")
+def write_journal_pdf(file_path, user, meds, entries):
+    """Write the medication summary for `user` followed by its journal `entries`"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import inch
+
+    c = canvas.Canvas(file_path, pagesize=letter)
+    width, height = letter
+    x_margin = inch
+    y = height - inch
+
+    def write_line(text, font_size=12, bold=False):
+        nonlocal y
+        if y < inch:
+            c.showPage()
+            y = height - inch
+        font = "Helvetica-Bold" if bold else "Helvetica"
+        c.setFont(font, font_size)
+        c.drawString(x_margin, y, text)
+        y -= 14
+
+    # Header
+    write_line(f"{user[1]} {user[2]} - Medication Summary", 16, bold=True)
+    write_line("")
+
+    for m in meds:
+        write_line(f"Medication: {m.get('medication_name', 'N/A')}", 12, bold=True)
+        write_line(f"Prescribed by: {m.get('doctor_name', 'N/A')}")
+        write_line(f"Date Prescribed: {m.get('date_prescribed', 'N/A')}")
+        write_line(f"Instructions: {m.get('dosage_instructions', 'N/A')}")
+        write_line("")
+
+    write_line("Journal Entries", 16, bold=True)
+    write_line("")
+
+    if entries:
+        for entry in entries:
+            write_line(f"{entry[0]}", 12, bold=True)
+            for line in entry[1].splitlines():
+                write_line(line.strip())
+            write_line("")
+    else:
+        write_line("No journal entries found in selected date range.")
+
+    c.save()
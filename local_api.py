@@ -0,0 +1,446 @@
+"""
+Local JSON + Server-Sent Events API for household dashboards.
+
+An optional asyncio HTTP server (standard library only) that lets a tablet
+in the kitchen show live status without polling:
+
+    GET /api/users                           users and their medication counts
+    GET /api/users/<id>/medications          one user's active medications
+    GET /api/users/<id>/journals?days=30     recent journal entries (days 1..3650)
+    GET /api/doses/today                     today's scheduled doses with their status
+    GET /api/stock                           stock and days of supply for every medication
+    GET /api/events                          SSE stream of "due" and "ack" events
+
+Responses are built from MedicationStore's in-memory snapshot and cached per
+path until the snapshot revision (or an event) changes, so dozens of clients
+cost one render per change rather than one SQLite query per request. Each
+cached body carries an ETag; clients that send it back in If-None-Match get
+304 Not Modified. Only cache misses for journals and dose statuses query the
+database, on a worker thread so the event loop never blocks. Changes made by
+other programs are picked up by a background refresh every second.
+
+The UI feeds the event stream through publish(), which is safe to call from
+any thread. Reconnecting clients send Last-Event-ID and get the events they
+missed from a short replay buffer.
+
+Enable it with "api_port": N in settings.json or the MEDTIME_API_PORT
+environment variable (0 or unset = off). It listens on 127.0.0.1 unless
+"api_host" says otherwise (e.g. "0.0.0.0" to reach it from a tablet).
+
+Access control:
+
+  * With "api_token" set (or MEDTIME_API_TOKEN), every request must carry it
+    as "Authorization: Bearer <token>" or, for EventSource clients that
+    cannot set headers, as ?token=<token>. The server refuses to listen on
+    anything but a loopback address without a token; the app generates one
+    into settings.json the first time "api_host" is not loopback.
+  * No CORS header is sent by default, so web pages open in a browser on
+    this computer cannot read the data. Dashboards served from another
+    origin must be listed in "api_allowed_origins"; only those origins are
+    echoed back in Access-Control-Allow-Origin.
+"""
+import asyncio
+import collections
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import perf_metrics
+from med_logic import active_times, calculate_days_supply, should_alert_today
+from snapshots import thaw_medication
+
+log = logging.getLogger("medtime.api")
+
+MAX_HEADER_BYTES = 16 * 1024
+REPLAY_EVENTS = 200          # events kept for Last-Event-ID replay
+DEFAULT_JOURNAL_DAYS = 30
+MAX_JOURNAL_DAYS = 3650      # ?days= is limited to 1..this
+CLIENT_QUEUE = 100           # slow SSE clients are dropped once this many events are pending
+HEARTBEAT_S = 15
+REFRESH_S = 1.0
+
+REASONS = {200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request", 401: "Unauthorized",
+           404: "Not Found", 405: "Method Not Allowed"}
+
+
+def resolve_port(settings):
+    """Port requested by MEDTIME_API_PORT or settings (0 = off)"""
+    value = os.environ.get("MEDTIME_API_PORT") or settings.get("api_port") or 0
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        log.warning("Ignoring invalid api_port %r", value)
+        return 0
+    return value if 0 < value < 65536 else 0
+
+
+def resolve_token(settings):
+    """Shared API token from MEDTIME_API_TOKEN or settings, or None"""
+    return os.environ.get("MEDTIME_API_TOKEN") or settings.get("api_token") or None
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_days(value):
+    """?days= as an int in 1..MAX_JOURNAL_DAYS; ValueError (400) otherwise"""
+    days = int(value)
+    if not 1 <= days <= MAX_JOURNAL_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_JOURNAL_DAYS}")
+    return days
+
+
+class NotFound(Exception):
+    pass
+
+
+# ---------- Renderers (pure functions of a snapshot) ----------
+def render_users(snapshot):
+    return [{"user_id": u.user_id, "first_name": u.first_name, "last_name": u.last_name,
+             "medication_count": len(u.medications)} for u in snapshot.users]
+
+
+def render_medications(snapshot, user_id):
+    user = snapshot.user(user_id)
+    if user is None:
+        raise NotFound(f"user {user_id}")
+    return [thaw_medication(m) for m in user.medications]
+
+
+def render_stock(snapshot):
+    rows = []
+    for user in snapshot.users:
+        for med in user.medications:
+            stock = med.get("stock", 0)
+            rows.append({"user_id": user.user_id, "med_id": med.get("med_id"),
+                         "medication_name": med.get("medication_name", "Unknown"), "stock": stock,
+                         "days_supply": calculate_days_supply(stock, med.get("dosage_instructions"),
+                                                              med.get("scheduled_times") or (),
+                                                              med.get("recurrence"))})
+    return rows
+
+
+def render_doses_today(snapshot, today, statuses):
+    """statuses is {(med_id, 'YYYY-MM-DD HH:MM'): status} from dose_instances and recent events"""
+    day = today.isoformat()
+    rows = []
+    for user in snapshot.users:
+        for med in user.medications:
+            if not should_alert_today(med, today):
+                continue
+            for time_str in active_times(med, today):
+                rows.append({"user_id": user.user_id, "med_id": med.get("med_id"),
+                             "medication_name": med.get("medication_name", "Unknown"), "time": time_str,
+                             "status": statuses.get((med.get("med_id"), f"{day} {time_str}"), "scheduled")})
+    rows.sort(key=lambda r: (r["time"], r["user_id"]))
+    return rows
+
+
+class DashboardServer:
+    """
+    token: required on every request when set (mandatory off loopback).
+    allowed_origins: browser origins allowed to read responses (CORS).
+    """
+    def __init__(self, store, port, host="127.0.0.1", token=None, allowed_origins=()):
+        if not token and not is_loopback(host):
+            raise ValueError(f"refusing to serve the dashboard API on {host} without an api_token")
+        self.store = store
+        self.host = host
+        self.port = port
+        self.token = token
+        self.allowed_origins = frozenset(allowed_origins or ())
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._cache = {}                # path -> (key, etag, body)
+        self._clients = set()           # one asyncio.Queue per SSE client
+        self._recent = collections.deque(maxlen=REPLAY_EVENTS)
+        self._event_id = 0
+        self._statuses = {}             # today's dose statuses, loaded on demand and patched by events
+        self._statuses_key = None
+
+    # ---------- Events ----------
+    def publish(self, event, data):
+        """Queue an SSE event; safe to call from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, event, data)
+
+    def _broadcast(self, event, data):
+        self._event_id += 1
+        if event == "ack":
+            for med_id, due_at, status in data.get("doses", ()):
+                self._statuses[(med_id, due_at)] = status
+        message = f"id: {self._event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+        self._recent.append((self._event_id, message))
+        for client in list(self._clients):
+            try:
+                client.put_nowait(message)
+            except asyncio.QueueFull:
+                # a client that stopped reading must not grow memory without bound
+                self._clients.discard(client)
+                client.get_nowait()
+                client.put_nowait(None)
+                perf_metrics.count("api.sse_dropped")
+        perf_metrics.count("api.events")
+
+    # ---------- Cached resources ----------
+    async def _dose_statuses(self, snapshot, today):
+        key = (snapshot.version, today)
+        if self._statuses_key != key:
+            start = today.isoformat()
+            end = (today + timedelta(days=1)).isoformat()
+            rows = await self._loop.run_in_executor(None, self.store.doses_between, start, end)
+            statuses = {(med_id, due_at): status for _, med_id, due_at, status in rows}
+            # events received while loading are newer than the rows
+            statuses.update(self._statuses if self._statuses_key and self._statuses_key[1] == today else {})
+            self._statuses, self._statuses_key = statuses, key
+        return self._statuses
+
+    async def _resource(self, path, query):
+        """(canonical cache path, cache key, function building the JSON value) for a GET path
+
+        The build function may be a coroutine function; it is only called on a
+        cache miss, so journal rows are read from the database only then.
+        """
+        snapshot = self.store.current()
+        parts = [p for p in path.split("/") if p]
+        if parts[:1] != ["api"]:
+            raise NotFound(path)
+        parts = parts[1:]
+
+        if parts == ["users"]:
+            return "/api/users", snapshot.version, lambda: render_users(snapshot)
+        if parts == ["stock"]:
+            return "/api/stock", snapshot.version, lambda: render_stock(snapshot)
+        if parts == ["doses", "today"]:
+            today = self.store.clock.today()
+            statuses = await self._dose_statuses(snapshot, today)
+            return ("/api/doses/today", (snapshot.version, today, self._event_id),
+                    lambda: render_doses_today(snapshot, today, statuses))
+        if len(parts) == 3 and parts[0] == "users" and parts[1].isdigit():
+            user_id = int(parts[1])
+            if parts[2] == "medications":
+                return (f"/api/users/{user_id}/medications", snapshot.version,
+                        lambda: render_medications(snapshot, user_id))
+            if parts[2] == "journals":
+                if snapshot.user(user_id) is None:
+                    raise NotFound(f"user {user_id}")
+                days = parse_days(query.get("days", [str(DEFAULT_JOURNAL_DAYS)])[0])
+                end = self.store.clock.today()
+                start = end - timedelta(days=days)
+
+                async def load():
+                    rows = await self._loop.run_in_executor(
+                        None, self.store.journal_entries, user_id, start.isoformat(), end.isoformat())
+                    return lambda: [{"date": d, "text": text} for d, text in rows]
+
+                return (f"/api/users/{user_id}/journals?days={days}",
+                        (self.store.revision, self.store.journal_revision, end), load)
+        raise NotFound(path)
+
+    async def _get(self, path, query, if_none_match):
+        cache_path, key, build = await self._resource(path, query)
+        cached = self._cache.get(cache_path)
+        if cached is None or cached[0] != key:
+            if asyncio.iscoroutinefunction(build):
+                build = await build()
+            with perf_metrics.timer("api.render"):
+                body = json.dumps(build(), default=str).encode()
+            # derived from the body, so a tag stays valid across restarts only while the data is the same
+            cached = (key, f'"{hashlib.sha1(body).hexdigest()}"', body)
+            self._cache[cache_path] = cached
+            perf_metrics.count("api.cache_miss")
+        else:
+            perf_metrics.count("api.cache_hit")
+        _, etag, body = cached
+        if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Content-Type": "application/json", "Cache-Control": "no-cache"}, body
+
+    # ---------- Access control ----------
+    def _authorized(self, headers, query):
+        if not self.token:
+            return True
+        auth = headers.get("authorization", "")
+        supplied = auth[7:].strip() if auth.lower().startswith("bearer ") else query.get("token", [""])[0]
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    def _cors_headers(self, origin):
+        """CORS headers for an allow-listed Origin; nothing for any other page"""
+        if origin and origin in self.allowed_origins:
+            return {"Access-Control-Allow-Origin": origin, "Vary": "Origin"}
+        return {}
+
+    # ---------- HTTP ----------
+    @staticmethod
+    async def _write(writer, status, headers, body, keep_alive=True):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        headers = dict(headers, **{"Content-Length": str(len(body)),
+                                   "Connection": "keep-alive" if keep_alive else "close"})
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return None
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = request_line.split(" ")
+        except ValueError:
+            return "BAD", None, None, {}
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if method == "BAD":
+                    await self._write(writer, 400, {}, b"", keep_alive=False)
+                    break
+                cors = self._cors_headers(headers.get("origin"))
+                if method == "OPTIONS":
+                    # CORS preflight; carries no credentials, and only allow-listed origins get the headers
+                    preflight = dict(cors, **{"Access-Control-Allow-Methods": "GET, HEAD",
+                                              "Access-Control-Allow-Headers": "Authorization, If-None-Match, "
+                                                                              "Last-Event-ID",
+                                              "Access-Control-Max-Age": "600"}) if cors else {}
+                    await self._write(writer, 204, preflight, b"", keep_alive)
+                    continue
+                if method not in ("GET", "HEAD"):
+                    await self._write(writer, 405, dict(cors, Allow="GET, HEAD"), b"", keep_alive)
+                    continue
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                if not self._authorized(headers, query):
+                    perf_metrics.count("api.status_401")
+                    await self._write(writer, 401, dict(cors, **{"WWW-Authenticate": "Bearer",
+                                                                 "Content-Type": "application/json"}),
+                                      json.dumps({"error": "missing or wrong api token"}).encode(), keep_alive)
+                    continue
+                if url.path == "/api/events":
+                    await self._stream_events(writer, headers.get("last-event-id"), cors)
+                    break
+                try:
+                    status, response_headers, body = await self._get(url.path, query, headers.get("if-none-match"))
+                except NotFound as e:
+                    status, response_headers, body = 404, {"Content-Type": "application/json"}, \
+                        json.dumps({"error": f"not found: {e}"}).encode()
+                except ValueError as e:
+                    status, response_headers, body = 400, {"Content-Type": "application/json"}, \
+                        json.dumps({"error": str(e)}).encode()
+                perf_metrics.count(f"api.status_{status}")
+                response_headers = dict(response_headers, **cors)
+                if method == "HEAD":
+                    response_headers = dict(response_headers, **{"Content-Length": str(len(body))})
+                    body = b""
+                await self._write(writer, status, response_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # client went away, or the server is shutting down
+            pass
+        except Exception as e:
+            log.exception("API request failed: %s", e)
+        finally:
+            writer.close()
+
+    async def _stream_events(self, writer, last_event_id, cors):
+        client = asyncio.Queue(maxsize=CLIENT_QUEUE)
+        extra = "".join(f"{name}: {value}\r\n" for name, value in cors.items())
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                      f"Connection: keep-alive\r\n{extra}\r\nretry: 3000\n\n").encode())
+        if last_event_id and last_event_id.isdigit():
+            for event_id, message in self._recent:
+                if event_id > int(last_event_id):
+                    writer.write(message)
+        self._clients.add(client)
+        perf_metrics.gauge("api.sse_clients", len(self._clients))
+        try:
+            await writer.drain()
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.get(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    message = b": keep-alive\n\n"
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self._clients.discard(client)
+            perf_metrics.gauge("api.sse_clients", len(self._clients))
+
+    # ---------- Lifecycle ----------
+    async def _refresh_forever(self):
+        # pick up changes made by other programs without a query per request
+        while True:
+            try:
+                await self._loop.run_in_executor(None, self.store.refresh)
+            except Exception as e:
+                log.warning("API store refresh failed: %s", e)
+            await asyncio.sleep(REFRESH_S)
+
+    async def _serve(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                                  limit=MAX_HEADER_BYTES)
+        refresher = asyncio.ensure_future(self._refresh_forever())
+        log.info("Dashboard API listening on http://%s:%d/api/", self.host, self.port)
+        self._ready.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            refresher.cancel()
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except asyncio.CancelledError:
+            pass
+        except OSError as e:
+            log.error("Dashboard API could not start on %s:%d: %s", self.host, self.port, e)
+        finally:
+            # let open client connections (SSE streams, keep-alives) unwind before the loop goes
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._ready.set()
+            self._loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True, name="medtime-api")
+        self._thread.start()
+        self._ready.wait(5)
+        return self._thread
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
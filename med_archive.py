@@ -0,0 +1,65 @@
+"""
+Archive of expired prescriptions.
+
+Medications whose stop_after_date has passed are moved out of
+users.medication_data into medication_archive by a daily job
+(MedicationStore.daily_maintenance), so ticks, renders and stock checks only
+ever see live medications. Archived rows keep the full medication JSON and
+can be restored from the Medication History window.
+"""
+import json
+from datetime import datetime
+
+from date_codec import parse_date
+
+
+def ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS medication_archive (
+            archive_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            med_id TEXT,
+            medication_data TEXT NOT NULL,
+            stop_after_date TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_medication_archive_user ON medication_archive (user_id, archived_at)")
+
+
+def is_expired(med, today):
+    stop = parse_date(med.get("stop_after_date"))
+    return stop is not None and stop < today
+
+
+def split_expired(meds, today):
+    """(live, expired) lists"""
+    live, expired = [], []
+    for med in meds:
+        (expired if is_expired(med, today) else live).append(med)
+    return live, expired
+
+
+def insert_archived(conn, user_id, meds, when=None):
+    stamp = (when or datetime.now()).isoformat(timespec="seconds")
+    conn.executemany(
+        "INSERT INTO medication_archive (user_id, med_id, medication_data, stop_after_date, archived_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(user_id, m.get("med_id"), json.dumps(m), m.get("stop_after_date"), stamp) for m in meds])
+
+
+def list_archived(conn, user_id):
+    """[(archive_id, medication dict, archived_at)] newest first"""
+    rows = conn.execute("SELECT archive_id, medication_data, archived_at FROM medication_archive "
+                        "WHERE user_id = ? ORDER BY archived_at DESC, archive_id DESC", (user_id,)).fetchall()
+    return [(archive_id, json.loads(data), archived_at) for archive_id, data, archived_at in rows]
+
+
+def take_archived(conn, archive_id):
+    """Delete one archive row and return (user_id, medication dict), or None"""
+    row = conn.execute("SELECT user_id, medication_data FROM medication_archive WHERE archive_id = ?",
+                       (archive_id,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("DELETE FROM medication_archive WHERE archive_id = ?", (archive_id,))
+    return row[0], json.loads(row[1])
@@ -0,0 +1,61 @@
+"""
+SQLite queries used by MedicationTime.py, the tools and the benchmarks.
+"""
+import json
+import sqlite3
+
+import perf_metrics
+
+
+@perf_metrics.timed("db.fetch_users")
+def fetch_users(db_path):
+    """Return (user_id, first_name, last_name, medication_data) rows"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT user_id, first_name, last_name, medication_data FROM users")
+    users = c.fetchall()
+    conn.close()
+    return users
+
+@perf_metrics.timed("db.fetch_medications")
+def fetch_medications(db_path, user_id):
+    """Return the decoded medication list for one user"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT medication_data FROM users WHERE user_id = ?", (user_id,))
+    raw = c.fetchone()
+    conn.close()
+    return json.loads(raw[0]) if raw and raw[0] else []
+
+@perf_metrics.timed("db.fetch_journal_entries")
+def fetch_journal_entries(db_path, user_id, start_date, end_date):
+    """Return (date, journal_text) rows for a user between two YYYY-MM-DD dates"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("""
+        SELECT date, journal_text FROM user_journals
+        WHERE user_id = ? AND date BETWEEN ? AND ?
+        ORDER BY date
+    """, (user_id, start_date, end_date))
+    entries = c.fetchall()
+    conn.close()
+    return entries
+
+@perf_metrics.timed("db.update_medications")
+def update_medications(db_path, user_id, meds):
+    """Replace a user's medication list"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("UPDATE users SET medication_data = ? WHERE user_id = ?", (json.dumps(meds), user_id))
+    conn.commit()
+    conn.close()
+
+@perf_metrics.timed("db.add_journal_entry")
+def add_journal_entry(db_path, user_id, date, journal_text):
+    """Insert one journal entry dated YYYY-MM-DD"""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("INSERT INTO user_journals (user_id, date, journal_text) VALUES (?, ?, ?)",
+              (user_id, date, journal_text))
+    conn.commit()
+    conn.close()
@@ -0,0 +1,111 @@
+"""
+Structured, leveled logging for Medication Time.
+
+Modules log through the standard library with lazy %-style arguments:
+
+    log = logging.getLogger("medtime.scheduler")
+    log.debug("Skipping %s - not scheduled for today", name, extra={"user_id": uid})
+
+so a disabled DEBUG call costs one cached level check and never formats its
+message. setup_logging() attaches:
+
+  * a rotating JSON-lines file handler (medication_time.log, 1 MB x 5),
+  * an in-memory ring buffer of recent events for the Performance window,
+  * a console handler for warnings and errors only, so the alert loop never
+    does synchronous stdout I/O.
+
+The level comes from settings.json ("log_level") or MEDTIME_LOG_LEVEL.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+LOG_PATH = 'medication_time.log'
+DEFAULT_LEVEL = "INFO"
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def record_fields(record):
+    """Return the structured fields passed with extra={...}"""
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """Keep the most recent records in memory; messages are formatted only when read"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+        self._formatter = JsonLineFormatter()
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def recent(self, limit=200, min_level=logging.NOTSET):
+        records = [r for r in list(self.records) if r.levelno >= min_level][-limit:]
+        return [json.loads(self._formatter.format(r)) for r in records]
+
+
+ring_buffer = RingBufferHandler()
+_configured = threading.Lock()
+
+
+def resolve_level(settings=None):
+    level = os.environ.get("MEDTIME_LOG_LEVEL") or (settings or {}).get("log_level") or DEFAULT_LEVEL
+    return logging.getLevelName(str(level).upper()) if not isinstance(level, int) else level
+
+
+def setup_logging(settings=None, log_path=LOG_PATH):
+    """Configure the "medtime" logger tree once; safe to call again"""
+    logger = logging.getLogger("medtime")
+    with _configured:
+        if logger.handlers:
+            return logger
+
+        level = resolve_level(settings)
+        if not isinstance(level, int):
+            level = logging.INFO
+        logger.setLevel(level)
+        logger.propagate = False
+
+        try:
+            file_handler = RotatingFileHandler(log_path, maxBytes=1_000_000, backupCount=5, encoding="utf-8")
+            file_handler.setFormatter(JsonLineFormatter())
+            logger.addHandler(file_handler)
+        except OSError as e:
+            print(f"Could not open log file {log_path}: {e}", file=sys.stderr)
+
+        logger.addHandler(ring_buffer)
+
+        console = logging.StreamHandler()
+        console.setLevel(logging.WARNING)
+        console.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        logger.addHandler(console)
+    return logger
+
+
+def recent_events(limit=200, min_level=logging.NOTSET):
+    """Most recent log events as dicts, oldest first"""
+    return ring_buffer.recent(limit, min_level)
@@ -0,0 +1,232 @@
+"""
+UI-free medication logic shared by MedicationTime.py, the import tool and the
+benchmarks: dosage frequency checks (compiled rules from recurrence.py),
+days-of-supply, dose time parsing, the minute-of-day dose index behind the
+alert tick, the low-stock scan and medication card formatting.
+"""
+import json
+import logging
+from datetime import datetime
+
+from date_codec import format_time_12h, parse_date, to_display
+from recurrence import med_recurrence, rule_for_dosage, rule_rate
+
+log = logging.getLogger("medtime.scheduler")
+
+CARD_LABELS = {
+    "medication_name": "Medication",
+    "doctor_name": "Doctor",
+    "date_prescribed": "Prescribed on",
+    "stop_after_date": "End Medication on",
+    "dosage_instructions": "Instructions",
+    "stock": "Doses Remaining",
+    "scheduled_times": "Scheduled for"
+}
+
+
+def user_meds(user):
+    """Medication list of a user row, whether it holds raw JSON (med_db) or parsed meds (MedicationStore)"""
+    med_data = user[3]
+    if isinstance(med_data, (list, tuple)):
+        return med_data
+    return json.loads(med_data) if med_data else []
+
+
+# ---------- Helper Functions for Extended Dosage Logic ----------
+def should_alert_today(med, current_date):
+    """
+    Determine if medication should alert today based on its recurrence rule
+    """
+    rule = med_recurrence(med)
+    if rule is None:
+        return True  # Default to daily if no (parseable) start date
+    return rule.occurs_on(current_date)
+
+def active_times(med, current_date):
+    """Scheduled times that apply on current_date (tapering rules use only the first few)"""
+    times = med.get("scheduled_times") or ()
+    rule = med_recurrence(med)
+    doses = rule.doses_on(current_date) if rule is not None else None
+    return times if doses is None else sorted(times)[:doses]
+
+def calculate_days_supply(stock, dosage_instructions, scheduled_times, recurrence=None):
+    """
+    Calculate days of supply based on the recurrence rule (or the old dosage string)
+    """
+    doses_per_day = len(scheduled_times) if scheduled_times else 1
+    try:
+        rate = rule_rate(recurrence or rule_for_dosage(dosage_instructions))
+    except ValueError:
+        rate = rule_rate(rule_for_dosage(dosage_instructions))
+    return int(stock // (doses_per_day * rate)) if doses_per_day > 0 else 0
+
+
+# ---------- Dose Times ----------
+def parse_times(value):
+    """
+    Sorted, de-duplicated HH:MM strings from a list or a ';'/','-separated string.
+
+    Accepts 24-hour ("07:15", "7:15") and 12-hour ("7:15 PM", "9pm") input.
+    """
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = value.replace(",", ";").split(";")
+    times = set()
+    for t in value:
+        t = str(t).strip().upper().replace(" ", "")
+        if not t:
+            continue
+        for fmt in ("%H:%M", "%I:%M%p", "%I%p"):
+            try:
+                times.add(datetime.strptime(t, fmt).strftime("%H:%M"))
+                break
+            except ValueError:
+                pass
+        else:
+            raise ValueError(f"unrecognised time '{t}'")
+    return sorted(times)
+
+def every_n_hours(first, hours):
+    """Dose times spaced `hours` apart through the day, starting at `first` (HH:MM)"""
+    if not 1 <= hours <= 24:
+        raise ValueError("hours must be between 1 and 24")
+    start = datetime.strptime(first, "%H:%M")
+    minute = start.hour * 60 + start.minute
+    return sorted({f"{m // 60 % 24:02d}:{m % 60:02d}" for m in range(minute, minute + 24 * 60, hours * 60)})
+
+def minute_of_day(time_str):
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+# ---------- Alert Tick ----------
+def build_time_index(users):
+    """
+    Minute-of-day -> dose bucket index over every user's medications.
+
+    Returns {minute: ((user_id, fname, lname, med_index, med, time_str), ...)}.
+    Finding what is due in a given minute is then a dict lookup, however many
+    distinct dose times there are. Build it once per snapshot.
+    """
+    buckets = {}
+    for user in users:
+        user_id, fname, lname, _ = user
+        try:
+            meds = user_meds(user)
+        except Exception as e:
+            log.warning("Error parsing medication data for user %s: %s", fname, e, extra={"user_id": user_id})
+            continue
+        for idx, med in enumerate(meds):
+            for t in med.get("scheduled_times", ()):
+                try:
+                    minute = minute_of_day(t)
+                except ValueError as e:
+                    log.debug("Error processing scheduled time %r: %s", t, e, extra={"user_id": user_id})
+                    continue
+                buckets.setdefault(minute, []).append((user_id, fname, lname, idx, med, t))
+    return {minute: tuple(entries) for minute, entries in buckets.items()}
+
+def _still_active(med, current_date):
+    # Check if medication should still be active
+    stop_date = parse_date(med.get("stop_after_date"))
+    return stop_date is None or current_date <= stop_date
+
+def find_due_doses(users, now, alerted, index=None):
+    """
+    Find the doses due within a minute of `now`.
+
+    Returns {(user_id, time): [(med, med_index, alert_key, fname, lname), ...]},
+    leaving out doses whose alert_key is already in `alerted`. Pass the
+    build_time_index() of `users` as `index` to avoid rebuilding it.
+    """
+    if index is None:
+        index = build_time_index(users)
+    today_key = now.strftime("%Y-%m-%d")
+    current_date = now.date()
+    now_minute = now.hour * 60 + now.minute
+    now_seconds = now_minute * 60 + now.second + now.microsecond / 1e6
+
+    # ✅ NEW: Group medications by user and time
+    user_time_meds = {}  # {(user_id, time): [(med, med_index), ...]}
+
+    # Only the buckets next to the current minute can be within the 1 minute window
+    for minute in (now_minute - 1, now_minute, now_minute + 1):
+        if abs(minute * 60 - now_seconds) > 60:
+            continue
+        for user_id, fname, lname, idx, med, t in index.get(minute, ()):
+            if not _still_active(med, current_date):
+                continue
+
+            # ✅ IMPROVED: Check if medication should alert today based on dosage frequency
+            if not should_alert_today(med, current_date) or t not in active_times(med, current_date):
+                log.debug("Skipping %s - not scheduled for today", med.get('medication_name', 'Unknown'))
+                continue
+
+            key = (user_id, t)
+            if key not in user_time_meds:
+                user_time_meds[key] = []
+
+            # Check if this specific medication hasn't been alerted today. Keyed on the
+            # stable med_id: list positions shift when a medication is archived or deleted.
+            alert_key = f"{today_key}-{user_id}-{med.get('med_id') or idx}-{t}"
+            if alert_key not in alerted:
+                user_time_meds[key].append((med, idx, alert_key, fname, lname))
+
+    return user_time_meds
+
+
+# ---------- Stock Levels ----------
+def find_low_stock(users, today):
+    """Return a message for every medication with less than 5 days of supply left"""
+    alerts = []
+
+    for user in users:
+        user_name = f"{user[1]} {user[2]}"
+        try:
+            medications = user_meds(user)
+        except Exception as e:
+            continue
+
+        for med in medications:
+            stock = med.get("stock", 0)
+            scheduled_times = med.get("scheduled_times", [])
+            dosage_instructions = med.get("dosage_instructions", "once per day")
+
+            # ✅ MODIFIED: Use new calculation function
+            days_left = calculate_days_supply(stock, dosage_instructions, scheduled_times, med.get("recurrence"))
+
+            stop_date = parse_date(med.get("stop_after_date"))
+
+            # Only alert if days left < 5 AND medication isn't ending within 5 days
+            if days_left < 5 and (not stop_date or (stop_date - today).days > 5):
+                alerts.append(f"{user_name} is running low on {med.get('medication_name')} ({days_left} days left)")
+
+    return alerts
+
+
+# ---------- Medication Cards ----------
+def filter_meds(meds, filter_val):
+    """Return (index, med) pairs whose name contains filter_val (case-insensitive)"""
+    filter_val = filter_val.lower()
+    return [(i, m) for i, m in enumerate(meds)
+            if not filter_val or filter_val in m.get("medication_name", "").lower()]
+
+def format_med_card(m):
+    """Build the multi-line text shown on a medication card"""
+    # ✅ IMPROVED: Memoized date/time formatting (no strptime once a value has been seen)
+    display_med = {}
+    for k, v in m.items():
+        if k in ("date_prescribed", "stop_after_date") and v:
+            display_med[k] = to_display(v)
+        elif k == "scheduled_times" and isinstance(v, (list, tuple)):
+            # 24-hour times shown in 12-hour format
+            display_med[k] = ", ".join(format_time_12h(t) for t in v)
+        else:
+            display_med[k] = v
+
+    return "\n".join([
+        f"{CARD_LABELS.get(k, k)}: {v}"
+        for k, v in display_med.items()
+        if k in CARD_LABELS  # Only show mapped fields
+    ])
@@ -0,0 +1,406 @@
+"""
+In-memory, write-through repository of users and their medications.
+
+The app used to call fetch_users() and json.loads() every blob on every
+render and scheduler tick. MedicationStore keeps the parsed rows in memory on
+one long-lived connection and only reloads when the data actually changed:
+
+  * writes made through the store update the cache directly (write-through);
+  * writes from any other connection or process (the setup tool, bulk_import,
+    another copy of the app) bump SQLite's PRAGMA data_version, which the
+    store polls at most once per `check_interval` seconds.
+
+So a burst of renders (e.g. typing in the search box) or a scheduler tick
+normally runs no SQL at all.
+
+Data is published as immutable HouseholdSnapshot objects (see snapshots.py).
+Writers build a new snapshot under the store lock and swap it in with one
+assignment; using a snapshot never needs the lock. snapshot() only takes it
+for the data_version check, at most once per check_interval; current()
+never does.
+
+Every medication carries a stable "med_id" and a "recurrence" rule (both
+backfilled on load if missing), and saves keep the materialized dose_instances rows (see dose_instances.py)
+in step in the same transaction. Expired prescriptions are moved to
+medication_archive once a day (see med_archive.py), so the snapshot only
+holds live medications. Every stock change is also appended to the
+stock_transactions ledger (see stock_ledger.py) in the same transaction.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import dose_instances
+import med_archive
+import perf_metrics
+import refill_forecast
+import schema_migrations
+import stock_ledger
+from clock import SYSTEM
+from date_codec import normalize_medications
+from recurrence import rule_for_dosage
+from snapshots import HouseholdSnapshot, make_user, thaw_medication
+
+log = logging.getLogger("medtime.store")
+
+
+class MedicationStore:
+    """
+    shard=(index, count) loads only users with user_id % count == index, and
+    read_only=True skips the migrations and dose_instances upkeep; facility
+    mode uses both for its per-process replicas (see facility.py). Dates
+    ("today", ledger timestamps) come from `clock` (see clock.py), and
+    migration_progress is handed to schema_migrations.migrate().
+    """
+    def __init__(self, db_path, check_interval=1.0, shard=None, read_only=False, clock=None,
+                 migration_progress=None):
+        self.db_path = db_path
+        self.clock = clock or SYSTEM
+        self.check_interval = check_interval
+        self.shard = shard
+        self.read_only = read_only
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._snapshot = HouseholdSnapshot(0)
+        self._data_version = None
+        self._last_check = 0.0
+        self._consumption = refill_forecast.ConsumptionCache()
+        self._journal_revision = 0
+        if not read_only:
+            schema_migrations.migrate(self._conn, progress=migration_progress)
+        self.refresh(force=True)
+
+    @property
+    def revision(self):
+        """Bumped on every reload or write made through the store"""
+        return self._snapshot.version
+
+    @property
+    def journal_revision(self):
+        """Bumped on every journal entry added through the store (outside changes bump revision)"""
+        return self._journal_revision
+
+    # ---------- Change detection ----------
+    def _current_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self, force=False, replaced=False):
+        """
+        Reload from the database if another connection changed it; returns True
+        if reloaded. Pass replaced=True after the file was swapped (a backup
+        restore): cached ledger history is dropped, and dose rows are checked
+        against the file's own schedule fingerprints, not the old snapshot.
+        """
+        with self._lock:
+            if replaced:
+                force = True
+                self._consumption = refill_forecast.ConsumptionCache()
+                self._journal_revision += 1
+            now = time.monotonic()
+            if not force and now - self._last_check < self.check_interval:
+                perf_metrics.count("store.cache_hit")
+                return False
+            self._last_check = now
+
+            version = self._current_data_version()
+            if not force and version == self._data_version:
+                perf_metrics.count("store.cache_hit")
+                return False
+
+            with perf_metrics.timer("db.store_reload"):
+                if self.shard is None:
+                    rows = self._conn.execute(
+                        "SELECT user_id, first_name, last_name, medication_data FROM users").fetchall()
+                else:
+                    index, count = self.shard
+                    rows = self._conn.execute(
+                        "SELECT user_id, first_name, last_name, medication_data FROM users WHERE user_id % ? = ?",
+                        (count, index)).fetchall()
+            users = []
+            for user_id, first, last, med_json in rows:
+                try:
+                    meds = json.loads(med_json) if med_json else []
+                except ValueError as e:
+                    log.warning("Error parsing medication data for user %s: %s", first, e,
+                                extra={"user_id": user_id})
+                    meds = []
+                if not self.read_only and self._backfill_medications(meds):
+                    # one-time backfill: stable ids for dose history, recurrence rules for old dosage strings
+                    self._conn.execute("UPDATE users SET medication_data = ? WHERE user_id = ?",
+                                       (json.dumps(meds), user_id))
+                    self._conn.commit()
+                    log.info("Migrated medication data for user %s", user_id, extra={"user_id": user_id})
+                users.append(make_user(user_id, first, last, meds, self._snapshot.user(user_id)))
+
+            old_snapshot = self._snapshot
+            self._snapshot = HouseholdSnapshot(old_snapshot.version + 1, tuple(users))
+            if not self.read_only:
+                self._sync_derived_tables(HouseholdSnapshot(0) if replaced else old_snapshot, self._snapshot)
+            self._data_version = version
+            perf_metrics.count("store.reload")
+            log.debug("Reloaded %d users (data_version %s, revision %d)", len(users), version, self.revision)
+            return True
+
+    def _sync_derived_tables(self, old_snapshot, new_snapshot):
+        """
+        Bring dose rows and the stock ledger in line with changes made by
+        another connection. Users missing from old_snapshot (all of them on
+        the first load) are checked against the stored schedule fingerprints
+        and ledger balances, so an unchanged household writes nothing.
+        """
+        today = self.clock.today()
+        with self._conn:
+            for user in new_snapshot.users:
+                old = old_snapshot.user(user.user_id)
+                old_meds = old.medications if old is not None else None
+                if old_meds != user.medications:
+                    dose_instances.sync_medications(self._conn, user.user_id, old_meds, user.medications, today)
+                    stock_ledger.record_changes(self._conn, user.user_id, user.medications, "adjust",
+                                                note="changed outside the app", when=self.clock.now())
+
+    # ---------- Reads ----------
+    def snapshot(self):
+        """Latest snapshot, checking the database for outside changes first when check_interval has passed"""
+        if time.monotonic() - self._last_check < self.check_interval:
+            perf_metrics.count("store.cache_hit")     # lock-free fast path
+        else:
+            self.refresh()
+        return self._snapshot
+
+    def current(self):
+        """The last published snapshot without any locking or SQL"""
+        return self._snapshot
+
+    def users(self):
+        """Immutable UserRecord rows (user_id, first_name, last_name, medications)"""
+        return self.snapshot().users
+
+    def user(self, user_id):
+        return self.snapshot().user(user_id)
+
+    def medications(self, user_id):
+        """A private copy of one user's medication list, safe to edit and pass to save_medications()"""
+        user = self.user(user_id)
+        return [thaw_medication(m) for m in user.medications] if user else []
+
+    def doses_between(self, start, end, user_id=None):
+        """Materialized dose rows (user_id, med_id, due_at, status) with start <= due_at < end"""
+        with self._lock, perf_metrics.timer("db.doses_between"):
+            return dose_instances.doses_between(self._conn, start, end, user_id)
+
+    # ---------- Writes ----------
+    @staticmethod
+    def _backfill_medications(meds):
+        """
+        Give every medication a med_id and a recurrence rule and store its
+        dates as YYYY-MM-DD; returns True if anything changed
+        """
+        changed = normalize_medications(meds)
+        for med in meds:
+            if not isinstance(med, dict):
+                continue
+            if not med.get("med_id"):
+                med["med_id"] = dose_instances.new_med_id()
+                changed = True
+            if not med.get("recurrence"):
+                # migrate the old dosage strings into recurrence rules
+                med["recurrence"] = rule_for_dosage(med.get("dosage_instructions"))
+                changed = True
+        return changed
+
+    def _write_medications(self, user_id, meds, stock_kind="adjust", note=None):
+        # caller holds the lock and an open transaction
+        user = self._snapshot.user(user_id)
+        old_meds = user.medications if user is not None else ()
+        self._conn.execute("UPDATE users SET medication_data = ? WHERE user_id = ?",
+                           (json.dumps(meds), user_id))
+        dose_instances.sync_medications(self._conn, user_id, old_meds, meds, self.clock.today())
+        stock_ledger.record_changes(self._conn, user_id, meds, stock_kind, note, when=self.clock.now())
+
+    def _publish(self, user_id, meds):
+        snap = self._snapshot
+        user = snap.user(user_id)
+        if user is not None:
+            record = make_user(user_id, user.first_name, user.last_name, meds, user)
+            self._snapshot = snap.replace_user(record, snap.version + 1)
+
+    def save_medications(self, user_id, meds, stock_kind="adjust", note=None):
+        """
+        Replace a user's medication list in the database and in the cache.
+
+        Stock changes are appended to the stock ledger as `stock_kind`
+        transactions in the same database transaction.
+        """
+        with self._lock, perf_metrics.timer("db.save_medications"):
+            self._backfill_medications(meds)
+            with self._conn:
+                self._write_medications(user_id, meds, stock_kind, note)
+            self._publish(user_id, meds)
+
+    def update_medications(self, user_id, mutate, stock_kind="adjust", note=None):
+        """
+        Atomically read-modify-write one user's medications.
+
+        mutate(meds) edits the list in place; its return value is passed back.
+        Nothing is written if it raises.
+        """
+        with self._lock:
+            meds = self.medications(user_id)
+            result = mutate(meds)
+            self.save_medications(user_id, meds, stock_kind, note)
+            return result
+
+    def record_doses(self, user_id, updates):
+        """Set the status of dose instances; updates is [(med_id, due_at, status)]"""
+        with self._lock, self._conn, perf_metrics.timer("db.record_doses"):
+            dose_instances.set_statuses(self._conn, user_id, updates, when=self.clock.now())
+
+    def apply_doses(self, doses):
+        """
+        Record answered dose alerts for any number of users in one transaction.
+
+        doses maps user_id -> [(med_id, due_at, status)]; every 'taken' dose
+        takes one unit off that medication's stock. A dose taken with the
+        stock already at 0 leaves the stock at 0 but is still written to the
+        ledger, so the refill forecast sees it. Returns the number taken.
+        """
+        with self._lock, perf_metrics.timer("db.apply_doses"):
+            changed, unstocked, taken = {}, {}, 0
+            for user_id, updates in doses.items():
+                taken_ids = [med_id for med_id, _, status in updates if status == "taken"]
+                if not taken_ids:
+                    continue
+                meds = self.medications(user_id)
+                by_id = {m.get("med_id"): m for m in meds}
+                for med_id in taken_ids:
+                    med = by_id.get(med_id)
+                    if med is not None:
+                        if med.get("stock", 0) > 0:
+                            med["stock"] -= 1
+                        else:
+                            unstocked[(user_id, med_id)] = unstocked.get((user_id, med_id), 0) + 1
+                        taken += 1
+                changed[user_id] = meds
+            with self._conn:
+                for user_id, meds in changed.items():
+                    self._write_medications(user_id, meds, "dose")
+                for (user_id, med_id), count in unstocked.items():
+                    stock_ledger.record_unstocked_doses(self._conn, user_id, med_id, count, when=self.clock.now())
+                for user_id, updates in doses.items():
+                    dose_instances.set_statuses(self._conn, user_id, updates, when=self.clock.now())
+            for user_id, meds in changed.items():
+                self._publish(user_id, meds)
+            return taken
+
+    def roll_dose_horizon(self, today=None):
+        """Daily job: extend dose_instances through the horizon and mark yesterday's open doses missed"""
+        today = today or self.clock.today()
+        users = self.snapshot().users
+        with self._lock, self._conn, perf_metrics.timer("db.roll_dose_horizon"):
+            added = dose_instances.materialize_horizon(self._conn, users, today)
+            missed = dose_instances.mark_missed(self._conn, datetime.combine(today, datetime.min.time()),
+                                                when=self.clock.now())
+        log.info("Dose horizon rolled to %s (%d candidate rows, %d marked missed)",
+                 today + timedelta(days=dose_instances.HORIZON_DAYS), added, missed)
+
+    # ---------- Stock ledger ----------
+    def stock_consumed(self, med_id, start, end, kinds=stock_ledger.CONSUMPTION_KINDS):
+        """Pills used between two ISO dates (end exclusive)"""
+        with self._lock, perf_metrics.timer("db.stock_consumed"):
+            return stock_ledger.consumed(self._conn, med_id, start, end, kinds)
+
+    def stock_history(self, med_id, limit=50):
+        with self._lock, perf_metrics.timer("db.stock_history"):
+            return stock_ledger.history(self._conn, med_id, limit)
+
+    def refill_forecast(self, today=None, user_id=None):
+        """Ranked refill Forecasts for the household (or one user) from the ledger's recent consumption"""
+        today = today or self.clock.today()
+        snapshot = self.snapshot()
+        if user_id is None:
+            users = snapshot.users
+        else:
+            user = snapshot.user(user_id)
+            users = [user] if user is not None else []
+        with self._lock, perf_metrics.timer("db.load_consumption"):
+            usage, first_seen = self._consumption.load(self._conn, today)
+        return refill_forecast.forecast_household(users, usage, first_seen, today)
+
+    # ---------- Archive ----------
+    def archive_expired(self, today=None):
+        """Move medications past their stop date into medication_archive; returns how many moved"""
+        today = today or self.clock.today()
+        moved = 0
+        with self._lock, perf_metrics.timer("db.archive_expired"):
+            for user in self.snapshot().users:
+                live, expired = med_archive.split_expired([thaw_medication(m) for m in user.medications], today)
+                if not expired:
+                    continue
+                with self._conn:
+                    med_archive.insert_archived(self._conn, user.user_id, expired, when=self.clock.now())
+                    self._write_medications(user.user_id, live)
+                self._publish(user.user_id, live)
+                moved += len(expired)
+                log.info("Archived %d expired medication(s) for user %s", len(expired), user.user_id,
+                         extra={"user_id": user.user_id})
+        return moved
+
+    def archived_medications(self, user_id):
+        """[(archive_id, medication dict, archived_at)] for the history view, newest first"""
+        with self._lock, perf_metrics.timer("db.archived_medications"):
+            return med_archive.list_archived(self._conn, user_id)
+
+    def restore_medication(self, archive_id):
+        """
+        Move an archived medication back into its user's active list.
+
+        Its stop date is cleared so tonight's archiver does not move it straight
+        back; edit the medication to set a new one. Returns the restored dict.
+        Raises ValueError, leaving the archive row in place, if the archive row
+        or its user no longer exists.
+        """
+        with self._lock, perf_metrics.timer("db.restore_medication"):
+            with self._conn:
+                taken = med_archive.take_archived(self._conn, archive_id)
+                if taken is None:
+                    raise ValueError(f"archived medication {archive_id} not found")
+                user_id, med = taken
+                # read the list inside this transaction: raising here rolls back the archive delete
+                row = self._conn.execute("SELECT medication_data FROM users WHERE user_id = ?",
+                                         (user_id,)).fetchone()
+                if row is None:
+                    raise ValueError(f"user {user_id} of archived medication {archive_id} no longer exists")
+                med["stop_after_date"] = None
+                meds = (json.loads(row[0]) if row[0] else []) + [med]
+                self._backfill_medications(meds)
+                self._write_medications(user_id, meds)
+            self._publish(user_id, meds)
+            return med
+
+    def daily_maintenance(self, today=None):
+        """Run once a day by the scheduler: archive expired prescriptions, then roll the dose horizon"""
+        today = today or self.clock.today()
+        self.archive_expired(today)
+        self.roll_dose_horizon(today)
+
+    def add_journal_entry(self, user_id, date, journal_text):
+        """Insert a journal entry on the store's connection (journals are not cached)"""
+        with self._lock, perf_metrics.timer("db.add_journal_entry"):
+            self._conn.execute("INSERT INTO user_journals (user_id, date, journal_text) VALUES (?, ?, ?)",
+                               (user_id, date, journal_text))
+            self._conn.commit()
+            self._journal_revision += 1
+
+    def journal_entries(self, user_id, start_date, end_date):
+        """(date, journal_text) rows for a user between two YYYY-MM-DD dates"""
+        with self._lock, perf_metrics.timer("db.journal_entries"):
+            return self._conn.execute("SELECT date, journal_text FROM user_journals "
+                                      "WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                                      (user_id, start_date, end_date)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,69 @@
+"""
+Cached view models for the medication cards.
+
+format_med_card() rebuilds a card's text from scratch. CardCache keeps one
+MedCardView per medication instead, keyed by (med_id, revision). The
+revision is the frozen medication object itself: MedicationStore reuses it
+across snapshots while the medication is unchanged (see
+snapshots.make_user), so editing one medication, adding a journal entry or
+typing in the search box re-renders every other card from cached strings.
+The low-stock flag is not part of the view: it comes from the store's
+refill forecast, the same one behind the low-stock popup.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+
+import perf_metrics
+from date_codec import format_time_12h
+from med_logic import format_med_card
+
+MAX_VIEWS = 4096
+
+
+class MedCardView(NamedTuple):
+    med_id: str
+    text: str                     # the card body, pre-formatted
+    times_12h: Tuple[str, ...]
+    search_key: str               # lower-cased name for the search box
+
+
+def build_view(med):
+    return MedCardView(med.get("med_id"), format_med_card(med),
+                       tuple(format_time_12h(t) for t in med.get("scheduled_times", ())),
+                       med.get("medication_name", "").lower())
+
+
+class CardCache:
+    """Bounded LRU of MedCardViews; safe to use from worker threads"""
+    def __init__(self, maxsize=MAX_VIEWS):
+        self.maxsize = maxsize
+        self._views = OrderedDict()    # med_id -> (frozen med, MedCardView)
+        self._lock = threading.Lock()
+
+    def view(self, med):
+        key = med.get("med_id") or id(med)
+        with self._lock:
+            cached = self._views.get(key)
+            if cached is not None and cached[0] is med:
+                self._views.move_to_end(key)
+                perf_metrics.count("views.hit")
+                return cached[1]
+        view = build_view(med)
+        perf_metrics.count("views.miss")
+        with self._lock:
+            self._views[key] = (med, view)
+            self._views.move_to_end(key)
+            while len(self._views) > self.maxsize:
+                self._views.popitem(last=False)
+        return view
+
+    def cards(self, meds, filter_val=""):
+        """(index, MedCardView) for the medications whose name contains filter_val"""
+        filter_val = filter_val.lower()
+        views = ((i, self.view(m)) for i, m in enumerate(meds))
+        return [(i, v) for i, v in views if not filter_val or filter_val in v.search_key]
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
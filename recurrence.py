@@ -0,0 +1,257 @@
+"""
+Compiled recurrence rules for medication schedules.
+
+A medication's schedule is an RRULE-like string stored in its "recurrence"
+field, for example:
+
+    FREQ=DAILY                          every day
+    FREQ=DAILY;INTERVAL=2               every other day
+    FREQ=WEEKLY;BYDAY=MO,WE,FR          three days a week
+    FREQ=MONTHLY;BYMONTHDAY=1,15        twice a month
+    FREQ=MONTHLY;BYMONTHDAY=-1          last day of every month
+    FREQ=DAILY;COUNT=10                 ten days, then stop
+    FREQ=DAILY;UNTIL=2025-12-31         until a date (inclusive; any date_codec format or YYYYMMDD)
+    FREQ=DAILY;TAPER=7:3,7:2,7:1        tapering: 3 doses a day for a week, then 2, then 1
+
+Weekly rules default to the weekday of the prescribed date and monthly rules
+to its day of month. A month day that does not exist in a shorter month
+(e.g. the 31st) falls on that month's last day instead of being skipped.
+TAPER steps are days:doses pairs; on each day the first `doses` of the
+medication's scheduled times apply, and the rule ends after the last step.
+
+Rules are compiled once per (rule, prescribed date) and cached, so
+occurs_on() is constant-time arithmetic and between() steps straight from
+one occurrence to the next instead of testing every day.
+
+The six dosage strings used before rules existed map onto LEGACY_RULES.
+"""
+import calendar
+import logging
+from bisect import bisect_right
+from datetime import date, timedelta
+from fractions import Fraction
+from functools import lru_cache
+from itertools import islice
+from types import MappingProxyType
+
+from date_codec import parse_date
+
+log = logging.getLogger("medtime.recurrence")
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+FREQS = ("DAILY", "WEEKLY", "MONTHLY")
+DEFAULT_RULE = "FREQ=DAILY"
+
+LEGACY_RULES = {
+    "once per day": "FREQ=DAILY",
+    "twice daily": "FREQ=DAILY",
+    "three times daily": "FREQ=DAILY",
+    "every other day": "FREQ=DAILY;INTERVAL=2",
+    "once per week": "FREQ=WEEKLY",
+    "once per month": "FREQ=MONTHLY",
+}
+
+_LAST_DAY = date(9999, 12, 31)
+
+
+def rule_for_dosage(dosage_instructions):
+    """Recurrence rule equivalent to one of the old dosage strings (daily if unknown)"""
+    return LEGACY_RULES.get((dosage_instructions or "").strip().lower(), DEFAULT_RULE)
+
+
+def _parse_until(value):
+    if len(value) == 8 and value.isdigit():
+        value = f"{value[:4]}-{value[4:6]}-{value[6:]}"    # RRULE's basic YYYYMMDD form
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"bad date {value!r}")
+    return parsed
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(text):
+    """
+    Split and validate a rule string; returns a read-only mapping of its parts
+    (shared through the cache) or raises ValueError
+    """
+    parts = {}
+    for item in filter(None, (p.strip() for p in (text or "").upper().split(";"))):
+        name, sep, value = item.partition("=")
+        if not sep or not value:
+            raise ValueError(f"malformed rule part {item!r}")
+        parts[name] = value
+
+    freq = parts.pop("FREQ", None)
+    if freq not in FREQS:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQS)}")
+    rule = {"freq": freq, "interval": 1, "weekdays": None, "month_days": None,
+            "count": None, "until": None, "taper": None}
+    try:
+        if "INTERVAL" in parts:
+            rule["interval"] = int(parts.pop("INTERVAL"))
+        if "COUNT" in parts:
+            rule["count"] = int(parts.pop("COUNT"))
+        if "UNTIL" in parts:
+            rule["until"] = _parse_until(parts.pop("UNTIL"))
+        if "BYDAY" in parts:
+            rule["weekdays"] = tuple(sorted({WEEKDAYS.index(d) for d in parts.pop("BYDAY").split(",")}))
+        if "BYMONTHDAY" in parts:
+            rule["month_days"] = tuple(int(d) for d in parts.pop("BYMONTHDAY").split(","))
+        if "TAPER" in parts:
+            rule["taper"] = tuple(tuple(int(n) for n in step.split(":")) for step in parts.pop("TAPER").split(","))
+    except ValueError as e:
+        raise ValueError(f"invalid rule {text!r}: {e}") from None
+
+    if parts:
+        raise ValueError(f"unsupported rule parts: {', '.join(sorted(parts))}")
+    if rule["interval"] < 1 or (rule["count"] is not None and rule["count"] < 1):
+        raise ValueError("INTERVAL and COUNT must be positive")
+    if rule["weekdays"] is not None and freq != "WEEKLY":
+        raise ValueError("BYDAY needs FREQ=WEEKLY")
+    if rule["month_days"] is not None:
+        if freq != "MONTHLY":
+            raise ValueError("BYMONTHDAY needs FREQ=MONTHLY")
+        if any(d == 0 or not -31 <= d <= 31 for d in rule["month_days"]):
+            raise ValueError("BYMONTHDAY values must be 1..31 or -31..-1")
+    if rule["taper"] is not None and any(len(s) != 2 or s[0] < 1 or s[1] < 0 for s in rule["taper"]):
+        raise ValueError("TAPER steps must be days:doses with days >= 1")
+    return MappingProxyType(rule)
+
+
+def rule_rate(text):
+    """Average occurrences per day of a rule (exact Fraction), used for days-of-supply"""
+    rule = parse_rule(text)
+    if rule["freq"] == "DAILY":
+        return Fraction(1, rule["interval"])
+    if rule["freq"] == "WEEKLY":
+        return Fraction(len(rule["weekdays"] or (0,)), 7 * rule["interval"])
+    return Fraction(len(set(rule["month_days"] or (0,))), 30 * rule["interval"])
+
+
+class Recurrence:
+    """A rule compiled against a start date"""
+    __slots__ = ("rule", "start", "freq", "interval", "weekdays", "month_days",
+                 "until", "taper", "_taper_ends", "_week0", "_month0")
+
+    def __init__(self, rule, start):
+        parts = parse_rule(rule)
+        self.rule = rule
+        self.start = start
+        self.freq = parts["freq"]
+        self.interval = parts["interval"]
+        self.weekdays = frozenset(parts["weekdays"] or (start.weekday(),))
+        self.month_days = parts["month_days"] or (start.day,)
+        self.until = parts["until"] or _LAST_DAY
+        self._week0 = start - timedelta(days=start.weekday())
+        self._month0 = start.year * 12 + start.month - 1
+
+        self.taper = parts["taper"]
+        self._taper_ends = None
+        if self.taper:
+            ends, total = [], 0
+            for days, _ in self.taper:
+                total += days
+                ends.append(total)
+            self._taper_ends = tuple(ends)
+            self.until = min(self.until, start + timedelta(days=total - 1))
+
+        if parts["count"] is not None:
+            last = None
+            for last in islice(self._iter(start, self.until), parts["count"]):
+                pass
+            if last is not None:
+                self.until = min(self.until, last)
+
+    # ---------- Membership ----------
+    def _month_targets(self, year, month):
+        dim = calendar.monthrange(year, month)[1]
+        return {min(d, dim) if d > 0 else max(dim + 1 + d, 1) for d in self.month_days}
+
+    def occurs_on(self, day):
+        """True if a dose falls on `day`; constant time"""
+        if day < self.start or day > self.until:
+            return False
+        if self.freq == "DAILY":
+            return (day - self.start).days % self.interval == 0
+        if self.freq == "WEEKLY":
+            return (day.weekday() in self.weekdays
+                    and ((day - self._week0).days // 7) % self.interval == 0)
+        if (day.year * 12 + day.month - 1 - self._month0) % self.interval:
+            return False
+        return day.day in self._month_targets(day.year, day.month)
+
+    def doses_on(self, day):
+        """Number of scheduled times that apply on day for tapering rules, None for "all of them" """
+        if self._taper_ends is None:
+            return None
+        step = bisect_right(self._taper_ends, (day - self.start).days)
+        return self.taper[step][1] if step < len(self.taper) else 0
+
+    # ---------- Expansion ----------
+    def _iter(self, first, last):
+        """Occurrences from first to last inclusive (ignores until)"""
+        first = max(first, self.start)
+        if first > last:
+            return
+        if self.freq == "DAILY":
+            offset = (first - self.start).days % self.interval
+            day = first + timedelta(days=(self.interval - offset) % self.interval)
+            step = timedelta(days=self.interval)
+            while day <= last:
+                yield day
+                day += step
+        elif self.freq == "WEEKLY":
+            weeks = (first - self._week0).days // 7
+            week = self._week0 + timedelta(weeks=weeks + (-weeks) % self.interval)
+            step = timedelta(weeks=self.interval)
+            offsets = sorted(self.weekdays)
+            while week <= last:
+                for wd in offsets:
+                    day = week + timedelta(days=wd)
+                    if first <= day <= last:
+                        yield day
+                week += step
+        else:
+            index = first.year * 12 + first.month - 1
+            index += (self._month0 - index) % self.interval
+            while True:
+                year, month = divmod(index, 12)
+                month += 1
+                if date(year, month, 1) > last:
+                    return
+                for d in sorted(self._month_targets(year, month)):
+                    day = date(year, month, d)
+                    if first <= day <= last:
+                        yield day
+                index += self.interval
+
+    def between(self, start, end):
+        """Occurrence dates with start <= day < end"""
+        return self._iter(start, min(end - timedelta(days=1), self.until))
+
+
+@lru_cache(maxsize=4096)
+def compile_rule(rule, start):
+    """Cached Recurrence for a rule string and start date"""
+    return Recurrence(rule, start)
+
+
+def parse_start(date_prescribed):
+    """Prescribed date in any accepted format (see date_codec), or None"""
+    return parse_date(date_prescribed)
+
+
+def med_rule_text(med):
+    return med.get("recurrence") or rule_for_dosage(med.get("dosage_instructions"))
+
+
+def med_recurrence(med):
+    """Compiled rule for a medication, or None when it has no usable start date (treated as daily)"""
+    start = parse_start(med.get("date_prescribed"))
+    if start is None:
+        return None
+    try:
+        return compile_rule(med_rule_text(med), start)
+    except ValueError as e:
+        log.warning("Invalid recurrence for %s: %s", med.get("medication_name", "Unknown"), e)
+        return compile_rule(rule_for_dosage(med.get("dosage_instructions")), start)
@@ -0,0 +1,185 @@
+"""
+Consumption-based refill forecasting.
+
+calculate_days_supply() assumes every scheduled dose is taken. The forecaster
+instead estimates each medication's real usage from the stock ledger (doses
+taken and pills wasted per day). It keeps an exponentially weighted mean and
+variance of daily consumption, seeded with the nominal schedule rate so that
+a medication with little history behaves like the schedule says. From that
+it projects a run-out date with a confidence interval:
+
+    days_left   stock / rate
+    days_low    stock / upper rate bound   (earliest likely run-out)
+    days_high   stock / lower rate bound   (latest likely run-out)
+
+Finished days are aggregated from the ledger once and cached
+(ConsumptionCache); a refresh only re-aggregates today's rows over the
+(kind, created_at) index and makes one pass over each day series, so it
+comfortably refreshes on every change. The refill list is ranked by the
+earliest likely run-out.
+"""
+import math
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+
+import perf_metrics
+from date_codec import parse_date
+from med_logic import active_times
+from recurrence import med_rule_text, rule_rate
+
+WINDOW_DAYS = 90
+HALF_LIFE_DAYS = 14
+LEAD_DAYS = 5          # warn when the earliest likely run-out is closer than this
+Z = 1.645              # ~90% two-sided interval
+
+
+class Forecast(NamedTuple):
+    user_id: int
+    user_name: str
+    med_id: str
+    medication_name: str
+    stock: int
+    rate: float                 # pills per day
+    days_left: float
+    days_low: float
+    days_high: float
+    run_out: Optional[date]     # None if not consumed at all
+    ends_first: bool            # the prescription stops before the stock runs out
+    history_days: int
+
+
+def nominal_rate(med, today):
+    """Pills per day the schedule alone implies"""
+    return len(active_times(med, today)) * float(rule_rate(med_rule_text(med)))
+
+
+def load_consumption(conn, since, until=None):
+    """
+    {med_id: {date_str: pills}} consumed from `since` (ISO date) up to `until` (exclusive).
+
+    One grouped aggregate over the (kind, created_at) index.
+    """
+    usage = {}
+    if until is None:
+        rows = conn.execute("SELECT med_id, substr(created_at, 1, 10) AS day, -SUM(quantity) FROM stock_transactions "
+                            "WHERE kind IN ('dose', 'wasted') AND created_at >= ? GROUP BY med_id, day", (since,))
+    else:
+        rows = conn.execute("SELECT med_id, substr(created_at, 1, 10) AS day, -SUM(quantity) FROM stock_transactions "
+                            "WHERE kind IN ('dose', 'wasted') AND created_at >= ? AND created_at < ? "
+                            "GROUP BY med_id, day", (since, until))
+    for med_id, day, pills in rows:
+        usage.setdefault(med_id, {})[day] = pills
+    return usage
+
+
+def load_first_seen(conn):
+    """{med_id: date_str of its first ledger row}"""
+    return dict(conn.execute(
+        "SELECT med_id, substr(created_at, 1, 10) FROM stock_transactions WHERE txn_id IN "
+        "(SELECT MIN(txn_id) FROM stock_transactions GROUP BY med_id)").fetchall())
+
+
+class ConsumptionCache:
+    """
+    Daily consumption with finished days cached.
+
+    The ledger is append-only and stamped with the current time, so days
+    before today never change: after the first load only today's rows are
+    aggregated again.
+    """
+    def __init__(self, window=WINDOW_DAYS):
+        self.window = window
+        self._closed = {}            # {med_id: {day: pills}} for days before _closed_until
+        self._closed_until = None
+        self._first_seen = None
+
+    def load(self, conn, today):
+        """(usage, first_seen) covering the forecast window up to and including today"""
+        since = (today - timedelta(days=self.window)).isoformat()
+        today_str = today.isoformat()
+        if self._first_seen is None:
+            self._first_seen = load_first_seen(conn)
+        if self._closed_until != today_str:
+            start = max(since, self._closed_until or since)
+            for med_id, days in load_consumption(conn, start, today_str).items():
+                self._closed.setdefault(med_id, {}).update(days)
+            for days in self._closed.values():
+                for day in [d for d in days if d < since]:
+                    del days[day]
+            self._closed_until = today_str
+            perf_metrics.count("forecast.cache_roll")
+
+        usage = {med_id: dict(days) for med_id, days in self._closed.items()}
+        for med_id, days in load_consumption(conn, today_str).items():
+            usage.setdefault(med_id, {}).update(days)
+        return usage, self._first_seen
+
+
+def _ew_stats(series, prior, alpha):
+    """Exponentially weighted mean/variance of a daily series, seeded with the prior rate"""
+    # the schedule is a good prior: assume it is within ~25% until history says otherwise
+    mean, var = prior, (0.25 * max(prior, 0.1)) ** 2
+    for x in series:
+        diff = x - mean
+        incr = alpha * diff
+        mean += incr
+        var = (1 - alpha) * (var + diff * incr)
+    return mean, var
+
+
+def _stop_date(med):
+    return parse_date(med.get("stop_after_date"))
+
+
+@perf_metrics.timed("forecast.household")
+def forecast_household(users, usage, first_seen, today, window=WINDOW_DAYS, half_life=HALF_LIFE_DAYS, z=Z):
+    """Ranked Forecasts (earliest likely run-out first) for every medication of every user"""
+    alpha = 1 - 0.5 ** (1 / half_life)
+    max_eff = (2 - alpha) / alpha
+    window_start = today - timedelta(days=window)
+    days = [(window_start + timedelta(days=n)).isoformat() for n in range(window)]   # up to yesterday
+
+    forecasts = []
+    for user in users:
+        user_name = f"{user[1]} {user[2]}"
+        for med in user[3]:
+            med_id = med.get("med_id")
+            stock = int(med.get("stock", 0) or 0)
+            prior = nominal_rate(med, today)
+
+            # only days since the medication entered the ledger count as observations
+            first = first_seen.get(med_id, today.isoformat())
+            med_usage = usage.get(med_id, {})
+            series = [med_usage.get(day, 0) for day in days if day >= first]
+            rate, var = _ew_stats(series, prior, alpha)
+
+            se = math.sqrt(max(var, 0.0) / (min(len(series), max_eff) + 1))
+            rate_hi = rate + z * se
+            rate_lo = max(rate - z * se, 0.0)
+            if stock <= 0:
+                days_left = days_low = days_high = 0.0
+            else:
+                days_left = stock / rate if rate > 1e-9 else math.inf
+                days_low = stock / rate_hi if rate_hi > 1e-9 else math.inf
+                days_high = stock / rate_lo if rate_lo > 1e-9 else math.inf
+            run_out = today + timedelta(days=int(days_left)) if days_left != math.inf else None
+            stop = _stop_date(med)
+
+            forecasts.append(Forecast(user[0], user_name, med_id, med.get("medication_name", "Unknown"), stock,
+                                      rate, days_left, days_low, days_high, run_out,
+                                      bool(stop and run_out and stop < run_out), len(series)))
+
+    forecasts.sort(key=lambda f: (f.days_low, f.days_left))
+    return forecasts
+
+
+def running_low(forecasts, lead_days=LEAD_DAYS):
+    """The forecasts likely to run out within lead_days (and not ending first)"""
+    return [f for f in forecasts if f.days_low < lead_days and not f.ends_first]
+
+
+def low_stock_messages(forecasts, lead_days=LEAD_DAYS):
+    """Alert text for every running_low() forecast"""
+    return [f"{f.user_name} is running low on {f.medication_name} "
+            f"({f.days_left:.0f} days left, possibly {f.days_low:.0f})"
+            for f in running_low(forecasts, lead_days)]
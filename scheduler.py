@@ -0,0 +1,103 @@
+"""
+Background dose-alert scheduler.
+
+The scheduler thread owns all of its state: it reads immutable snapshots from
+MedicationStore, keeps its own "already alerted today" set, and talks to the
+UI only through two queues:
+
+  * outbox  - commands for the Tk thread, e.g. ("show_alert", user_id, time_str, med_list, detected_at, dose_day);
+  * acknowledge() - alert keys the UI has handled (taken, skipped or dismissed).
+
+Nothing is shared and mutated across threads, so there are no locks on the
+hot path.
+
+Time comes from an injectable clock (see clock.py), so tests and
+benchmarks/replay.py can run it on simulated time.
+"""
+import logging
+import queue
+import threading
+import time
+
+import perf_metrics
+from clock import SYSTEM
+from med_logic import build_time_index, find_due_doses
+
+log = logging.getLogger("medtime.scheduler")
+
+
+class AlertScheduler:
+    def __init__(self, store, interval=30, clock=None):
+        self.store = store
+        self.interval = interval
+        self.clock = clock or SYSTEM
+        self.outbox = queue.SimpleQueue()
+        self._acks = queue.SimpleQueue()
+        self._alerted = set()          # only touched by the scheduler thread
+        self._last_reset_date = None
+        self._index = (None, {})        # (snapshot version, minute-of-day dose index)
+        self._thread = None
+
+    def acknowledge(self, alert_keys):
+        """Called from the UI: these doses were handled and must not alert again today"""
+        self._acks.put(tuple(alert_keys))
+
+    def _drain_acks(self):
+        while True:
+            try:
+                self._alerted.update(self._acks.get_nowait())
+            except queue.Empty:
+                return
+
+    def tick(self, now=None):
+        """Run one scheduling pass for `now` (default: the clock's); returns the number of alerts sent to the UI"""
+        now = now or self.clock.now()
+        start = time.perf_counter()
+        current_date = now.date()
+
+        # Reset alerted keys at midnight
+        if self._last_reset_date != current_date:
+            self._alerted.clear()
+            self._last_reset_date = current_date
+            log.info("Reset daily alerts for %s", current_date)
+            try:
+                self.store.daily_maintenance(current_date)
+            except Exception as e:
+                log.exception("Daily maintenance failed: %s", e)
+        self._drain_acks()
+
+        snapshot = self.store.snapshot()
+        if self._index[0] != snapshot.version:
+            self._index = (snapshot.version, build_time_index(snapshot.users))
+        user_time_meds = find_due_doses(snapshot.users, now, self._alerted, self._index[1])
+
+        sent = 0
+        # ✅ NEW: Trigger combined alerts for each user/time combination
+        for (user_id, time_str), med_list in user_time_meds.items():
+            if med_list:  # Only create alert if there are medications to show
+                log.info("Combined alert triggered: user %s at %s with %d medications",
+                         user_id, time_str, len(med_list),
+                         extra={"user_id": user_id, "dose_time": time_str, "med_count": len(med_list)})
+                perf_metrics.count("scheduler.alerts_fired")
+                self.outbox.put(("show_alert", user_id, time_str, med_list, time.perf_counter(),
+                                 current_date.isoformat()))
+                sent += 1
+
+        perf_metrics.observe("scheduler.tick", (time.perf_counter() - start) * 1000)
+        return sent
+
+    def run(self):
+        log.info("Alert thread started")
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                log.exception("Unexpected error in alert thread: %s", e)
+            # Sleep for 30 seconds instead of 60 for more responsive alerts
+            self.clock.sleep(self.interval)
+
+    def start(self):
+        # Start the background thread as a daemon so it stops when main program exits
+        self._thread = threading.Thread(target=self.run, daemon=True, name="medtime-scheduler")
+        self._thread.start()
+        return self._thread
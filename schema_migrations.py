@@ -0,0 +1,179 @@
+"""
+Schema versioning and in-place migrations.
+
+The database records every applied migration in schema_version. At startup
+migrate() reads MAX(version) once; when it equals LATEST nothing else runs.
+Otherwise the pending steps run in order, each in its own transaction
+together with its schema_version row, so a step is either fully applied or
+not at all and an interrupted upgrade resumes at the failed step.
+
+Steps that rewrite data walk their table in primary-key order BATCH_ROWS
+rows at a time (memory stays flat on large tables) and report progress as
+progress(description, done, total).
+
+To change the schema, append a step to MIGRATIONS; never edit or reorder
+steps that have shipped.
+"""
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+
+import db_maintenance
+import dose_instances
+import med_archive
+import perf_metrics
+import stock_ledger
+from date_codec import normalize_medications, parse_date
+
+log = logging.getLogger("medtime.migrations")
+
+BATCH_ROWS = 500
+
+
+def _iso_or_same(value):
+    """ISO form of a stored date, or the value unchanged if it is blank or unrecognised"""
+    parsed = parse_date(value) if isinstance(value, str) else None
+    return parsed.isoformat() if parsed else value
+
+
+def _batched(conn, table, key, columns, progress, description):
+    """Yield lists of rows from `table` in `key` order, BATCH_ROWS at a time, reporting progress"""
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    done, last = 0, None
+    while True:
+        if last is None:
+            rows = conn.execute(f"SELECT {key}, {columns} FROM {table} ORDER BY {key} LIMIT ?",
+                                (BATCH_ROWS,)).fetchall()
+        else:
+            rows = conn.execute(f"SELECT {key}, {columns} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?",
+                                (last, BATCH_ROWS)).fetchall()
+        if not rows:
+            return
+        yield rows
+        done += len(rows)
+        last = rows[-1][0]
+        if progress:
+            progress(description, done, total)
+
+
+# ---------- Steps ----------
+def _base_tables(conn, progress):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            medication_data TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_journals (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            date TEXT,
+            journal_text TEXT
+        )
+    ''')
+
+
+def _derived_tables(conn, progress):
+    dose_instances.ensure_table(conn)
+    med_archive.ensure_table(conn)
+    stock_ledger.ensure_table(conn)
+
+
+def _normalize_medication_dates(conn, progress):
+    description = "Normalizing medication dates"
+    for rows in _batched(conn, "users", "user_id", "medication_data", progress, description):
+        updates = []
+        for user_id, data in rows:
+            try:
+                meds = json.loads(data) if data else []
+            except ValueError:
+                continue
+            if isinstance(meds, list) and normalize_medications(meds):
+                updates.append((json.dumps(meds), user_id))
+        conn.executemany("UPDATE users SET medication_data = ? WHERE user_id = ?", updates)
+
+    for rows in _batched(conn, "medication_archive", "archive_id", "medication_data", progress,
+                         "Normalizing archived medication dates"):
+        updates = []
+        for archive_id, data in rows:
+            med = json.loads(data)
+            if normalize_medications([med]):
+                updates.append((json.dumps(med), med.get("stop_after_date"), archive_id))
+        conn.executemany("UPDATE medication_archive SET medication_data = ?, stop_after_date = ? "
+                         "WHERE archive_id = ?", updates)
+
+
+def _normalize_journal_dates(conn, progress):
+    for rows in _batched(conn, "user_journals", "entry_id", "date", progress, "Normalizing journal dates"):
+        updates = [(iso, entry_id) for entry_id, value in rows
+                   for iso in (_iso_or_same(value),) if iso != value]
+        conn.executemany("UPDATE user_journals SET date = ? WHERE entry_id = ?", updates)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_journals_user_date ON user_journals (user_id, date)")
+
+
+def _maintenance_state(conn, progress):
+    db_maintenance.ensure_table(conn)
+
+
+def _dose_schedules(conn, progress):
+    dose_instances.ensure_schedule_table(conn)
+
+
+MIGRATIONS = [
+    (1, "Base users and journal tables", _base_tables),
+    (2, "Dose instances, medication archive and stock ledger tables", _derived_tables),
+    (3, "Store medication dates as YYYY-MM-DD", _normalize_medication_dates),
+    (4, "Store journal dates as YYYY-MM-DD and index them by user", _normalize_journal_dates),
+    (5, "Idle maintenance state table", _maintenance_state),
+    (6, "Dose schedule fingerprints", _dose_schedules),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # no schema_version table yet: a database from before versioning (or a new one)
+        return 0
+
+
+def migrate(conn, progress=None):
+    """Bring the database up to LATEST; returns the list of versions applied"""
+    version = current_version(conn)
+    if version >= LATEST:
+        return []
+
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version "
+                 "(version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)")
+    conn.commit()
+    applied = []
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        start = time.perf_counter()
+        # explicit BEGIN so DDL is part of the transaction too; IMMEDIATE keeps a second
+        # app instance from running the same step concurrently
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= step_version:
+                conn.rollback()
+                continue
+            step(conn, progress)
+            conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                         (step_version, description, datetime.now().isoformat(timespec="seconds")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            log.exception("Schema migration %d (%s) failed; rolled back", step_version, description)
+            raise
+        elapsed = (time.perf_counter() - start) * 1000
+        perf_metrics.observe("db.migration", elapsed)
+        log.info("Applied schema migration %d (%s) in %.0f ms", step_version, description, elapsed)
+        applied.append(step_version)
+    return applied
@@ -0,0 +1,65 @@
+"""
+Immutable, versioned views of household data.
+
+MedicationStore publishes a new HouseholdSnapshot whenever the data changes
+and swaps it in with a single reference assignment. Readers on any thread
+(the Tk thread, workers, the alert scheduler) just grab the current snapshot
+and use it without locks; nothing inside it can be modified.
+
+UserRecord is a NamedTuple, so existing code that indexes user rows
+(user[0] id, user[1] first name, user[2] last name, user[3] medications)
+keeps working. Each medication is a read-only mapping with list values
+turned into tuples.
+"""
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import NamedTuple, Tuple
+
+
+class UserRecord(NamedTuple):
+    user_id: int
+    first_name: str
+    last_name: str
+    medications: Tuple[MappingProxyType, ...]
+
+
+def freeze_medication(med):
+    """Read-only copy of a medication dict (lists become tuples)"""
+    return MappingProxyType({k: tuple(v) if isinstance(v, list) else v for k, v in med.items()})
+
+def thaw_medication(med):
+    """Editable dict copy of a frozen medication (tuples become lists again)"""
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in med.items()}
+
+def make_user(user_id, first_name, last_name, meds, previous=None):
+    """
+    UserRecord for a medication list. Medications identical to one in the
+    `previous` record reuse its frozen object, so an unchanged medication
+    keeps the same identity from snapshot to snapshot (per-record caches
+    such as med_views rely on this).
+    """
+    old = {m.get("med_id"): m for m in previous.medications} if previous is not None else {}
+    frozen = []
+    for med in meds:
+        fresh = freeze_medication(med)
+        same = old.get(med.get("med_id"))
+        frozen.append(same if same is not None and same == fresh else fresh)
+    return UserRecord(user_id, first_name, last_name, tuple(frozen))
+
+
+@dataclass(frozen=True)
+class HouseholdSnapshot:
+    version: int
+    users: Tuple[UserRecord, ...] = ()
+    _by_id: MappingProxyType = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_by_id", MappingProxyType({u.user_id: u for u in self.users}))
+
+    def user(self, user_id):
+        return self._by_id.get(user_id)
+
+    def replace_user(self, record, version):
+        """New snapshot with one user's record swapped in"""
+        users = tuple(record if u.user_id == record.user_id else u for u in self.users)
+        return HouseholdSnapshot(version, users)
@@ -0,0 +1,108 @@
+"""
+Append-only stock ledger.
+
+Every change to a medication's stock is recorded in stock_transactions with
+a kind, a signed quantity and the balance after it:
+
+    dose     a dose was taken (-1 per dose)
+    refill   new supply arrived
+    adjust   a manual count or an edit made outside the ledger
+    wasted   pills dropped, spoiled or discarded
+    opening  first balance seen for a medication
+
+The medication's "stock" field stays the materialized current balance. It is
+written in the same transaction as the ledger rows (MedicationStore does
+this on every save), so balance reads remain O(1) from the in-memory
+snapshot. History questions ("how many pills did we use in March") are
+single aggregates over the (med_id, kind, created_at, quantity) index.
+"""
+from datetime import datetime
+
+KINDS = ("dose", "refill", "adjust", "wasted", "opening")
+CONSUMPTION_KINDS = ("dose", "wasted")
+
+
+def ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_transactions (
+            txn_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            med_id TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('dose', 'refill', 'adjust', 'wasted', 'opening')),
+            quantity INTEGER NOT NULL,
+            balance_after INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            note TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_txn_med_kind "
+                 "ON stock_transactions (med_id, kind, created_at, quantity)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_txn_user_med ON stock_transactions (user_id, med_id, txn_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_txn_kind_time "
+                 "ON stock_transactions (kind, created_at, med_id, quantity)")
+
+
+def last_balances(conn, user_id):
+    """{med_id: balance_after of its newest transaction} for one user"""
+    return dict(conn.execute(
+        "SELECT med_id, balance_after FROM stock_transactions WHERE txn_id IN "
+        "(SELECT MAX(txn_id) FROM stock_transactions WHERE user_id = ? GROUP BY med_id)", (user_id,)).fetchall())
+
+
+def record_changes(conn, user_id, meds, kind="adjust", note=None, when=None):
+    """
+    Append a transaction for every medication whose stock differs from its
+    ledger balance. Call inside the transaction that writes `meds`.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"unknown stock transaction kind {kind!r}")
+    stamp = (when or datetime.now()).isoformat(timespec="seconds")
+    balances = last_balances(conn, user_id)
+    rows = []
+    for med in meds:
+        med_id = med.get("med_id")
+        if not med_id:
+            continue
+        stock = int(med.get("stock", 0) or 0)
+        previous = balances.get(med_id)
+        if previous is None:
+            rows.append((user_id, med_id, "opening", stock, stock, stamp, None))
+        elif previous != stock:
+            rows.append((user_id, med_id, kind, stock - previous, stock, stamp, note))
+    conn.executemany("INSERT INTO stock_transactions (user_id, med_id, kind, quantity, balance_after, created_at, note) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def record_unstocked_doses(conn, user_id, med_id, doses, when=None):
+    """
+    Record `doses` taken while the stock was already 0. The consumption goes
+    in as a dose transaction and an adjust brings the balance back to 0, so
+    usage statistics count it but the stock shown never drops below zero.
+    """
+    stamp = (when or datetime.now()).isoformat(timespec="seconds")
+    conn.executemany("INSERT INTO stock_transactions (user_id, med_id, kind, quantity, balance_after, created_at, note) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(user_id, med_id, "dose", -doses, -doses, stamp, None),
+                      (user_id, med_id, "adjust", doses, 0, stamp, "taken with no stock on record")])
+
+
+def consumed(conn, med_id, start, end, kinds=CONSUMPTION_KINDS):
+    """Pills used between start and end (ISO date/datetime strings, end exclusive)"""
+    marks = ",".join("?" * len(kinds))
+    row = conn.execute(f"SELECT COALESCE(-SUM(quantity), 0) FROM stock_transactions "
+                       f"WHERE med_id = ? AND kind IN ({marks}) AND created_at >= ? AND created_at < ?",
+                       (med_id, *kinds, start, end)).fetchone()
+    return row[0]
+
+
+def consumption_rate(conn, med_id, start, end, kinds=CONSUMPTION_KINDS):
+    """Average pills per day used between two dates (datetime.date)"""
+    days = max((end - start).days, 1)
+    return consumed(conn, med_id, start.isoformat(), end.isoformat(), kinds) / days
+
+
+def history(conn, med_id, limit=50):
+    """Newest-first (created_at, kind, quantity, balance_after, note) rows for one medication"""
+    return conn.execute("SELECT created_at, kind, quantity, balance_after, note FROM stock_transactions "
+                        "WHERE med_id = ? ORDER BY txn_id DESC LIMIT ?", (med_id, limit)).fetchall()
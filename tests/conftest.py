@@ -0,0 +1,51 @@
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.household import create_legacy_tables  # noqa: E402
+from clock import SimulatedClock  # noqa: E402
+from med_store import MedicationStore  # noqa: E402
+
+
+def write_household(db_path, users):
+    """Pre-versioning database with users given as {user_id: (first, last, [medication dicts])}"""
+    conn = sqlite3.connect(db_path)
+    create_legacy_tables(conn)
+    with conn:
+        conn.executemany("INSERT INTO users (user_id, first_name, last_name, medication_data) VALUES (?, ?, ?, ?)",
+                         [(uid, first, last, json.dumps(meds)) for uid, (first, last, meds) in users.items()])
+    conn.close()
+
+
+def med(name, stock, **fields):
+    """A twice-daily medication dict with `fields` overriding the defaults"""
+    return dict({"medication_name": name, "date_prescribed": "2025-01-01", "scheduled_times": ["08:00", "20:00"],
+                 "dosage_instructions": "twice daily", "stock": stock}, **fields)
+
+
+@pytest.fixture
+def clock():
+    return SimulatedClock(datetime(2025, 3, 10, 9, 0))
+
+
+@pytest.fixture
+def make_store(tmp_path, clock):
+    """make_store(users) -> MedicationStore on a fresh database holding `users`"""
+    stores = []
+
+    def make(users):
+        db_path = str(tmp_path / "medtime.db")
+        write_household(db_path, users)
+        store = MedicationStore(db_path, clock=clock)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
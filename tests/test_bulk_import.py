@@ -0,0 +1,19 @@
+import bulk_import
+from conftest import med, write_household
+
+
+def test_a_positional_csv_is_dispatched_by_its_columns(tmp_path, capsys):
+    db_path = str(tmp_path / "medtime.db")
+    write_household(db_path, {1: ("Ann", "Yates", [med("A", 3)])})
+    meds_csv = tmp_path / "meds.csv"
+    meds_csv.write_text("user_id,medication_name,date_prescribed,scheduled_times,stock\n"
+                        "1,B,2025-01-01,08:00;20:00,30\n")
+    journals_csv = tmp_path / "journals.csv"
+    journals_csv.write_text("user_id,date,journal_text\n1,2025-03-09,slept well\n")
+
+    assert bulk_import.main([str(meds_csv), "--db", db_path]) == 0
+    assert bulk_import.main([str(journals_csv), "--db", db_path, "--dry-run"]) == 0
+
+    first, second = capsys.readouterr().out.splitlines()
+    assert "0 new users" in first and "1 new medications" in first
+    assert "[DRY RUN]" in second and "1 journal entries" in second
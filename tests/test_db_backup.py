@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import db_backup
+from conftest import med, write_household
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 3, 10, 9, 0, 0)
+
+
+def test_backups_in_the_same_tick_are_separate_generations(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "medtime.db")
+    write_household(db_path, {1: ("Ann", "Yates", [med("A", 3)])})
+    monkeypatch.setattr(db_backup, "datetime", FrozenDatetime)
+
+    first = db_backup.backup_database(db_path, generations=3)
+    second = db_backup.backup_database(db_path, generations=3)
+    third = db_backup.backup_database(db_path, label="pre-restore", generations=3)
+
+    assert len({first.path, second.path, third.path}) == 3
+    assert db_backup.list_backups(db_path) == [third.path, second.path, first.path]
+    assert all(result.check == "ok" for result in (first, second, third))
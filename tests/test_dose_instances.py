@@ -0,0 +1,30 @@
+import json
+import sqlite3
+
+import dose_instances
+from conftest import med
+from med_store import MedicationStore
+
+
+def test_reopening_an_unchanged_database_regenerates_nothing(make_store, monkeypatch):
+    store = make_store({1: ("Ann", "Yates", [med("A", 3), med("B", 3)])})
+    regenerated = []
+    original = dose_instances.regenerate_medication
+
+    def spy(conn, user_id, m, *args):
+        regenerated.append(m["medication_name"])
+        return original(conn, user_id, m, *args)
+
+    monkeypatch.setattr(dose_instances, "regenerate_medication", spy)
+
+    MedicationStore(store.db_path, clock=store.clock).close()
+    assert regenerated == []
+
+    meds = store.medications(1)
+    meds[1]["scheduled_times"] = ["09:00"]
+    conn = sqlite3.connect(store.db_path)
+    with conn:
+        conn.execute("UPDATE users SET medication_data = ? WHERE user_id = 1", (json.dumps(meds),))
+    conn.close()
+    MedicationStore(store.db_path, clock=store.clock).close()
+    assert regenerated == ["B"]
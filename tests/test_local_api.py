@@ -0,0 +1,126 @@
+import hashlib
+import http.client
+import json
+
+import pytest
+
+from local_api import DashboardServer, is_loopback
+
+TOKEN = "s3cret"
+ORIGIN = "http://kitchen-tablet.local"
+
+
+@pytest.fixture
+def server(make_store):
+    store = make_store({1: ("Ann", "Yates", [{"medication_name": "A", "date_prescribed": "2025-01-01",
+                                             "scheduled_times": ["08:00"], "stock": 3}])})
+
+    def start(**kwargs):
+        api = DashboardServer(store, 0, **kwargs)
+        api.start()
+        api.address = api._server.sockets[0].getsockname()[:2]
+        started.append(api)
+        return api
+
+    started = []
+    yield start
+    for api in started:
+        api.stop()
+        api._thread.join(5)
+
+
+def request(api, path, method="GET", **headers):
+    conn = http.client.HTTPConnection(*api.address, timeout=5)
+    try:
+        conn.request(method, path, headers=headers)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_refuses_to_listen_off_loopback_without_a_token(make_store):
+    store = make_store({})
+    with pytest.raises(ValueError):
+        DashboardServer(store, 0, host="0.0.0.0")
+    DashboardServer(store, 0, host="0.0.0.0", token=TOKEN)
+
+
+@pytest.mark.parametrize("host, expected", [("127.0.0.1", True), ("::1", True), ("localhost", True),
+                                            ("0.0.0.0", False), ("192.168.1.20", False)])
+def test_is_loopback(host, expected):
+    assert is_loopback(host) is expected
+
+
+def test_token_is_required_when_set(server):
+    api = server(token=TOKEN)
+    status, headers, _ = request(api, "/api/users")
+    assert status == 401
+    assert headers["WWW-Authenticate"] == "Bearer"
+    assert request(api, "/api/users", Authorization="Bearer wrong")[0] == 401
+    assert request(api, "/api/users", Authorization=f"Bearer {TOKEN}")[0] == 200
+    assert request(api, f"/api/users?token={TOKEN}")[0] == 200
+
+
+def test_etag_revalidation(server):
+    api = server()
+    status, _, body = request(api, "/api/users")
+    assert status == 200
+    assert json.loads(body)[0]["first_name"] == "Ann"
+    status, headers, _ = request(api, "/api/stock")
+    etag = headers["ETag"]
+
+    status, headers, body = request(api, "/api/stock", **{"If-None-Match": etag})
+    assert (status, body, headers["ETag"]) == (304, b"", etag)
+
+    meds = api.store.medications(1)
+    meds[0]["stock"] = 10
+    api.store.save_medications(1, meds)
+    status, headers, _ = request(api, "/api/stock", **{"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    # a change that leaves the body as it was keeps the tag valid
+    assert request(api, "/api/users", **{"If-None-Match": request(api, "/api/users")[1]["ETag"]})[0] == 304
+
+
+def test_etag_is_derived_from_the_body(server):
+    _, headers, body = request(server(), "/api/stock")
+    assert headers["ETag"] == f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def test_journals_share_one_cache_entry_with_or_without_days(server):
+    api = server()
+    api.store.add_journal_entry(1, "2025-03-09", "slept well")
+    api.store.add_journal_entry(1, "2025-01-01", "too old")
+    responses = [request(api, path) for path in ("/api/users/1/journals?days=30", "/api/users/1/journals",
+                                                 "/api/users/1/journals?days=030", "/api/users/01/journals/")]
+
+    assert {status for status, _, _ in responses} == {200}
+    assert {headers["ETag"] for _, headers, _ in responses} == {responses[0][1]["ETag"]}
+    assert json.loads(responses[1][2]) == [{"date": "2025-03-09", "text": "slept well"}]
+    assert len(json.loads(request(api, "/api/users/1/journals?days=90")[2])) == 2
+
+    api.store.add_journal_entry(1, "2025-03-10", "dizzy")
+    assert len(json.loads(request(api, "/api/users/1/journals")[2])) == 2
+
+
+@pytest.mark.parametrize("days", ["0", "-5", "3651", "99999999999", "thirty"])
+def test_journal_days_out_of_range_is_a_bad_request(server, days):
+    status, _, body = request(server(), f"/api/users/1/journals?days={days}")
+    assert status == 400 and "error" in json.loads(body)
+
+
+def test_cors_only_for_allowed_origins(server):
+    api = server(allowed_origins=[ORIGIN])
+    _, headers, _ = request(api, "/api/users", Origin=ORIGIN)
+    assert headers["Access-Control-Allow-Origin"] == ORIGIN
+    _, headers, _ = request(api, "/api/users", Origin="http://evil.example")
+    assert "Access-Control-Allow-Origin" not in headers
+
+    status, headers, _ = request(api, "/api/users", method="OPTIONS", Origin=ORIGIN)
+    assert status == 204 and headers["Access-Control-Allow-Origin"] == ORIGIN
+    status, headers, _ = request(api, "/api/users", method="OPTIONS", Origin="http://evil.example")
+    assert status == 204 and "Access-Control-Allow-Origin" not in headers
+
+
+def test_unknown_path(server):
+    assert request(server(), "/api/nope")[0] == 404
@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+from conftest import med
+
+
+def archive_one(store, clock):
+    meds = store.medications(1)
+    meds[0]["stop_after_date"] = "2025-03-01"
+    store.save_medications(1, meds)
+    assert store.archive_expired(clock.today()) == 1
+    (archive_id, archived, _), = store.archived_medications(1)
+    return archive_id, archived
+
+
+def test_restore_medication(make_store, clock):
+    store = make_store({1: ("Ann", "Yates", [med("A", 3), med("B", 4)])})
+    archive_id, archived = archive_one(store, clock)
+
+    restored = store.restore_medication(archive_id)
+
+    assert restored["med_id"] == archived["med_id"]
+    assert restored["stop_after_date"] is None
+    assert sorted(m["medication_name"] for m in store.medications(1)) == ["A", "B"]
+    assert store.archived_medications(1) == []
+    assert store.archive_expired(clock.today()) == 0
+
+
+def test_restore_to_a_deleted_user_keeps_the_archive_row(make_store, clock):
+    store = make_store({1: ("Ann", "Yates", [med("A", 3)]), 2: ("Bob", "Yates", [])})
+    archive_id, _ = archive_one(store, clock)
+    conn = sqlite3.connect(store.db_path)
+    with conn:
+        conn.execute("DELETE FROM users WHERE user_id = 1")
+    conn.close()
+
+    with pytest.raises(ValueError, match="no longer exists"):
+        store.restore_medication(archive_id)
+
+    assert [row[0] for row in store.archived_medications(1)] == [archive_id]
+
+
+def test_restore_unknown_archive_id(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("A", 3)])})
+    with pytest.raises(ValueError, match="not found"):
+        store.restore_medication(999)
@@ -0,0 +1,22 @@
+import json
+from datetime import datetime
+
+from conftest import med
+from facility import _key_user
+from med_logic import find_due_doses
+
+
+def due(users, now, alerted=()):
+    return [(user_id, m["medication_name"], key) for (user_id, _), meds in find_due_doses(users, now, set(alerted)).items()
+            for m, _, key, _, _ in meds]
+
+
+def test_alert_keys_follow_the_medication_not_its_position():
+    a, b = med("A", 5, med_id="aaaa", scheduled_times=["08:00"]), med("B", 5, med_id="bbbb", scheduled_times=["08:00"])
+    now = datetime(2025, 3, 10, 8, 0)
+    (_, _, key_a), (_, _, key_b) = due([(7, "Ann", "Yates", json.dumps([a, b]))], now)
+    assert _key_user(key_a) == _key_user(key_b) == 7
+
+    # A is answered, then archived: B moves to position 0 but must still alert, and only once
+    assert due([(7, "Ann", "Yates", json.dumps([b]))], now, {key_a}) == [(7, "B", key_b)]
+    assert due([(7, "Ann", "Yates", json.dumps([b]))], now, {key_a, key_b}) == []
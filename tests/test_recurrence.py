@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+import pytest
+
+from recurrence import Recurrence, parse_rule, rule_for_dosage
+
+
+def days(rule, start, first, end):
+    return list(Recurrence(rule, start).between(first, end))
+
+
+def test_month_day_31_falls_on_the_last_day_of_short_months():
+    got = days("FREQ=MONTHLY;BYMONTHDAY=31", date(2025, 1, 31), date(2025, 1, 1), date(2025, 7, 1))
+    assert got == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31),
+                   date(2025, 4, 30), date(2025, 5, 31), date(2025, 6, 30)]
+
+
+def test_month_day_31_in_a_leap_february():
+    rule = Recurrence("FREQ=MONTHLY;BYMONTHDAY=31", date(2024, 1, 31))
+    assert rule.occurs_on(date(2024, 2, 29))
+    assert not rule.occurs_on(date(2024, 2, 28))
+
+
+def test_last_day_of_month():
+    got = days("FREQ=MONTHLY;BYMONTHDAY=-1", date(2025, 1, 1), date(2025, 1, 1), date(2025, 4, 1))
+    assert got == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31)]
+
+
+def test_every_other_day_counts_from_the_prescribed_date():
+    rule = Recurrence("FREQ=DAILY;INTERVAL=2", date(2025, 2, 27))
+    assert list(rule.between(date(2025, 2, 26), date(2025, 3, 6))) == [
+        date(2025, 2, 27), date(2025, 3, 1), date(2025, 3, 3), date(2025, 3, 5)]
+    assert not rule.occurs_on(date(2025, 2, 28))
+
+
+def test_until_is_inclusive():
+    rule = Recurrence("FREQ=DAILY;UNTIL=2025-01-03", date(2025, 1, 1))
+    assert rule.occurs_on(date(2025, 1, 3))
+    assert not rule.occurs_on(date(2025, 1, 4))
+    assert list(rule.between(date(2025, 1, 1), date(2025, 2, 1)))[-1] == date(2025, 1, 3)
+
+
+@pytest.mark.parametrize("until", ["20250103", "2025-01-03", "01-03-2025", "01/03/2025"])
+def test_until_accepts_every_date_format(until):
+    assert parse_rule(f"FREQ=DAILY;UNTIL={until}")["until"] == date(2025, 1, 3)
+
+
+def test_count_stops_after_that_many_occurrences():
+    rule = Recurrence("FREQ=WEEKLY;BYDAY=MO,TH;COUNT=3", date(2025, 3, 3))
+    assert list(rule.between(date(2025, 3, 1), date(2025, 4, 1))) == [
+        date(2025, 3, 3), date(2025, 3, 6), date(2025, 3, 10)]
+
+
+def test_occurs_on_agrees_with_between():
+    for text in ("FREQ=DAILY;INTERVAL=3", "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SA",
+                 "FREQ=MONTHLY;INTERVAL=2;BYMONTHDAY=1,30", "FREQ=DAILY;TAPER=3:2,2:1"):
+        rule = Recurrence(text, date(2024, 12, 30))
+        start, end = date(2024, 12, 1), date(2025, 6, 1)
+        expected = [start + timedelta(n) for n in range((end - start).days) if rule.occurs_on(start + timedelta(n))]
+        assert list(rule.between(start, end)) == expected, text
+
+
+def test_parse_rule_result_is_read_only():
+    rule = parse_rule("FREQ=DAILY")
+    with pytest.raises(TypeError):
+        rule["freq"] = "WEEKLY"
+    assert parse_rule("FREQ=DAILY")["freq"] == "DAILY"
+
+
+@pytest.mark.parametrize("text", ["", "FREQ=YEARLY", "FREQ=DAILY;BYDAY=MO", "FREQ=MONTHLY;BYMONTHDAY=32",
+                                  "FREQ=DAILY;INTERVAL=0", "FREQ=DAILY;UNTIL=2025-02-30", "FREQ=DAILY;FOO=1"])
+def test_invalid_rules_raise(text):
+    with pytest.raises(ValueError):
+        parse_rule(text)
+
+
+def test_legacy_dosage_strings():
+    assert rule_for_dosage("Every other day") == "FREQ=DAILY;INTERVAL=2"
+    assert rule_for_dosage("Take 1 pill daily.") == "FREQ=DAILY"
+
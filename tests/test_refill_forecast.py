@@ -0,0 +1,16 @@
+from conftest import med
+from refill_forecast import low_stock_messages, running_low
+
+
+def test_cards_and_popup_flag_the_same_medications(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("Low", 3), med("Plenty", 100), med("Ending", 2, stop_after_date="2025-03-10")]),
+                        2: ("Bob", "Yates", [med("Low too", 1)])})
+
+    household = store.refill_forecast()
+    assert sorted(f.medication_name for f in running_low(household)) == ["Low", "Low too"]
+    assert len(low_stock_messages(household)) == 2
+
+    ann = store.refill_forecast(user_id=1)
+    assert {f.user_id for f in ann} == {1}
+    assert [f.medication_name for f in running_low(ann)] == ["Low"]
+    assert store.refill_forecast(user_id=99) == []
@@ -0,0 +1,42 @@
+from datetime import date, datetime, timedelta
+
+from benchmarks.replay import check_fixtures, replay
+from clock import SimulatedClock
+from conftest import med, write_household
+
+
+def test_simulated_clock_moves_only_when_told():
+    clock = SimulatedClock(datetime(2025, 3, 10, 23, 59))
+    assert clock.now() == datetime(2025, 3, 10, 23, 59) and clock.monotonic() == 0
+    clock.sleep(60)
+    clock.advance(timedelta(days=1))
+    assert clock.now() == datetime(2025, 3, 12, 0, 0)
+    assert clock.today() == date(2025, 3, 12)
+    assert clock.monotonic() == 86460
+
+
+def test_short_replay_fires_every_expected_alert(tmp_path):
+    db_path = str(tmp_path / "medtime.db")
+    write_household(db_path, {1: ("Ann", "Yates", [med("A", 30), med("B", 30, scheduled_times=["00:00", "13:15"])]),
+                              2: ("Bob", "Yates", [med("C", 30, recurrence="FREQ=DAILY;INTERVAL=2")])})
+
+    fired, expected, stats = replay(db_path, date(2025, 3, 10), 3, take=True)
+
+    assert fired == expected
+    assert sum(expected.values()) == 2 * 3 + 2 * 3 + 2 * 2
+    assert stats["forecasts"] == 3
+
+
+def test_scheduler_replay_matches_hand_written_fixtures():
+    assert check_fixtures() == []
+
+
+def test_calendar_projects_past_the_horizon_of_the_store_clock(make_store):
+    from dose_calendar import load_doses
+    store = make_store({1: ("Ann", "Yates", [med("A", 30)])})
+
+    # well past the 2025-03-10 clock's dose horizon, long before the wall clock's
+    doses = load_doses(store, date(2025, 5, 1), date(2025, 5, 3))
+
+    assert doses == {day: [("08:00", "Ann", "A", "scheduled"), ("20:00", "Ann", "A", "scheduled")]
+                     for day in ("2025-05-01", "2025-05-02")}
@@ -0,0 +1,61 @@
+import json
+import sqlite3
+
+import schema_migrations
+from conftest import write_household
+
+
+def dump(conn):
+    """Every table's rows, to compare whole databases"""
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND name NOT IN ('schema_version', 'sqlite_sequence') ORDER BY name")]
+    return {t: conn.execute(f"SELECT * FROM {t} ORDER BY 1, 2").fetchall() for t in tables}
+
+
+def test_new_database_gets_every_step():
+    conn = sqlite3.connect(":memory:")
+    assert schema_migrations.migrate(conn) == [v for v, _, _ in schema_migrations.MIGRATIONS]
+    assert schema_migrations.current_version(conn) == schema_migrations.LATEST
+
+
+def test_migrate_is_idempotent(tmp_path):
+    db_path = str(tmp_path / "old.db")
+    write_household(db_path, {1: ("Ann", "Yates", [{"medication_name": "A", "date_prescribed": "01-02-2024",
+                                                    "stop_after_date": "12/31/2026", "scheduled_times": ["08:00"]}])})
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO user_journals (user_id, date, journal_text) VALUES (1, '03-04-2025', 'fine')")
+    conn.commit()
+
+    assert schema_migrations.migrate(conn)
+    after_first = dump(conn)
+    versions = conn.execute("SELECT version FROM schema_version ORDER BY version").fetchall()
+
+    assert schema_migrations.migrate(conn) == []
+    assert dump(conn) == after_first
+    assert conn.execute("SELECT version FROM schema_version ORDER BY version").fetchall() == versions
+
+
+def test_legacy_dates_are_normalized(tmp_path):
+    db_path = str(tmp_path / "old.db")
+    write_household(db_path, {1: ("Ann", "Yates", [{"medication_name": "A", "date_prescribed": "01-02-2024",
+                                                    "stop_after_date": "", "scheduled_times": ["08:00"]}])})
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO user_journals (user_id, date, journal_text) VALUES (1, '03/04/2025', 'fine')")
+    conn.commit()
+    schema_migrations.migrate(conn)
+
+    med = json.loads(conn.execute("SELECT medication_data FROM users").fetchone()[0])[0]
+    assert med["date_prescribed"] == "2024-01-02"
+    assert med["stop_after_date"] == ""
+    assert conn.execute("SELECT date FROM user_journals").fetchone()[0] == "2025-03-04"
+
+
+def test_interrupted_upgrade_resumes_at_the_next_step(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "new.db"))
+    first = schema_migrations.MIGRATIONS[0][0]
+    conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, "
+                 "applied_at TEXT NOT NULL)")
+    schema_migrations.MIGRATIONS[0][2](conn, None)
+    conn.execute("INSERT INTO schema_version VALUES (?, 'base', '2025-01-01T00:00:00')", (first,))
+    conn.commit()
+    assert schema_migrations.migrate(conn) == [v for v, _, _ in schema_migrations.MIGRATIONS[1:]]
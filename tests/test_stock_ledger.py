@@ -0,0 +1,60 @@
+from conftest import med
+from med_store import MedicationStore
+
+
+def ledger(store, med_id):
+    """(kind, quantity, balance_after) oldest first"""
+    return [(kind, qty, balance) for _, kind, qty, balance, _ in reversed(store.stock_history(med_id))]
+
+
+def test_taken_doses_come_off_stock_and_go_in_the_ledger(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("A", 3)])})
+    med_id = store.medications(1)[0]["med_id"]
+
+    taken = store.apply_doses({1: [(med_id, "2025-03-10 08:00", "taken"), (med_id, "2025-03-10 20:00", "skipped")]})
+
+    assert taken == 1
+    assert store.medications(1)[0]["stock"] == 2
+    assert ledger(store, med_id) == [("opening", 3, 3), ("dose", -1, 2)]
+    assert store.stock_consumed(med_id, "2025-03-10", "2025-03-11") == 1
+    statuses = {due_at: status for _, _, due_at, status in store.doses_between("2025-03-10", "2025-03-11")}
+    assert statuses == {"2025-03-10 08:00": "taken", "2025-03-10 20:00": "skipped"}
+
+
+def test_doses_for_several_users_in_one_call(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("A", 5)]), 2: ("Bob", "Yates", [med("B", 5)])})
+    a, b = store.medications(1)[0]["med_id"], store.medications(2)[0]["med_id"]
+
+    store.apply_doses({1: [(a, "2025-03-10 08:00", "taken")], 2: [(b, "2025-03-10 08:00", "taken")]})
+
+    assert [store.medications(uid)[0]["stock"] for uid in (1, 2)] == [4, 4]
+
+
+def test_dose_taken_at_zero_stock_is_still_consumed(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("A", 1)])})
+    med_id = store.medications(1)[0]["med_id"]
+
+    assert store.apply_doses({1: [(med_id, "2025-03-10 08:00", "taken"), (med_id, "2025-03-10 20:00", "taken")]}) == 2
+
+    assert store.medications(1)[0]["stock"] == 0
+    assert store.stock_consumed(med_id, "2025-03-10", "2025-03-11") == 2
+    rows = ledger(store, med_id)
+    assert rows[-1] == ("adjust", 1, 0)
+    # every row's balance follows from the one before it
+    for (_, _, before), (_, qty, after) in zip(rows, rows[1:]):
+        assert before + qty == after
+
+
+def test_stock_saved_by_another_connection_is_picked_up(make_store):
+    store = make_store({1: ("Ann", "Yates", [med("A", 10)])})
+    med_id = store.medications(1)[0]["med_id"]
+    meds = store.medications(1)
+    meds[0]["stock"] = 25
+    other = MedicationStore(store.db_path, clock=store.clock)
+    other.save_medications(1, meds, stock_kind="refill")
+    other.close()
+
+    store.refresh(force=True)
+
+    assert store.medications(1)[0]["stock"] == 25
+    assert ledger(store, med_id)[-1] == ("refill", 15, 25)
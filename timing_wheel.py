@@ -0,0 +1,123 @@
+"""
+Hierarchical timing wheel.
+
+Snooze and escalation timers come and go far more often than they fire:
+almost every escalation is cancelled when the dose is answered. A heap or
+a list scanned every tick makes that cost grow with the number pending.
+TimingWheel keeps timers in LEVELS rings of SLOTS buckets instead. Level 0
+buckets are one tick wide, level 1 buckets SLOTS ticks, and so on, so
+scheduling and cancelling are O(1) dict operations. Advancing the clock
+only touches the bucket that comes due, and every SLOTS ticks one
+higher-level bucket is redistributed ("cascaded") downwards. When the lower
+levels are empty, advance() jumps straight to the next cascade, so a long
+gap (a suspended laptop, a simulated year) costs a handful of steps.
+
+With one-second ticks, five levels of 64 slots reach about 34 years ahead.
+The wheel has no clock and no thread of its own: callers pass the current
+time to schedule() and advance(), which also makes it easy to drive from a
+simulated clock. It is not thread-safe.
+"""
+SLOTS = 64
+SLOT_BITS = 6
+LEVELS = 5
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "args", "_bucket")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline      # in ticks
+        self.callback = callback
+        self.args = args
+        self._bucket = None           # the dict this timer sits in while pending
+
+    @property
+    def pending(self):
+        return self._bucket is not None
+
+
+class TimingWheel:
+    def __init__(self, now, resolution=1.0):
+        self.resolution = resolution
+        self._tick = self._to_tick(now)
+        self._wheels = [[{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self._counts = [0] * LEVELS
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _to_tick(self, when):
+        return int(when // self.resolution)
+
+    def _place(self, timer, earliest):
+        deadline = max(timer.deadline, earliest)
+        for level in range(LEVELS):
+            shift = level * SLOT_BITS
+            if (deadline >> shift) - (self._tick >> shift) < SLOTS:
+                bucket = self._wheels[level][(deadline >> shift) & (SLOTS - 1)]
+                bucket[timer] = level
+                timer._bucket = bucket
+                self._counts[level] += 1
+                return
+        raise ValueError("timer is too far in the future for this wheel")
+
+    def schedule(self, when, callback, *args):
+        """Call callback(*args) once advance() reaches `when`; returns a Timer for cancel()"""
+        timer = Timer(self._to_tick(when), callback, args)
+        self._place(timer, self._tick + 1)
+        self._len += 1
+        return timer
+
+    def cancel(self, timer):
+        """Forget a pending timer; returns False if it already fired or was cancelled"""
+        bucket = timer._bucket
+        if bucket is None:
+            return False
+        self._counts[bucket.pop(timer)] -= 1
+        timer._bucket = None
+        self._len -= 1
+        return True
+
+    def _cascade(self, level):
+        bucket = self._wheels[level][(self._tick >> (level * SLOT_BITS)) & (SLOTS - 1)]
+        if not bucket:
+            return
+        timers = list(bucket)
+        bucket.clear()
+        self._counts[level] -= len(timers)
+        for timer in timers:
+            # runs before this tick's level-0 bucket fires, so a deadline of exactly now still fires now
+            self._place(timer, self._tick)
+
+    def advance(self, now):
+        """Fire every timer due at or before `now` in deadline order; returns how many fired"""
+        target = self._to_tick(now)
+        fired = 0
+        while self._tick < target:
+            if not self._len:
+                self._tick = target
+                break
+            # nothing can happen before the next boundary of the lowest non-empty level
+            lowest = next(level for level, count in enumerate(self._counts) if count)
+            if lowest:
+                span = (1 << (lowest * SLOT_BITS)) - 1
+                self._tick = min(target - 1, self._tick | span)
+            self._tick += 1
+            tick = self._tick
+            # higher levels first, so a timer can cascade through several levels in one tick
+            for level in range(LEVELS - 1, 0, -1):
+                if tick & ((1 << (level * SLOT_BITS)) - 1) == 0:
+                    self._cascade(level)
+            bucket = self._wheels[0][tick & (SLOTS - 1)]
+            if bucket:
+                due = list(bucket)
+                bucket.clear()
+                self._counts[0] -= len(due)
+                self._len -= len(due)
+                for timer in due:
+                    timer._bucket = None
+                for timer in due:
+                    timer.callback(*timer.args)
+                    fired += 1
+        return fired
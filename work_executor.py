@@ -0,0 +1,117 @@
+"""
+Background work executor with Tk-safe result delivery.
+
+Tkinter widgets may only be touched from the main thread, so database and
+CPU work runs on a small thread pool and its results are handed back through
+a queue that the Tk event loop drains with root.after():
+
+    self.executor.submit(load_rows, user_id,
+                         on_done=self.render_rows,        # runs on the Tk thread
+                         on_error=self.show_error,        # runs on the Tk thread
+                         key="user-data")                 # supersedes older "user-data" work
+
+Submitting with a key cancels any earlier request with the same key: if it has
+not started it never runs, and if it is already running its result is
+dropped. That keeps superseded search filters and double clicks from
+repainting stale data.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import perf_metrics
+
+log = logging.getLogger("medtime.executor")
+
+
+class Ticket:
+    """Handle for one submitted job"""
+    __slots__ = ("key", "future", "cancelled", "submitted_at")
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class TkExecutor:
+    def __init__(self, root, max_workers=4, poll_ms=25):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medtime-worker")
+        self._results = queue.SimpleQueue()
+        self._latest = {}   # key -> newest Ticket
+        self._lock = threading.Lock()
+        self._closed = False
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, **kwargs):
+        """Run fn(*args, **kwargs) on a worker; callbacks run later on the Tk thread"""
+        ticket = Ticket(key)
+        if key is not None:
+            with self._lock:
+                previous = self._latest.get(key)
+                self._latest[key] = ticket
+            if previous is not None:
+                previous.cancel()
+                perf_metrics.count("executor.superseded")
+
+        def run():
+            if ticket.cancelled:
+                return
+            perf_metrics.observe("executor.queue_wait", (time.perf_counter() - ticket.submitted_at) * 1000)
+            start = time.perf_counter()
+            try:
+                result, error = fn(*args, **kwargs), None
+            except Exception as e:
+                result, error = None, e
+            perf_metrics.observe("executor.run", (time.perf_counter() - start) * 1000)
+            self._results.put((ticket, result, error, on_done, on_error))
+
+        ticket.future = self._pool.submit(run)
+        return ticket
+
+    def cancel(self, key):
+        """Cancel the newest request submitted under key"""
+        with self._lock:
+            ticket = self._latest.pop(key, None)
+        if ticket is not None:
+            ticket.cancel()
+
+    def _poll(self):
+        if self._closed:
+            return
+        while True:
+            try:
+                ticket, result, error, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if ticket.cancelled:
+                continue
+            if ticket.key is not None:
+                with self._lock:
+                    if self._latest.get(ticket.key) is ticket:
+                        del self._latest[ticket.key]
+            try:
+                if error is not None:
+                    if on_error is not None:
+                        on_error(error)
+                    else:
+                        log.error("Background task failed: %s", error, exc_info=error)
+                elif on_done is not None:
+                    on_done(result)
+            except Exception as e:
+                log.exception("Error in background task callback: %s", e)
+        self.root.after(self.poll_ms, self._poll)
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)